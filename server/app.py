@@ -3,12 +3,30 @@ import sqlite3
 import asyncio
 import threading
 import json
+import mimetypes
+import socket
+import time
+import uuid
+from urllib.parse import quote
 from functools import wraps
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from flask_sock import Sock
 from dotenv import load_dotenv
 from download_manager import DownloadManager
+from loop_monitor import LoopMonitor
+from file_server import FileBody, file_etag
+from folder_index import FolderIndex, MultiRootFolderIndex
+from static_assets import StaticAssets
+from settings_store import SettingsStore
+from cluster import ClusterWorker
+from ws_subscriptions import DownloadFilter, SubscriptionRegistry, filtered_status, status_counts
+from ws_encoding import MessageCache, available_subprotocols, decode, encode, negotiate
+from volumes import VolumeSet
+from scheduling import QUEUE_POLICIES
+from singleflight import DUPLICATE_POLICIES
+from stall_watchdog import WatchdogConfig
+import archive
 
 # Load environment variables
 load_dotenv()
@@ -27,8 +45,65 @@ DOWNLOAD_PATH = os.path.abspath(os.getenv('DOWNLOAD_PATH', '/downloads'))
 DATA_PATH = os.path.abspath(os.getenv('DATA_PATH', '/app/data'))
 DB_PATH = os.path.join(DATA_PATH, 'downloads.db')
 
+# More download roots (comma-separated) sharing DOWNLOAD_PATH's folder tree, the policy that
+# places new files on them ('most_free', 'least_writes' or 'pinned') and fixed folder=root pins
+DOWNLOAD_VOLUMES = [os.path.abspath(p.strip()) for p in os.getenv('DOWNLOAD_VOLUMES', '').split(',') if p.strip()]
+VOLUME_POLICY = os.getenv('VOLUME_POLICY', 'most_free').lower()
+VOLUME_PINS = os.getenv('VOLUME_PINS', '')
+STATIC_PATH = os.path.join(SERVER_DIR, 'static')
+
+# Folder index cache (seconds before a cached folder is revalidated against disk)
+FOLDER_INDEX_TTL = float(os.getenv('FOLDER_INDEX_TTL', 5))
+FOLDER_INDEX_TRACK_SIZES = os.getenv('FOLDER_INDEX_TRACK_SIZES', 'true').lower() == 'true'
+
+# How downloads move bytes: 'stream' (Python chunk loop) or 'direct' (libcurl writes the file)
+TRANSFER_MODE = os.getenv('TRANSFER_MODE', 'stream').lower()
+
+# Page cache handling for big files: 'cached' (default), 'fadvise' (drop written data
+# from the page cache as it is flushed) or 'odirect' (bypass it with O_DIRECT writes)
+WRITE_MODE = os.getenv('WRITE_MODE', 'cached').lower()
+LARGE_FILE_THRESHOLD = int(os.getenv('LARGE_FILE_THRESHOLD', 1024 * 1024 * 1024))
+
+# Scratch storage (e.g. an SSD) for in-progress files; finished files are moved to DOWNLOAD_PATH
+# by a background mover with its own concurrency and bandwidth limits (0 = unlimited)
+STAGING_PATH = os.path.abspath(os.getenv('STAGING_PATH')) if os.getenv('STAGING_PATH') else None
+MOVER_CONCURRENCY = int(os.getenv('MOVER_CONCURRENCY', 1))
+MOVER_RATE_LIMIT_BPS = int(os.getenv('MOVER_RATE_LIMIT_BPS', 0))
+
+# Queued downloads probed (HEAD / one-byte range) at once for size, range support, ETag and filename
+# while a size queue policy is set; PROBE_FILENAMES lets URL-named downloads take the probed filename
+PROBE_CONCURRENCY = int(os.getenv('PROBE_CONCURRENCY', 4))
+PROBE_FILENAMES = os.getenv('PROBE_FILENAMES', 'false').lower() == 'true'
+
+# Stall watchdog: a connection that receives nothing (or averages less than STALL_MIN_SPEED_BPS,
+# 0 = off) over STALL_WINDOW seconds is replaced by a ranged reconnect (STALL_WINDOW=0 disables it);
+# the download fails after STALL_MAX_RECONNECTS reconnects in a row without progress
+STALL_WINDOW = float(os.getenv('STALL_WINDOW', 30))
+STALL_MIN_SPEED_BPS = int(os.getenv('STALL_MIN_SPEED_BPS', 0))
+STALL_MAX_RECONNECTS = int(os.getenv('STALL_MAX_RECONNECTS', 5))
+
+# Worker processes that run the transfers (0 = everything on the background loop)
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', 0))
+
+# Cluster mode: '' (standalone), 'coordinator' (owns the queue) or 'worker' (runs assigned downloads)
+CLUSTER_ROLE = os.getenv('CLUSTER_ROLE', '').lower()
+CLUSTER_COORDINATOR_URL = os.getenv('CLUSTER_COORDINATOR_URL', '')
+CLUSTER_NODE_ID = os.getenv('CLUSTER_NODE_ID', f"{socket.gethostname()}:{PORT}")
+CLUSTER_CAPACITY = int(os.getenv('CLUSTER_CAPACITY', 0))
+CLUSTER_LEASE_SECONDS = float(os.getenv('CLUSTER_LEASE_SECONDS', 30))
+CLUSTER_API_KEY = os.getenv('CLUSTER_API_KEY', API_KEY)
+
+# Longest a long-poll request (?wait=) may block before answering 304 (seconds)
+LONG_POLL_MAX_WAIT = float(os.getenv('LONG_POLL_MAX_WAIT', 60))
+
+# Event loop diagnostics (0 = slow callback detector off)
+SLOW_CALLBACK_THRESHOLD_MS = int(os.getenv('SLOW_CALLBACK_THRESHOLD_MS', 0))
+
 # Initialize Flask app
-app = Flask(__name__)
+# Static files are served from the in-memory StaticAssets index, not Flask's static route
+app = Flask(__name__, static_folder=None)
+# Clients may pick a compact encoding via Sec-WebSocket-Protocol (see ws_encoding)
+app.config['SOCK_SERVER_OPTIONS'] = {'subprotocols': available_subprotocols()}
 sock = Sock(app)
 
 # Configure CORS
@@ -41,12 +116,27 @@ else:
 # Global download manager instance (initialized after DB setup)
 download_manager = None
 
+# Precompressed dashboard files (built at startup)
+static_assets = None
+
+# Cached folder tree (initialized after DB setup)
+folder_index = None
+
+# In-memory settings (initialized after DB setup)
+settings_store = None
+
 # Background event loop for async operations
 background_loop = None
 background_thread = None
+loop_monitor = None
+
+# Cluster worker client (CLUSTER_ROLE=worker only)
+cluster_worker = None
 
 # WebSocket client tracking
 websocket_clients = set()
+websocket_encodings = {}
+websocket_subscriptions = SubscriptionRegistry()
 broadcast_task = None
 
 
@@ -54,7 +144,8 @@ broadcast_task = None
 def init_db():
     """Initialize database with schema if it doesn't exist"""
     os.makedirs(DATA_PATH, exist_ok=True)
-    os.makedirs(DOWNLOAD_PATH, exist_ok=True)
+    for root in [DOWNLOAD_PATH, *DOWNLOAD_VOLUMES]:
+        os.makedirs(root, exist_ok=True)
 
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -73,6 +164,41 @@ def init_db():
         # Column already exists, ignore
         pass
 
+    # Migration: Add mirrors column if it doesn't exist
+    try:
+        cursor.execute("ALTER TABLE downloads ADD COLUMN mirrors TEXT")
+        print("Migration: Added mirrors column to downloads table")
+    except sqlite3.OperationalError:
+        pass
+
+    # Migration: Add job_type column if it doesn't exist
+    try:
+        cursor.execute("ALTER TABLE downloads ADD COLUMN job_type TEXT DEFAULT 'file'")
+        print("Migration: Added job_type column to downloads table")
+    except sqlite3.OperationalError:
+        pass
+
+    # Migration: Add volume column if it doesn't exist
+    try:
+        cursor.execute("ALTER TABLE downloads ADD COLUMN volume TEXT")
+        print("Migration: Added volume column to downloads table")
+    except sqlite3.OperationalError:
+        pass
+
+    # Migration: Add probe column if it doesn't exist
+    try:
+        cursor.execute("ALTER TABLE downloads ADD COLUMN probe TEXT")
+        print("Migration: Added probe column to downloads table")
+    except sqlite3.OperationalError:
+        pass
+
+    # Migration: Add duplicate_of column if it doesn't exist
+    try:
+        cursor.execute("ALTER TABLE downloads ADD COLUMN duplicate_of TEXT")
+        print("Migration: Added duplicate_of column to downloads table")
+    except sqlite3.OperationalError:
+        pass
+
     conn.commit()
     conn.close()
 
@@ -144,42 +270,99 @@ def validate_path(relative_path):
     return full_path
 
 
+# Conditional GET support for polled endpoints
+# Per-process prefix so an ETag from before a restart never matches the new counters
+ETAG_PREFIX = uuid.uuid4().hex[:8]
+conditional_bodies = {}  # endpoint name -> (etag, serialized body) of the last 200
+
+
+def conditional_json(name, changes, build):
+    """JSON response with an ETag derived from a ChangeSignal's version
+
+    A request whose If-None-Match holds the current ETag gets 304 without the
+    body being built or serialized. With ?wait=N it first blocks up to N seconds
+    on changes (long polling, woken by the next change), then answers 200 with
+    the new state or 304 on timeout. Identical versions reuse the last
+    serialized body.
+    """
+    version = changes.value
+    etag = f"{ETAG_PREFIX}-{name}-{version}"
+
+    if request.if_none_match.contains(etag):
+        wait = min(max(request.args.get('wait', 0, type=float), 0), LONG_POLL_MAX_WAIT)
+        current = changes.wait(version, wait) if wait else changes.value
+        if current == version:
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        version = current
+        etag = f"{ETAG_PREFIX}-{name}-{version}"
+
+    cached = conditional_bodies.get(name)
+    if cached is not None and cached[0] == etag:
+        response = app.response_class(cached[1], mimetype='application/json')
+    else:
+        response = jsonify(build())
+        conditional_bodies[name] = (etag, response.get_data())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 # API Routes (to be implemented in later steps)
 
 # Folder endpoints (Step 6)
 @app.route('/api/folders', methods=['GET'])
 @require_auth
 def get_folders():
-    """List folders in the download directory"""
+    """List folders in the download directory (served from the folder index cache)
+
+    Query parameters:
+        path (optional): Folder to list, relative to DOWNLOAD_PATH
+        depth (optional): Levels of subfolders to include, nested under 'folders' (default 1)
+        search (optional): Return indexed folders below path whose name or path starts with this
+        sizes (optional): 'true' to include aggregate file_count/total_bytes per folder
+    """
     # Get optional subfolder parameter
     subfolder = request.args.get('path', '')
+    search = request.args.get('search')
+    sizes = request.args.get('sizes', 'false').lower() == 'true'
+
+    try:
+        depth = int(request.args.get('depth', 1))
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        return jsonify({'error': 'depth and limit must be integers'}), 400
+
+    if depth < 1 or depth > 32:
+        return jsonify({'error': 'depth must be between 1 and 32'}), 400
 
     # Validate path to prevent traversal
     target_path = validate_path(subfolder)
     if target_path is None:
         return jsonify({'error': 'Invalid path'}), 400
 
-    # Check if path exists
-    if not os.path.exists(target_path):
-        return jsonify({'error': 'Path does not exist'}), 404
-
-    if not os.path.isdir(target_path):
-        return jsonify({'error': 'Path is not a directory'}), 400
+    relative_path = os.path.relpath(target_path, DOWNLOAD_PATH).replace('\\', '/')
+    if relative_path == '.':
+        relative_path = ''
 
-    # List subdirectories
     try:
-        folders = []
-        for entry in os.listdir(target_path):
-            entry_path = os.path.join(target_path, entry)
-            if os.path.isdir(entry_path):
-                # Return relative path from DOWNLOAD_PATH
-                rel_path = os.path.relpath(entry_path, DOWNLOAD_PATH)
-                folders.append({
-                    'name': entry,
-                    'path': rel_path.replace('\\', '/')  # Normalize to forward slashes
-                })
-
-        return jsonify({'folders': folders}), 200
+        if search is not None:
+            folders = folder_index.search(search, relative_path, limit=max(1, limit), sizes=sizes)
+        else:
+            folders = folder_index.list_folders(relative_path, depth=depth, sizes=sizes)
+
+        if folders is None:
+            # Distinguish missing paths from files
+            if any(os.path.exists(os.path.join(root, relative_path)) for root in download_manager.volumes.roots):
+                return jsonify({'error': 'Path is not a directory'}), 400
+            return jsonify({'error': 'Path does not exist'}), 404
+
+        result = {'folders': folders}
+        if sizes:
+            result['summary'] = folder_index.get_summary(relative_path)
+        return jsonify(result), 200
     except Exception as e:
         return jsonify({'error': f'Failed to list folders: {str(e)}'}), 500
 
@@ -210,16 +393,19 @@ def create_folder():
     if target_path is None:
         return jsonify({'error': 'Invalid path - path traversal detected'}), 400
 
-    # Check if folder already exists
-    if os.path.exists(target_path):
+    # Check if folder already exists (on any download root)
+    rel_path = os.path.relpath(target_path, DOWNLOAD_PATH)
+    volumes = download_manager.volumes
+    if any(os.path.exists(os.path.join(root, rel_path)) for root in volumes.roots):
         return jsonify({'error': 'Folder already exists'}), 409
 
-    # Create the folder
+    # Create the folder on the root files in it would be placed on
     try:
-        os.makedirs(target_path, exist_ok=False)
+        root = run_async(download_manager.choose_volume(rel_path))
+        os.makedirs(os.path.join(root, rel_path), exist_ok=False)
 
         # Return the created folder info
-        rel_path = os.path.relpath(target_path, DOWNLOAD_PATH)
+        folder_index.invalidate(rel_path)
         return jsonify({
             'name': os.path.basename(target_path),
             'path': rel_path.replace('\\', '/')
@@ -232,26 +418,175 @@ def create_folder():
         return jsonify({'error': f'Failed to create folder: {str(e)}'}), 500
 
 
-# Settings endpoints (Step 7)
-@app.route('/api/settings', methods=['GET'])
+@app.route('/api/folders/archive', methods=['GET'])
 @require_auth
-def get_settings():
-    """Get all settings as a JSON object"""
-    try:
-        conn = get_db()
-        cursor = conn.cursor()
+def get_folder_archive():
+    """Stream a folder as a ZIP (stored) or TAR built on the fly
 
-        # Get all settings
-        cursor.execute("SELECT key, value FROM settings")
-        rows = cursor.fetchall()
-        conn.close()
+    Query parameters:
+        path (optional): Folder to export, relative to DOWNLOAD_PATH (default: everything)
+        format (optional): 'zip' (default) or 'tar'
 
-        # Convert to dictionary
-        settings = {row['key']: row['value'] for row in rows}
+    Nothing is staged on disk: the archive layout is computed from the file
+    listing and each part is produced when it is sent. The layout is
+    deterministic, so a single Range (with If-Range against the ETag) resumes
+    an interrupted export as long as the folder hasn't changed.
+    """
+    fmt = request.args.get('format', 'zip').lower()
+    if fmt not in archive.FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(archive.FORMATS)}"}), 400
 
-        return jsonify(settings), 200
-    except Exception as e:
-        return jsonify({'error': f'Failed to retrieve settings: {str(e)}'}), 500
+    target_path = validate_path(request.args.get('path', ''))
+    if target_path is None:
+        return jsonify({'error': 'Invalid path - path traversal detected'}), 400
+
+    relative_path = os.path.relpath(target_path, DOWNLOAD_PATH)
+    if relative_path == '.':
+        relative_path = ''
+    top = os.path.basename(relative_path) or 'downloads'
+
+    entries = archive.collect_entries(download_manager.volumes.roots, relative_path, top)
+    if entries is None:
+        if any(os.path.exists(os.path.join(root, relative_path)) for root in download_manager.volumes.roots):
+            return jsonify({'error': 'Path is not a directory'}), 400
+        return jsonify({'error': 'Path does not exist'}), 404
+    export = archive.open_archive(fmt, entries)
+
+    filename = top + export.extension
+    ascii_name = filename.encode('ascii', 'replace').decode().replace('"', '_')
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'no-cache',
+        'Content-Disposition': f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+    }
+
+    start, end, status = 0, export.size, 200
+    byte_range = request.range
+    if_range = request.if_range
+    range_applies = not (if_range.etag or if_range.date) or if_range.etag == export.etag
+    if byte_range is not None and range_applies and len(byte_range.ranges) == 1:
+        bounds = byte_range.range_for_length(export.size)
+        if bounds is None:
+            response = jsonify({'error': 'Requested range not satisfiable'})
+            response.status_code = 416
+            response.headers['Content-Range'] = f'bytes */{export.size}'
+            return response
+        start, end = bounds
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{end - 1}/{export.size}'
+
+    body = export.iter_range(start, end, sock=request.environ.get('werkzeug.socket'))
+    response = app.response_class(body, status=status, headers=headers, direct_passthrough=True,
+                                  mimetype=export.content_type)
+    response.content_length = end - start
+    response.set_etag(export.etag)
+    return response
+
+
+@app.route('/api/volumes', methods=['GET'])
+@require_auth
+def get_volumes():
+    """Download roots with free space and the transfers writing to each"""
+    return jsonify(run_async(download_manager.get_volume_status())), 200
+
+
+# File endpoints
+@app.route('/api/files/<path:file_path>', methods=['GET'])
+@require_auth
+def get_file(file_path):
+    """Serve a downloaded file, or the part of one that has been downloaded so far
+
+    Finished files get an ETag and Last-Modified (If-None-Match -> 304). A single
+    Range is honoured (206, or 416 past the end) unless If-Range doesn't match.
+    A file still downloading is read from its temp file; when its size is known
+    the response has the full length and waits for bytes not written yet.
+    """
+    # Validate path to prevent traversal
+    target_path = validate_path(file_path)
+    if target_path is None:
+        return jsonify({'error': 'Invalid path - path traversal detected'}), 400
+
+    relative_path = os.path.relpath(target_path, DOWNLOAD_PATH)
+    folder, filename = os.path.split(relative_path)
+    download = None
+    root = download_manager.volumes.find_file(folder, filename)
+    if root is not None:
+        full_path = os.path.join(root, relative_path)
+    else:
+        download = run_async(download_manager.find_unfinished(folder, filename))
+        if download is None:
+            return jsonify({'error': 'File not found'}), 404
+        if download.mirrors or download.job_type == 'stream':
+            # Written out of order - there is no contiguous prefix to serve
+            return jsonify({'error': 'Multi-source and stream downloads can be read once completed'}), 409
+        full_path = download.get_temp_file_path()
+
+    try:
+        f = open(full_path, 'rb')
+    except IsADirectoryError:
+        return jsonify({'error': 'Path is a directory'}), 400
+    except FileNotFoundError:
+        # Not started yet (or renamed into place between the checks)
+        return jsonify({'error': 'File has no data yet'}), 404
+
+    st = os.fstat(f.fileno())
+    headers = {'Accept-Ranges': 'bytes'}
+    etag = None
+    growing = None
+    if download is None:
+        complete_length = st.st_size
+        etag = file_etag(st)
+        headers['Cache-Control'] = 'no-cache'
+        if request.if_none_match.contains(etag):
+            f.close()
+            response = app.response_class(status=304, headers=headers)
+            response.set_etag(etag)
+            return response
+    else:
+        headers['Cache-Control'] = 'no-store'
+        headers['X-Download-Status'] = download.status
+        if download.total_bytes > 0:
+            complete_length = download.total_bytes
+            growing = lambda: download.status in ('queued', 'downloading', 'paused')
+        else:
+            complete_length = st.st_size
+
+    start, length, status = 0, complete_length, 200
+    byte_range = request.range
+    if_range = request.if_range
+    range_applies = not (if_range.etag or if_range.date) or (etag is not None and (
+        if_range.etag == etag
+        or (if_range.date is not None and int(if_range.date.timestamp()) == int(st.st_mtime))))
+    if byte_range is not None and range_applies and len(byte_range.ranges) == 1:
+        bounds = byte_range.range_for_length(complete_length)
+        if bounds is None:
+            f.close()
+            response = jsonify({'error': 'Requested range not satisfiable'})
+            response.status_code = 416
+            response.headers['Content-Range'] = f'bytes */{complete_length}'
+            return response
+        start, stop = bounds
+        length = stop - start
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{complete_length}'
+
+    body = FileBody(f, start, length, socket=request.environ.get('werkzeug.socket'), growing=growing)
+    response = app.response_class(body, status=status, headers=headers, direct_passthrough=True,
+                                  mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response.content_length = length
+    if etag is not None:
+        response.set_etag(etag)
+        response.last_modified = st.st_mtime
+    response.call_on_close(body.close)
+    return response
+
+
+# Settings endpoints (Step 7)
+@app.route('/api/settings', methods=['GET'])
+@require_auth
+def get_settings():
+    """Get all settings as a JSON object (conditional GET / long poll via ETag)"""
+    return conditional_json('settings', settings_store.changes, settings_store.as_api_dict)
 
 
 @app.route('/api/settings', methods=['PATCH'])
@@ -264,8 +599,9 @@ def update_settings():
         return jsonify({'error': 'Request body must be a JSON object'}), 400
 
     # List of valid setting keys - numeric settings vs string settings
-    numeric_keys = {'global_rate_limit_bps', 'max_concurrent_downloads'}
-    string_keys = {'default_download_folder'}
+    numeric_keys = {'global_rate_limit_bps', 'max_concurrent_downloads',
+                    'auto_concurrency_min', 'auto_concurrency_max'}
+    string_keys = {'default_download_folder', 'concurrency_mode', 'queue_policy', 'duplicate_policy'}
     valid_keys = numeric_keys | string_keys
 
     # Validate all keys are allowed
@@ -291,9 +627,24 @@ def update_settings():
                 if key == 'max_concurrent_downloads' and int_value < 1:
                     return jsonify({'error': 'max_concurrent_downloads must be >= 1'}), 400
 
+                if key in ('auto_concurrency_min', 'auto_concurrency_max') and int_value < 1:
+                    return jsonify({'error': f'{key} must be >= 1'}), 400
+
             except ValueError:
                 return jsonify({'error': f'Setting {key} must be a valid integer'}), 400
 
+        elif key == 'concurrency_mode':
+            if value not in ('fixed', 'auto'):
+                return jsonify({'error': "concurrency_mode must be 'fixed' or 'auto'"}), 400
+
+        elif key == 'queue_policy':
+            if value not in QUEUE_POLICIES:
+                return jsonify({'error': f"queue_policy must be one of: {', '.join(QUEUE_POLICIES)}"}), 400
+
+        elif key == 'duplicate_policy':
+            if value not in DUPLICATE_POLICIES:
+                return jsonify({'error': f"duplicate_policy must be one of: {', '.join(DUPLICATE_POLICIES)}"}), 400
+
         elif key == 'default_download_folder':
             # String path validation
             if not isinstance(value, str):
@@ -305,47 +656,37 @@ def update_settings():
                 target_path = validate_path(value)
                 if target_path is None:
                     return jsonify({'error': 'Invalid default_download_folder - path traversal detected'}), 400
-                if not os.path.exists(target_path):
+                roots = download_manager.volumes.roots
+                if not any(os.path.exists(os.path.join(root, value)) for root in roots):
                     return jsonify({'error': 'default_download_folder path does not exist'}), 400
-                if not os.path.isdir(target_path):
+                if not download_manager.volumes.roots_with(value):
                     return jsonify({'error': 'default_download_folder must be a directory'}), 400
 
-    # Update settings in database
-    try:
-        conn = get_db()
-        cursor = conn.cursor()
-
-        for key, value in data.items():
-            # Convert to string for storage
-            value_str = str(value)
-            cursor.execute(
-                "UPDATE settings SET value = ? WHERE key = ?",
-                (value_str, key)
-            )
+    # Auto concurrency bounds are checked together (either may change alone)
+    if 'auto_concurrency_min' in data or 'auto_concurrency_max' in data:
+        auto_min = int(data.get('auto_concurrency_min', settings_store.get('auto_concurrency_min')))
+        auto_max = int(data.get('auto_concurrency_max', settings_store.get('auto_concurrency_max')))
+        if auto_min > auto_max:
+            return jsonify({'error': 'auto_concurrency_min must be <= auto_concurrency_max'}), 400
 
-        conn.commit()
-
-        # Return updated settings
-        cursor.execute("SELECT key, value FROM settings")
-        rows = cursor.fetchall()
-        conn.close()
-
-        settings = {row['key']: row['value'] for row in rows}
-
-        # Update download manager's in-memory settings
-        if 'global_rate_limit_bps' in data:
-            download_manager.global_rate_limit_bps = int(data['global_rate_limit_bps'])
-        if 'max_concurrent_downloads' in data:
-            # Use the async method to enforce the limit immediately
-            run_async(download_manager.set_max_concurrent_downloads(int(data['max_concurrent_downloads'])))
+    # Write through the settings store - it updates the database and notifies
+    # the download manager and WebSocket clients of what changed
+    try:
+        settings_store.update(data)
+        return jsonify(settings_store.as_api_dict()), 200
 
-        # Broadcast settings change to all connected WebSocket clients
-        broadcast_settings(settings)
+    except Exception as e:
+        return jsonify({'error': f'Failed to update settings: {str(e)}'}), 500
 
-        return jsonify(settings), 200
 
+@app.route('/api/concurrency', methods=['GET'])
+@require_auth
+def get_concurrency():
+    """Current concurrency limit and the auto controller's decisions"""
+    try:
+        return jsonify(run_async(download_manager.get_concurrency_status())), 200
     except Exception as e:
-        return jsonify({'error': f'Failed to update settings: {str(e)}'}), 500
+        return jsonify({'error': f'Failed to get concurrency status: {str(e)}'}), 500
 
 
 # Background event loop setup
@@ -376,10 +717,10 @@ def run_async(coro):
 @app.route('/api/downloads', methods=['GET'])
 @require_auth
 def get_downloads():
-    """Get list of all downloads with progress info"""
+    """Get list of all downloads with progress info (conditional GET / long poll via ETag)"""
     try:
-        downloads = run_async(download_manager.get_downloads())
-        return jsonify({'downloads': downloads}), 200
+        return conditional_json('downloads', download_manager.changes,
+                                lambda: {'downloads': run_async(download_manager.get_downloads())})
     except Exception as e:
         return jsonify({'error': f'Failed to get downloads: {str(e)}'}), 500
 
@@ -448,20 +789,12 @@ def create_download():
     overwrite = data.get('overwrite', False)
     user_agent = data.get('user_agent')  # Browser User-Agent for download requests
     cookies = data.get('cookies')  # Browser cookies for this domain
+    mirrors = data.get('mirrors')  # Other URLs serving the same file
+    job_type = data.get('type')  # 'file' or 'stream' (default depends on the URL)
 
     # If no folder specified, use default_download_folder from settings
     if not folder:
-        try:
-            conn = get_db()
-            cursor = conn.cursor()
-            cursor.execute("SELECT value FROM settings WHERE key = 'default_download_folder'")
-            row = cursor.fetchone()
-            conn.close()
-            if row and row['value']:
-                folder = row['value']
-        except Exception:
-            # If we can't get the setting, just use empty string (root)
-            pass
+        folder = settings_store.get('default_download_folder')
 
     # Validate URL format
     if not url or not isinstance(url, str) or url.strip() == '':
@@ -471,6 +804,17 @@ def create_download():
     if not url.startswith('http://') and not url.startswith('https://'):
         return jsonify({'error': 'URL must start with http:// or https://'}), 400
 
+    # Validate mirrors if provided
+    if mirrors is not None:
+        if not isinstance(mirrors, list):
+            return jsonify({'error': 'Mirrors must be a list of URLs'}), 400
+        for mirror in mirrors:
+            if not isinstance(mirror, str) or not mirror.startswith(('http://', 'https://')):
+                return jsonify({'error': 'Each mirror must be a URL starting with http:// or https://'}), 400
+
+    if job_type is not None and job_type not in ('file', 'stream'):
+        return jsonify({'error': "Type must be 'file' or 'stream'"}), 400
+
     # Validate folder path if provided
     if folder:
         if not isinstance(folder, str):
@@ -490,13 +834,16 @@ def create_download():
             return jsonify({'error': 'Filename cannot be empty'}), 400
 
     try:
-        download_id = run_async(download_manager.add_download(url, folder, filename, overwrite, user_agent, cookies))
+        # The same URL already in flight into this folder isn't transferred again (duplicate_policy)
+        download_id, attached = run_async(download_manager.submit_download(
+            url, folder, filename, overwrite=overwrite, user_agent=user_agent, cookies=cookies,
+            mirrors=mirrors, job_type=job_type))
 
         # Get the created download info
         downloads = run_async(download_manager.get_downloads())
         created_download = next((d for d in downloads if d['id'] == download_id), None)
 
-        return jsonify(created_download), 201
+        return jsonify(created_download), 200 if attached else 201
     except ValueError as e:
         # Validation errors from download manager
         return jsonify({'error': str(e)}), 400
@@ -631,17 +978,185 @@ def resume_all_downloads():
         return jsonify({'error': f'Failed to resume downloads: {str(e)}'}), 500
 
 
+@app.route('/api/downloads/bulk', methods=['POST'])
+@require_auth
+def bulk_update_downloads():
+    """Pause, resume, retry, cancel or delete many downloads at once
+
+    Request body:
+        action: 'pause', 'resume', 'retry', 'cancel' or 'delete'
+        ids (optional): Download IDs to act on
+        filter (optional): {status, folder, ids} as for WebSocket subscriptions
+        delete_files (optional): With 'delete', also delete finished files (default false)
+
+    One of ids or filter is required. State changes are written in one DB
+    transaction; files are removed by a background deletion queue.
+    """
+    data = request.get_json(silent=True)
+
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+
+    action = data.get('action')
+    if not isinstance(action, str) or action.lower().strip() not in DownloadManager.BULK_ACTIONS:
+        return jsonify({'error': f"action must be one of: {', '.join(DownloadManager.BULK_ACTIONS)}"}), 400
+    action = action.lower().strip()
+
+    if ('ids' in data) == ('filter' in data):
+        return jsonify({'error': 'Exactly one of ids or filter is required'}), 400
+
+    delete_files = data.get('delete_files', False)
+    if not isinstance(delete_files, bool):
+        return jsonify({'error': 'delete_files must be a boolean'}), 400
+
+    try:
+        if 'ids' in data:
+            if not data['ids']:
+                return jsonify({'error': 'ids must not be empty'}), 400
+            download_filter = DownloadFilter.parse({'ids': data['ids']})
+        else:
+            download_filter = DownloadFilter.parse(data['filter'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        result = run_async(download_manager.bulk_update(action, download_filter, delete_files=delete_files))
+        result['deletion_queue'] = run_async(download_manager.get_deletion_status())
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'error': f'Failed to {action} downloads: {str(e)}'}), 500
+
+
+# Crawl endpoints
+@app.route('/api/crawls', methods=['POST'])
+@require_auth
+def create_crawl():
+    """Crawl a directory listing and enqueue every file found"""
+    data = request.get_json()
+
+    if not data:
+        return jsonify({'error': 'Request body must be valid JSON'}), 400
+
+    if 'url' not in data:
+        return jsonify({'error': 'Missing url in request body'}), 400
+
+    url = data['url']
+    folder = data.get('folder', '')
+    include = data.get('include', [])
+    exclude = data.get('exclude', [])
+    max_depth = data.get('max_depth', 5)
+    concurrency = data.get('concurrency', 4)
+    max_files = data.get('max_files', 0)
+    user_agent = data.get('user_agent')
+    cookies = data.get('cookies')
+
+    # If no folder specified, use default_download_folder from settings
+    if not folder:
+        folder = settings_store.get('default_download_folder')
+
+    # Validate URL format
+    if not url or not isinstance(url, str) or url.strip() == '':
+        return jsonify({'error': 'URL must be a non-empty string'}), 400
+
+    if not url.startswith('http://') and not url.startswith('https://'):
+        return jsonify({'error': 'URL must start with http:// or https://'}), 400
+
+    # Validate folder path if provided
+    if folder:
+        if not isinstance(folder, str):
+            return jsonify({'error': 'Folder path must be a string'}), 400
+        target_path = validate_path(folder)
+        if target_path is None:
+            return jsonify({'error': 'Invalid folder path - path traversal detected'}), 400
+
+    # Validate patterns
+    for name, patterns in (('include', include), ('exclude', exclude)):
+        if not isinstance(patterns, list) or not all(isinstance(p, str) for p in patterns):
+            return jsonify({'error': f'{name} must be a list of glob patterns'}), 400
+
+    # Validate numeric limits
+    limits = {
+        'max_depth': (max_depth, 0, 50),
+        'concurrency': (concurrency, 1, 16),
+        'max_files': (max_files, 0, None),
+    }
+    for name, (value, minimum, maximum) in limits.items():
+        if not isinstance(value, int) or isinstance(value, bool):
+            return jsonify({'error': f'{name} must be an integer'}), 400
+        if value < minimum or (maximum is not None and value > maximum):
+            bounds = f'between {minimum} and {maximum}' if maximum is not None else f'>= {minimum}'
+            return jsonify({'error': f'{name} must be {bounds}'}), 400
+
+    try:
+        crawl_id = run_async(download_manager.start_crawl(
+            url, folder, include=include, exclude=exclude, max_depth=max_depth,
+            concurrency=concurrency, max_files=max_files,
+            user_agent=user_agent, cookies=cookies
+        ))
+        return jsonify(download_manager.crawls[crawl_id].get_status()), 201
+    except Exception as e:
+        return jsonify({'error': f'Failed to start crawl: {str(e)}'}), 500
+
+
+@app.route('/api/crawls', methods=['GET'])
+@require_auth
+def get_crawls():
+    """Get list of crawl jobs with progress info"""
+    try:
+        crawls = run_async(download_manager.get_crawls())
+        return jsonify({'crawls': crawls}), 200
+    except Exception as e:
+        return jsonify({'error': f'Failed to get crawls: {str(e)}'}), 500
+
+
+@app.route('/api/crawls/<crawl_id>', methods=['GET'])
+@require_auth
+def get_crawl(crawl_id):
+    """Get specific crawl job by ID"""
+    crawl = download_manager.crawls.get(crawl_id)
+
+    if crawl is None:
+        return jsonify({'error': 'Crawl not found'}), 404
+
+    return jsonify(crawl.get_status()), 200
+
+
+@app.route('/api/crawls/<crawl_id>', methods=['DELETE'])
+@require_auth
+def delete_crawl(crawl_id):
+    """Stop a crawl (downloads it already queued are kept)"""
+    if crawl_id not in download_manager.crawls:
+        return jsonify({'error': 'Crawl not found'}), 404
+
+    try:
+        run_async(download_manager.cancel_crawl(crawl_id))
+        return jsonify({'message': 'Crawl removed successfully'}), 200
+    except Exception as e:
+        return jsonify({'error': f'Failed to remove crawl: {str(e)}'}), 500
+
+
 # WebSocket endpoint (Step 11)
 @sock.route('/ws')
 def websocket_handler(ws):
     """WebSocket endpoint for real-time download updates"""
+    # Wire encoding: JSON unless the client negotiated a compact one
+    try:
+        encoding = negotiate(ws.subprotocol, request.args.get('encoding'))
+    except ValueError as e:
+        try:
+            ws.send(json.dumps({'type': 'encoding_error', 'error': str(e)}))
+            time.sleep(0.01)  # Small delay to ensure message is sent
+        except:
+            pass
+        ws.close()
+        return
+
     # Authenticate using query parameter
     api_key = request.args.get('api_key')
 
     if not api_key:
         try:
-            ws.send(json.dumps({'type': 'auth_error', 'error': 'Missing API key'}))
-            import time
+            ws.send(encode({'type': 'auth_error', 'error': 'Missing API key'}, encoding))
             time.sleep(0.01)  # Small delay to ensure message is sent
         except:
             pass
@@ -651,8 +1166,7 @@ def websocket_handler(ws):
     # Constant-time comparison to prevent timing attacks
     if not compare_digest(api_key, API_KEY):
         try:
-            ws.send(json.dumps({'type': 'auth_error', 'error': 'Invalid API key'}))
-            import time
+            ws.send(encode({'type': 'auth_error', 'error': 'Invalid API key'}, encoding))
             time.sleep(0.01)  # Small delay to ensure message is sent
         except:
             pass
@@ -660,16 +1174,17 @@ def websocket_handler(ws):
         return
 
     # Add client to the set of connected clients
+    websocket_encodings[ws] = encoding
     websocket_clients.add(ws)
 
     try:
         # Send initial download status
         downloads = run_async(download_manager.get_downloads())
-        ws.send(json.dumps({
+        ws.send(encode({
             'type': 'status',
             'downloads': downloads,
             'global_paused': download_manager.global_paused
-        }))
+        }, encoding))
 
         # Keep connection alive and handle incoming messages
         while True:
@@ -679,15 +1194,24 @@ def websocket_handler(ws):
                 # Connection closed
                 break
 
-            # Handle client messages (currently we don't expect any specific messages)
-            # But we can extend this to support commands like pause/resume from WS
             try:
-                data = json.loads(message)
-                # Could handle commands here in future
-                # For now, just echo back an acknowledgment
-                ws.send(json.dumps({'type': 'ack', 'received': data}))
-            except json.JSONDecodeError:
-                ws.send(json.dumps({'error': 'Invalid JSON'}))
+                data = decode(message, encoding)
+            except ValueError:
+                ws.send(encode({'error': 'Invalid JSON' if encoding != 'msgpack' else 'Invalid MessagePack'},
+                               encoding))
+                continue
+
+            message_type = data.get('type') if isinstance(data, dict) else None
+            if message_type == 'subscribe':
+                for reply in handle_subscribe(ws, data):
+                    ws.send(encode(reply, encoding))
+            elif message_type == 'unsubscribe':
+                subscription_id = str(data.get('id', ''))
+                removed = websocket_subscriptions.unsubscribe(ws, subscription_id)
+                ws.send(encode({'type': 'unsubscribed', 'id': subscription_id, 'found': removed}, encoding))
+            else:
+                # Anything else is acknowledged as before
+                ws.send(encode({'type': 'ack', 'received': data}, encoding))
 
     except Exception as e:
         # Handle any errors during WebSocket communication
@@ -695,54 +1219,121 @@ def websocket_handler(ws):
     finally:
         # Remove client from the set when disconnected
         websocket_clients.discard(ws)
+        websocket_encodings.pop(ws, None)
+        websocket_subscriptions.remove_client(ws)
+
+
+def handle_subscribe(ws, data):
+    """Register a subscription. Returns the replies: confirmation and first update."""
+    subscription_id = data.get('id', 'default')
+    if not isinstance(subscription_id, str) or not subscription_id:
+        return [{'type': 'subscribe_error', 'id': subscription_id,
+                 'error': 'id must be a non-empty string'}]
+
+    interval = data.get('interval')
+    try:
+        if interval is not None and (isinstance(interval, bool) or not isinstance(interval, (int, float))):
+            raise ValueError('interval must be a number of seconds')
+        download_filter = DownloadFilter.parse(data.get('filter'))
+        subscription = websocket_subscriptions.subscribe(ws, subscription_id, download_filter, interval)
+    except ValueError as e:
+        return [{'type': 'subscribe_error', 'id': subscription_id, 'error': str(e)}]
+
+    body = run_async(render_subscription(subscription.filter))
+    return [{'type': 'subscribed', **subscription.to_dict()},
+            {'subscription': subscription.id, **body}]
+
+
+async def render_subscription(download_filter):
+    """Current filtered status message for one filter (runs on the download loop)"""
+    downloads = list(download_manager.downloads.values())
+    return filtered_status(downloads, download_filter, status_counts(downloads),
+                           download_manager.global_paused, {})
 
 
 # Broadcast function to send updates to all connected WebSocket clients
 async def broadcast_downloads():
-    """Periodically broadcast download status to all connected WebSocket clients"""
+    """Periodically broadcast download status to all connected WebSocket clients
+
+    Clients without subscriptions get every download once a second; subscribed
+    clients get each subscription's filtered view at its own interval.
+    """
+    last_full_broadcast = 0.0
     while True:
         try:
-            # Wait 1 second between broadcasts
-            await asyncio.sleep(1)
+            # Tick at the shortest subscription interval
+            await asyncio.sleep(SubscriptionRegistry.MIN_INTERVAL)
 
             if not websocket_clients:
                 # No clients connected, skip
                 continue
 
-            # Get current download status
-            downloads = await download_manager.get_downloads()
-
-            # Prepare message
-            message = json.dumps({
-                'type': 'status',
-                'downloads': downloads,
-                'global_paused': download_manager.global_paused
-            })
-
-            # Send to all connected clients
-            # Make a copy of the set to avoid modification during iteration
-            clients = websocket_clients.copy()
-            for client in clients:
+            now = time.monotonic()
+            outgoing = []
+
+            # Full status to clients that haven't subscribed, every second
+            if now - last_full_broadcast >= 1.0:
+                last_full_broadcast = now
+                legacy = [c for c in websocket_clients.copy()
+                          if not websocket_subscriptions.has_subscriptions(c)]
+                if legacy:
+                    # Get current download status
+                    downloads = await download_manager.get_downloads()
+                    message = MessageCache({
+                        'type': 'status',
+                        'downloads': downloads,
+                        'global_paused': download_manager.global_paused
+                    })
+                    outgoing.extend((client, message) for client in legacy)
+
+            due = websocket_subscriptions.take_due(now)
+            if due:
+                # Each distinct filter is evaluated once per tick, and encoded once
+                # per subscription id and encoding
+                downloads = list(download_manager.downloads.values())
+                counts = status_counts(downloads)
+                progress_cache = {}
+                bodies = {}
+                messages = {}
+                for client, subscription in due:
+                    key = subscription.filter.key()
+                    if key not in bodies:
+                        bodies[key] = filtered_status(downloads, subscription.filter, counts,
+                                                      download_manager.global_paused, progress_cache)
+                    if (key, subscription.id) not in messages:
+                        messages[key, subscription.id] = MessageCache(
+                            {'subscription': subscription.id, **bodies[key]})
+                    outgoing.append((client, messages[key, subscription.id]))
+
+            # Send to all connected clients, each in its own encoding
+            for client, message in outgoing:
                 try:
-                    client.send(message)
+                    client.send(message.get(websocket_encodings.get(client, 'json')))
                 except Exception as e:
                     # If send fails, remove the client (it's probably disconnected)
                     print(f"Failed to send to WebSocket client: {e}")
                     websocket_clients.discard(client)
+                    websocket_encodings.pop(client, None)
+                    websocket_subscriptions.remove_client(client)
 
         except Exception as e:
             print(f"Broadcast error: {e}")
             # Continue broadcasting even if there's an error
 
 
+def on_settings_changed(changed, previous):
+    """Settings store subscriber - push the new settings to WebSocket clients"""
+    broadcast_settings(settings_store.as_api_dict())
+
+
 def broadcast_settings(settings):
     """Broadcast settings changes to all connected WebSocket clients"""
     if not websocket_clients:
         # No clients connected, skip
         return
 
-    # Prepare message
-    message = json.dumps({
+    # Prepare message (encoded once per encoding in use)
+    message = MessageCache({
         'type': 'settings_update',
         'settings': settings
     })
@@ -752,22 +1343,182 @@ def broadcast_settings(settings):
     clients = websocket_clients.copy()
     for client in clients:
         try:
-            client.send(message)
+            client.send(message.get(websocket_encodings.get(client, 'json')))
         except Exception as e:
             # If send fails, remove the client (it's probably disconnected)
             print(f"Failed to send settings update to WebSocket client: {e}")
             websocket_clients.discard(client)
+            websocket_encodings.pop(client, None)
+
+
+# Diagnostics endpoints
+@app.route('/api/debug/loop', methods=['GET'])
+@require_auth
+def get_loop_health():
+    """Report background event loop lag and the worst slow callbacks"""
+    if loop_monitor is None:
+        return jsonify({'error': 'Loop monitor not running'}), 503
+
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    return jsonify(loop_monitor.get_report(limit=max(1, limit))), 200
+
+
+@app.route('/api/debug/loop', methods=['PATCH'])
+@require_auth
+def update_loop_monitor():
+    """Enable/disable the slow callback detector or reset collected data"""
+    if loop_monitor is None:
+        return jsonify({'error': 'Loop monitor not running'}), 503
+
+    data = request.get_json()
+
+    if not data:
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+
+    if 'slow_callback_threshold_ms' in data:
+        try:
+            threshold_ms = int(data['slow_callback_threshold_ms'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'slow_callback_threshold_ms must be an integer'}), 400
+        if threshold_ms < 0:
+            return jsonify({'error': 'slow_callback_threshold_ms must be >= 0'}), 400
+        loop_monitor.enable_slow_callback_detection(threshold_ms)
+
+    if data.get('reset'):
+        loop_monitor.reset()
+
+    return jsonify(loop_monitor.get_report()), 200
+
+
+@app.route('/api/debug/workers', methods=['GET'])
+@require_auth
+def get_workers():
+    """List download worker processes and the downloads each is running"""
+    pool = download_manager.worker_pool
+    return jsonify({
+        'enabled': pool is not None,
+        'workers': pool.get_status() if pool else []
+    }), 200
+
+
+@app.route('/api/debug/watchdog', methods=['GET'])
+@require_auth
+def get_watchdog():
+    """Stall watchdog settings and how often it replaced stalled or slow connections"""
+    return jsonify(run_async(download_manager.get_watchdog_status())), 200
+
+
+# Cluster endpoints
+def get_cluster_coordinator():
+    """The cluster coordinator, or None if this node isn't one"""
+    if CLUSTER_ROLE != 'coordinator' or download_manager is None:
+        return None
+    return download_manager.worker_pool
+
+
+@app.route('/api/cluster', methods=['GET'])
+@require_auth
+def get_cluster():
+    """Cluster role of this node and the registered worker nodes"""
+    coordinator = get_cluster_coordinator()
+    if coordinator is not None:
+        nodes = coordinator.get_status()
+        return jsonify({
+            'role': 'coordinator',
+            'capacity': coordinator.capacity(),
+            'speed_bps': sum(node['speed_bps'] for node in nodes),
+            'nodes': nodes
+        }), 200
+
+    if cluster_worker is not None:
+        return jsonify(dict(cluster_worker.get_status(), role='worker')), 200
+
+    return jsonify({'role': 'standalone'}), 200
+
+
+@app.route('/api/cluster/register', methods=['POST'])
+@require_auth
+def register_cluster_node():
+    """Register a worker node with this coordinator"""
+    coordinator = get_cluster_coordinator()
+    if coordinator is None:
+        return jsonify({'error': 'This node is not a cluster coordinator'}), 404
+
+    data = request.get_json()
+    if not data or not data.get('node_id'):
+        return jsonify({'error': 'node_id is required'}), 400
+
+    try:
+        capacity = int(data.get('capacity', 1))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'capacity must be an integer'}), 400
+
+    return jsonify(run_async(coordinator.register(str(data['node_id']), capacity))), 200
+
+
+@app.route('/api/cluster/heartbeat', methods=['POST'])
+@require_auth
+def cluster_heartbeat():
+    """Report a worker node's progress, renew its leases and return its commands"""
+    coordinator = get_cluster_coordinator()
+    if coordinator is None:
+        return jsonify({'error': 'This node is not a cluster coordinator'}), 404
+
+    data = request.get_json()
+    if not data or not data.get('node_id'):
+        return jsonify({'error': 'node_id is required'}), 400
+
+    jobs = data.get('jobs', [])
+    messages = data.get('messages', [])
+    if not isinstance(jobs, list) or not isinstance(messages, list):
+        return jsonify({'error': 'jobs and messages must be lists'}), 400
+
+    try:
+        capacity = int(data['capacity']) if 'capacity' in data else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'capacity must be an integer'}), 400
+
+    result = run_async(coordinator.heartbeat(str(data['node_id']), jobs, messages, capacity))
+    if result is None:
+        return jsonify({'error': 'Unknown node, register first'}), 404
+    return jsonify(result), 200
 
 
 # Serve static files
+def send_static_asset(path):
+    """Serve a file from the static asset index, precompressed if the client accepts it"""
+    asset, hashed = static_assets.find(path)
+    if asset is None:
+        return jsonify({'error': 'Not found'}), 404
+
+    encoding = static_assets.choose_encoding(asset, request.accept_encodings)
+    response = app.response_class(asset.variants[encoding], content_type=asset.content_type)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Hashed names change with the content, so they never need revalidating
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable' if hashed else 'no-cache'
+    response.set_etag(asset.etag(encoding))
+    return response.make_conditional(request)
+
+
 @app.route('/')
 def index():
-    return app.send_static_file('index.html')
+    return send_static_asset('index.html')
 
 
 @app.route('/test.html')
 def test_page():
-    return app.send_static_file('test.html')
+    return send_static_asset('test.html')
+
+
+@app.route('/static/<path:filename>')
+def static_file(filename):
+    return send_static_asset(filename)
 
 
 # Error handlers
@@ -785,13 +1536,59 @@ if __name__ == '__main__':
     # Initialize database on startup
     init_db()
 
+    # Hash and precompress the dashboard files
+    static_assets = StaticAssets(STATIC_PATH)
+
+    volumes = VolumeSet([DOWNLOAD_PATH, *DOWNLOAD_VOLUMES], VOLUME_POLICY, VolumeSet.parse_pins(VOLUME_PINS))
+
+    # Build the folder tree cache in the background
+    if len(volumes.roots) > 1:
+        folder_index = MultiRootFolderIndex(volumes.roots, ttl=FOLDER_INDEX_TTL,
+                                            track_sizes=FOLDER_INDEX_TRACK_SIZES)
+    else:
+        folder_index = FolderIndex(DOWNLOAD_PATH, ttl=FOLDER_INDEX_TTL, track_sizes=FOLDER_INDEX_TRACK_SIZES)
+    folder_index.start_warm_up()
+
     # Initialize background event loop
     init_background_loop()
 
+    # Start event loop health monitoring
+    loop_monitor = LoopMonitor(background_loop)
+    loop_monitor.start()
+    if SLOW_CALLBACK_THRESHOLD_MS > 0:
+        loop_monitor.enable_slow_callback_detection(SLOW_CALLBACK_THRESHOLD_MS)
+
     # Initialize download manager in the background loop
     import time
     time.sleep(0.1)  # Give background loop time to start
-    download_manager = DownloadManager(db_path=DB_PATH, download_path=DOWNLOAD_PATH)
+    settings_store = SettingsStore(DB_PATH)
+    download_manager = DownloadManager(db_path=DB_PATH, download_path=DOWNLOAD_PATH,
+                                       settings=settings_store, loop=background_loop,
+                                       transfer_mode=TRANSFER_MODE, write_mode=WRITE_MODE,
+                                       large_file_threshold=LARGE_FILE_THRESHOLD,
+                                       staging_path=STAGING_PATH, mover_concurrency=MOVER_CONCURRENCY,
+                                       mover_rate_limit_bps=MOVER_RATE_LIMIT_BPS, volumes=volumes,
+                                       probe_concurrency=PROBE_CONCURRENCY,
+                                       probe_filenames=PROBE_FILENAMES,
+                                       watchdog=WatchdogConfig(STALL_WINDOW, STALL_MIN_SPEED_BPS,
+                                                               STALL_MAX_RECONNECTS))
+    download_manager.folder_index = folder_index
+    background_loop.call_soon_threadsafe(download_manager.resume_moves)
+    settings_store.subscribe(on_settings_changed)
+    if CLUSTER_ROLE == 'coordinator':
+        run_async(download_manager.start_cluster(lease_seconds=CLUSTER_LEASE_SECONDS))
+    elif WORKER_PROCESSES > 0:
+        run_async(download_manager.start_workers(WORKER_PROCESSES))
+
+    if CLUSTER_ROLE == 'worker':
+        if not CLUSTER_COORDINATOR_URL:
+            raise SystemExit("CLUSTER_COORDINATOR_URL is required when CLUSTER_ROLE=worker")
+        cluster_worker = ClusterWorker(
+            CLUSTER_COORDINATOR_URL, CLUSTER_API_KEY, CLUSTER_NODE_ID,
+            CLUSTER_CAPACITY or settings_store.get('max_concurrent_downloads'),
+            DOWNLOAD_PATH, TRANSFER_MODE, WRITE_MODE, LARGE_FILE_THRESHOLD
+        )
+        asyncio.run_coroutine_threadsafe(cluster_worker.serve(), background_loop)
 
     # Start WebSocket broadcast task
     broadcast_task = asyncio.run_coroutine_threadsafe(broadcast_downloads(), background_loop)
@@ -801,10 +1598,28 @@ if __name__ == '__main__':
     print(f"Server directory: {SERVER_DIR}")
     print(f"Project root: {PROJECT_ROOT}")
     print(f"Download path: {DOWNLOAD_PATH}")
+    if DOWNLOAD_VOLUMES:
+        print(f"More download volumes: {', '.join(DOWNLOAD_VOLUMES)} (placement: {VOLUME_POLICY})")
     print(f"Data path: {DATA_PATH}")
     print(f"Database path: {DB_PATH}")
+    print(f"Transfer mode: {TRANSFER_MODE}")
+    if WRITE_MODE != 'cached':
+        print(f"Write mode: {WRITE_MODE} (files from {LARGE_FILE_THRESHOLD // 1048576} MB)")
+    if STAGING_PATH:
+        limit = f", {MOVER_RATE_LIMIT_BPS // 1048576} MB/s" if MOVER_RATE_LIMIT_BPS else ''
+        print(f"Staging path: {STAGING_PATH} (mover: {MOVER_CONCURRENCY} at a time{limit})")
+    print(f"Static assets: {len(static_assets.by_path)} files "
+          f"(precompressed: {', '.join(static_assets.encodings)})")
+    if CLUSTER_ROLE == 'coordinator':
+        print(f"Cluster coordinator (lease {CLUSTER_LEASE_SECONDS:g}s)")
+    elif WORKER_PROCESSES > 0:
+        print(f"Download worker processes: {WORKER_PROCESSES}")
+    if CLUSTER_ROLE == 'worker':
+        print(f"Cluster worker {CLUSTER_NODE_ID} -> {CLUSTER_COORDINATOR_URL}")
     print("Background event loop initialized")
     print("WebSocket broadcast task started")
+    if SLOW_CALLBACK_THRESHOLD_MS > 0:
+        print(f"Slow callback detector enabled ({SLOW_CALLBACK_THRESHOLD_MS} ms)")
     print("=" * 80)
 
     # Run Flask app
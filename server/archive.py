@@ -0,0 +1,377 @@
+import bisect
+import hashlib
+import os
+import stat
+import struct
+import tarfile
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from file_server import READ_CHUNK
+
+
+FORMATS = ('zip', 'tar')
+
+# In-progress files that never belong in an export
+SKIP_SUFFIXES = ('.ndownload', '.ndownload.segments', '.nmove', '.ndelete')
+
+# CRC-32s of exported files by (path, size, mtime_ns): a resumed ZIP export needs the
+# checksums of files it doesn't send again, and a cached one lets data go out with sendfile
+CRC_CACHE_SIZE = 100000
+_crc_cache: 'OrderedDict[Tuple[str, int, int], int]' = OrderedDict()
+_crc_lock = threading.Lock()
+
+ZIP64_LIMIT = 0xFFFFFFFF
+
+
+class ArchiveEntry:
+    """One file or directory of an export, at a fixed offset in the archive"""
+
+    __slots__ = ('name', 'path', 'size', 'mtime_ns', 'mode', 'is_dir', 'offset')
+
+    def __init__(self, name: str, path: str, st: os.stat_result, is_dir: bool):
+        self.name = name          # Path inside the archive (directories end with '/')
+        self.path = path
+        self.size = 0 if is_dir else st.st_size
+        self.mtime_ns = st.st_mtime_ns
+        self.mode = stat.S_IMODE(st.st_mode)
+        self.is_dir = is_dir
+        self.offset = 0
+
+
+def collect_entries(roots: List[str], folder: str, top: str) -> Optional[List[ArchiveEntry]]:
+    """Files and subfolders of folder on all roots, named top/..., in archive order
+
+    None if no root has the folder. A path present on several roots is taken
+    from the first; symlinks and in-progress temp files are left out.
+    """
+    entries = {}
+    found = False
+    for root in roots:
+        base = os.path.join(root, folder)
+        if not os.path.isdir(base):
+            continue
+        found = True
+        for directory, _, filenames in os.walk(base):
+            relative = os.path.relpath(directory, base).replace(os.sep, '/')
+            prefix = top if relative == '.' else f"{top}/{relative}"
+            try:
+                entries.setdefault(prefix + '/', ArchiveEntry(prefix + '/', directory, os.stat(directory), True))
+            except OSError:
+                continue
+            for filename in filenames:
+                if filename.endswith(SKIP_SUFFIXES):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                if stat.S_ISREG(st.st_mode):
+                    entries.setdefault(f"{prefix}/{filename}", ArchiveEntry(f"{prefix}/{filename}", path, st, False))
+    if not found:
+        return None
+    return [entries[name] for name in sorted(entries)]
+
+
+def _crc_key(entry: ArchiveEntry):
+    return entry.path, entry.size, entry.mtime_ns
+
+
+def cached_crc(entry: ArchiveEntry) -> Optional[int]:
+    with _crc_lock:
+        crc = _crc_cache.get(_crc_key(entry))
+        if crc is not None:
+            _crc_cache.move_to_end(_crc_key(entry))
+        return crc
+
+
+def store_crc(entry: ArchiveEntry, crc: int):
+    with _crc_lock:
+        _crc_cache[_crc_key(entry)] = crc
+        while len(_crc_cache) > CRC_CACHE_SIZE:
+            _crc_cache.popitem(last=False)
+
+
+def read_entry(entry: ArchiveEntry, start: int, end: int) -> Iterator[bytes]:
+    """entry's data between start and end, zero-padded if the file shrank since the layout"""
+    position = start
+    try:
+        with open(entry.path, 'rb') as f:
+            f.seek(start)
+            while position < end:
+                data = f.read(min(READ_CHUNK, end - position))
+                if not data:
+                    break
+                position += len(data)
+                yield data
+    except OSError:
+        pass  # Deleted since the layout: the rest is padding
+    while position < end:
+        size = min(READ_CHUNK, end - position)
+        position += size
+        yield bytes(size)
+
+
+def send_entry(sock, entry: ArchiveEntry, start: int, end: int) -> Iterator[bytes]:
+    """Like read_entry, but file data goes straight to sock with sendfile (yields padding only)"""
+    position = start
+    try:
+        with open(entry.path, 'rb') as f:
+            available = min(end, os.fstat(f.fileno()).st_size)
+            if available > position:
+                position += sock.sendfile(f, position, available - position)
+    except OSError:
+        pass
+    while position < end:
+        size = min(READ_CHUNK, end - position)
+        position += size
+        yield bytes(size)
+
+
+def entry_crc(entry: ArchiveEntry) -> int:
+    """CRC-32 of an entry's data (cached, otherwise read from disk)"""
+    crc = cached_crc(entry)
+    if crc is None:
+        crc = 0
+        for data in read_entry(entry, 0, entry.size):
+            crc = zlib.crc32(data, crc)
+        store_crc(entry, crc)
+    return crc
+
+
+# A part of the archive: (length, payload). The payload is a function returning the bytes
+# (headers, built only when sent) or the entry whose data fills the part.
+Part = Tuple[int, object]
+
+
+class Archive(ABC):
+    """Deterministic byte layout of an export, streamed without staging anything
+
+    Entries are laid out once per request from their stat results (name
+    order, sizes, mtimes), so the same folder state always produces the same
+    bytes and a byte range of the archive can be produced on its own: the
+    entry containing the start is found by bisecting the entry offsets and
+    only headers overlapping the range are built. Memory use is a few fields
+    per entry, never file data. The ETag covers the layout inputs, so If-Range
+    only resumes a download against an unchanged folder.
+    """
+
+    extension = ''
+    content_type = 'application/octet-stream'
+
+    def __init__(self, entries: List[ArchiveEntry]):
+        self.entries = entries
+        offset = 0
+        for entry in entries:
+            entry.offset = offset
+            offset += sum(length for length, _ in self.entry_parts(entry))
+        self.trailer_offset = offset
+        self.size = offset + sum(length for length, _ in self.trailer_parts())
+        self.offsets = [entry.offset for entry in entries]
+
+        digest = hashlib.sha256(self.extension.encode())
+        for entry in entries:
+            digest.update(f"{entry.name}\0{entry.size}\0{entry.mtime_ns}\0{entry.mode}\n".encode('utf-8', 'surrogateescape'))
+        self.etag = digest.hexdigest()[:24]
+
+    @abstractmethod
+    def entry_parts(self, entry: ArchiveEntry) -> List[Part]:
+        """Header, data and descriptor parts of entry, as (length, payload) pairs"""
+
+    @abstractmethod
+    def trailer_parts(self) -> Iterator[Part]:
+        """Parts after the last entry (end-of-archive blocks, central directory)"""
+
+    def send_data(self, entry: ArchiveEntry, start: int, end: int, sock) -> Iterator[bytes]:
+        """Entry data between start and end (sent with sendfile when sock is given)"""
+        if sock is not None:
+            return send_entry(sock, entry, start, end)
+        return read_entry(entry, start, end)
+
+    def parts_from(self, start: int) -> Iterator[Tuple[int, int, object]]:
+        """(offset, length, payload) of every part from the one containing start on"""
+        if start < self.trailer_offset:
+            index = max(0, bisect.bisect_right(self.offsets, start) - 1)
+            for entry in self.entries[index:]:
+                offset = entry.offset
+                for length, payload in self.entry_parts(entry):
+                    yield offset, length, payload
+                    offset += length
+        offset = self.trailer_offset
+        for length, payload in self.trailer_parts():
+            yield offset, length, payload
+            offset += length
+
+    def iter_range(self, start: int, end: int, sock=None) -> Iterator[bytes]:
+        """Bytes start..end of the archive
+
+        With sock (the development server's connection) an empty chunk goes
+        first so the server has sent the headers before data is written to
+        the socket directly.
+        """
+        if sock is not None:
+            yield b''
+        for offset, length, payload in self.parts_from(start):
+            if offset >= end:
+                break
+            lo = max(start, offset) - offset
+            hi = min(end, offset + length) - offset
+            if hi <= lo:
+                continue
+            if isinstance(payload, ArchiveEntry):
+                yield from self.send_data(payload, lo, hi, sock)
+            else:
+                yield payload()[lo:hi]
+
+
+class TarArchive(Archive):
+    """POSIX (pax) tar: header blocks, data padded to 512 bytes, two zero blocks, record padding"""
+
+    extension = '.tar'
+    content_type = 'application/x-tar'
+
+    def _header(self, entry: ArchiveEntry) -> bytes:
+        info = tarfile.TarInfo(entry.name.rstrip('/'))
+        info.type = tarfile.DIRTYPE if entry.is_dir else tarfile.REGTYPE
+        info.size = entry.size
+        info.mtime = entry.mtime_ns // 1_000_000_000
+        info.mode = entry.mode
+        return info.tobuf(format=tarfile.PAX_FORMAT, encoding='utf-8', errors='surrogateescape')
+
+    def entry_parts(self, entry: ArchiveEntry) -> List[Part]:
+        header = self._header(entry)
+        parts = [(len(header), lambda: header)]
+        if entry.size:
+            padding = -entry.size % tarfile.BLOCKSIZE
+            parts.append((entry.size, entry))
+            if padding:
+                parts.append((padding, lambda: bytes(padding)))
+        return parts
+
+    def trailer_parts(self) -> Iterator[Part]:
+        end = self.trailer_offset + 2 * tarfile.BLOCKSIZE
+        length = 2 * tarfile.BLOCKSIZE + (-end % tarfile.RECORDSIZE)
+        yield length, lambda: bytes(length)
+
+
+class ZipArchive(Archive):
+    """Stored (uncompressed) ZIP with ZIP64 extensions where sizes or offsets need them
+
+    CRC-32s aren't known before a file is read, so each file's local header
+    has flag bit 3 set and the CRC follows the data in a data descriptor
+    (sizes are still given up front, for streaming readers). File data is
+    read through Python to compute the CRC the first time a file is exported;
+    once its CRC is cached it goes out with sendfile like a tar.
+    """
+
+    extension = '.zip'
+    content_type = 'application/zip'
+
+    FLAG_DESCRIPTOR = 0x08
+    FLAG_UTF8 = 0x800
+
+    @staticmethod
+    def _dos_time(entry: ArchiveEntry) -> Tuple[int, int]:
+        t = time.localtime(entry.mtime_ns // 1_000_000_000)
+        if t.tm_year < 1980:
+            return 0, (1 << 5) | 1
+        return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+                ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+    @staticmethod
+    def _name(entry: ArchiveEntry) -> bytes:
+        return entry.name.encode('utf-8', 'surrogateescape')
+
+    def _flags(self, entry: ArchiveEntry) -> int:
+        return self.FLAG_UTF8 if entry.is_dir else self.FLAG_UTF8 | self.FLAG_DESCRIPTOR
+
+    def _local_header(self, entry: ArchiveEntry) -> bytes:
+        zip64 = entry.size >= ZIP64_LIMIT
+        extra = struct.pack('<HHQQ', 1, 16, entry.size, entry.size) if zip64 else b''
+        size = ZIP64_LIMIT if zip64 else entry.size
+        name = self._name(entry)
+        mod_time, mod_date = self._dos_time(entry)
+        return struct.pack('<IHHHHHIIIHH', 0x04034b50, 45 if zip64 else 20, self._flags(entry), 0,
+                           mod_time, mod_date, 0, size, size, len(name), len(extra)) + name + extra
+
+    def _descriptor(self, entry: ArchiveEntry) -> bytes:
+        if entry.size >= ZIP64_LIMIT:
+            return struct.pack('<IIQQ', 0x08074b50, entry_crc(entry), entry.size, entry.size)
+        return struct.pack('<IIII', 0x08074b50, entry_crc(entry), entry.size, entry.size)
+
+    def _central_header(self, entry: ArchiveEntry) -> bytes:
+        extra_fields = b''
+        size = entry.size
+        offset = entry.offset
+        if size >= ZIP64_LIMIT:
+            extra_fields += struct.pack('<QQ', size, size)
+            size = ZIP64_LIMIT
+        if offset >= ZIP64_LIMIT:
+            extra_fields += struct.pack('<Q', offset)
+            offset = ZIP64_LIMIT
+        extra = struct.pack('<HH', 1, len(extra_fields)) + extra_fields if extra_fields else b''
+        name = self._name(entry)
+        mod_time, mod_date = self._dos_time(entry)
+        version = 45 if extra else 20
+        crc = 0 if entry.is_dir else entry_crc(entry)
+        file_type = stat.S_IFDIR if entry.is_dir else stat.S_IFREG
+        external = ((file_type | entry.mode) << 16) | (0x10 if entry.is_dir else 0)
+        return struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | version, version,
+                           self._flags(entry), 0, mod_time, mod_date, crc, size, size,
+                           len(name), len(extra), 0, 0, 0, external, offset) + name + extra
+
+    def _central_length(self, entry: ArchiveEntry) -> int:
+        extra = (16 if entry.size >= ZIP64_LIMIT else 0) + (8 if entry.offset >= ZIP64_LIMIT else 0)
+        return 46 + len(self._name(entry)) + (4 + extra if extra else 0)
+
+    def entry_parts(self, entry: ArchiveEntry) -> List[Part]:
+        header = self._local_header(entry)
+        parts = [(len(header), lambda: header)]
+        if not entry.is_dir:
+            parts.append((entry.size, entry))
+            parts.append((24 if entry.size >= ZIP64_LIMIT else 16, lambda: self._descriptor(entry)))
+        return parts
+
+    def trailer_parts(self) -> Iterator[Part]:
+        directory_size = 0
+        for entry in self.entries:
+            length = self._central_length(entry)
+            directory_size += length
+            yield length, (lambda e=entry: self._central_header(e))
+
+        directory_offset = self.trailer_offset
+        count = len(self.entries)
+        if count >= 0xFFFF or directory_offset >= ZIP64_LIMIT or directory_size >= ZIP64_LIMIT:
+            record_offset = directory_offset + directory_size
+            yield 56, lambda: struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, (3 << 8) | 45, 45, 0, 0,
+                                          count, count, directory_size, directory_offset)
+            yield 20, lambda: struct.pack('<IIQI', 0x07064b50, 0, record_offset, 1)
+        yield 22, lambda: struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                                      min(directory_size, ZIP64_LIMIT), min(directory_offset, ZIP64_LIMIT), 0)
+
+    def send_data(self, entry: ArchiveEntry, start: int, end: int, sock) -> Iterator[bytes]:
+        if sock is not None and cached_crc(entry) is not None:
+            return send_entry(sock, entry, start, end)
+        if start == 0 and end == entry.size:
+            return self._read_with_crc(entry)
+        return read_entry(entry, start, end)
+
+    def _read_with_crc(self, entry: ArchiveEntry) -> Iterator[bytes]:
+        crc = 0
+        for data in read_entry(entry, 0, entry.size):
+            crc = zlib.crc32(data, crc)
+            yield data
+        store_crc(entry, crc)
+
+
+def open_archive(fmt: str, entries: List[ArchiveEntry]) -> Archive:
+    if fmt == 'tar':
+        return TarArchive(entries)
+    if fmt == 'zip':
+        return ZipArchive(entries)
+    raise ValueError(f"Unknown archive format '{fmt}'")
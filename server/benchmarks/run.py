@@ -0,0 +1,632 @@
+"""Benchmark runner for the download engine.
+
+Starts the stub server (stub_server.py) in a child process, drives
+DownloadManager through a set of scenarios and writes the results as JSON so
+runs can be compared against each other.
+
+    python benchmarks/run.py                          # all scenarios
+    python benchmarks/run.py -s huge_file -s tiny_files --scale 0.1
+    python benchmarks/run.py -o after.json --compare before.json
+
+Every scenario reports wall time, bytes moved, MB/s, CPU seconds per GB,
+event-loop lag (mean/p99/max) and peak RSS, plus scenario-specific numbers.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, SERVER_DIR)
+
+from download_manager import Download, DownloadManager  # noqa: E402
+
+MB = 1024 * 1024
+GB = 1024 * MB
+
+# Metric name -> True if higher is better (used by --compare)
+METRIC_DIRECTIONS = {
+    'mb_per_s': True,
+    'wall_s': False,
+    'cpu_s_per_gb': False,
+    'loop_lag_mean_ms': False,
+    'loop_lag_p99_ms': False,
+    'loop_lag_max_ms': False,
+    'rss_peak_mb': False,
+    'files_per_s': True,
+    'rate_accuracy_pct': None,  # Closer to 100 is better, reported only
+    'cpu_ms_per_tick': False,
+    'bytes_per_tick': False,
+    'load_s': False,
+    'rss_delta_mb': False,
+    'page_cache_growth_mb': False,
+}
+
+
+# ---------------------------------------------------------------------------
+# Measurement helpers
+# ---------------------------------------------------------------------------
+
+def page_cache_mb() -> Optional[float]:
+    """Page cache size of the machine in MB (Linux only; other processes add noise)"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('Cached:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Fallback: lifetime peak (KB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (MB if sys.platform == 'darwin' else 1024)
+
+
+class LoopProbe:
+    """Samples event-loop lag and RSS while a scenario runs"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.lags = []
+        self.rss_peak = 0.0
+        self.task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - expected))
+            self.rss_peak = max(self.rss_peak, current_rss_mb())
+
+    def start(self):
+        self.rss_peak = current_rss_mb()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self.task
+
+    def summary(self) -> dict:
+        if not self.lags:
+            return {'loop_lag_mean_ms': 0.0, 'loop_lag_p99_ms': 0.0,
+                    'loop_lag_max_ms': 0.0, 'rss_peak_mb': round(self.rss_peak, 1)}
+        ordered = sorted(self.lags)
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        return {
+            'loop_lag_mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+            'loop_lag_p99_ms': round(p99 * 1000, 2),
+            'loop_lag_max_ms': round(ordered[-1] * 1000, 2),
+            'rss_peak_mb': round(self.rss_peak, 1),
+        }
+
+
+class Measurement:
+    """Wall clock, CPU time and loop probe around one scenario"""
+
+    async def __aenter__(self):
+        self.probe = LoopProbe()
+        self.probe.start()
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.wall = time.perf_counter() - self.wall_start
+        self.cpu = time.process_time() - self.cpu_start
+        await self.probe.stop()
+        return False
+
+    def metrics(self, bytes_moved: int = 0) -> dict:
+        result = {
+            'wall_s': round(self.wall, 3),
+            'cpu_s': round(self.cpu, 3),
+            'bytes': bytes_moved,
+        }
+        if bytes_moved:
+            result['mb_per_s'] = round(bytes_moved / MB / self.wall, 2) if self.wall else 0.0
+            result['cpu_s_per_gb'] = round(self.cpu / (bytes_moved / GB), 3)
+        result.update(self.probe.summary())
+        return result
+
+
+# ---------------------------------------------------------------------------
+# Environment helpers
+# ---------------------------------------------------------------------------
+
+@contextlib.contextmanager
+def stub_server(*extra_args):
+    """Run stub_server.py in a child process and yield its base URL"""
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, 'stub_server.py'), '--port', '0', *extra_args],
+        stdout=subprocess.PIPE, text=True
+    )
+    try:
+        line = proc.stdout.readline().strip()
+        if not line.startswith('READY '):
+            raise RuntimeError(f"Stub server failed to start: {line!r}")
+        yield f"http://127.0.0.1:{line.split()[1]}"
+    finally:
+        proc.terminate()
+        proc.wait(timeout=5)
+
+
+def init_db(db_path: str):
+    """Create a fresh database from db/schema.sql"""
+    conn = sqlite3.connect(db_path)
+    with open(os.path.join(SERVER_DIR, 'db', 'schema.sql')) as f:
+        conn.executescript(f.read())
+    conn.commit()
+    conn.close()
+
+
+def new_environment(workdir: str, name: str):
+    """Create an isolated download directory and database for one scenario"""
+    root = os.path.join(workdir, name)
+    shutil.rmtree(root, ignore_errors=True)
+    download_path = os.path.join(root, 'downloads')
+    os.makedirs(download_path)
+    db_path = os.path.join(root, 'downloads.db')
+    init_db(db_path)
+    return db_path, download_path
+
+
+async def wait_until_finished(manager: DownloadManager, ids, timeout: float):
+    """Poll until every download reaches a terminal status"""
+    deadline = time.monotonic() + timeout
+    pending = set(ids)
+    while pending and time.monotonic() < deadline:
+        pending = {i for i in pending
+                   if manager.downloads[i].status not in ('completed', 'failed')}
+        await asyncio.sleep(0.05)
+    statuses = [manager.downloads[i].status for i in ids]
+    return statuses.count('completed'), statuses.count('failed'), len(pending)
+
+
+async def run_downloads(base_url: str, workdir: str, name: str, files, max_concurrent: int,
+                        rate_limit: int = 0, timeout: float = 3600, transfer_mode: str = 'stream',
+                        workers: int = 0, write_mode: str = 'cached'):
+    """Queue ``files`` ([(filename, size, query[, mirror queries])]) and wait for them to finish"""
+    db_path, download_path = new_environment(workdir, name)
+    manager = DownloadManager(db_path=db_path, download_path=download_path,
+                              transfer_mode=transfer_mode, write_mode=write_mode)
+    cache_before = page_cache_mb()
+    manager.max_concurrent_downloads = max_concurrent
+    if rate_limit:
+        await manager.set_rate_limit(rate_limit)
+    if workers:
+        await manager.start_workers(workers)
+
+    async with Measurement() as m:
+        ids = []
+        for filename, size, query, *mirror_queries in files:
+            url = f"{base_url}/data/{filename}?size={size}{query}"
+            mirrors = [f"{url}{q}" for q in mirror_queries[0]] if mirror_queries else None
+            ids.append(await manager.add_download(url, 'bench', mirrors=mirrors))
+            # Each API request is a separate trip through the loop
+            await asyncio.sleep(0)
+        completed, failed, unfinished = await wait_until_finished(manager, ids, timeout)
+
+    await manager.stop_workers()
+
+    moved = sum(manager.downloads[i].downloaded_bytes for i in ids)
+    result = m.metrics(moved)
+    result.update({'files': len(ids), 'completed': completed, 'failed': failed,
+                   'unfinished': unfinished})
+    if write_mode != 'cached' or name.startswith('huge_file'):
+        # Background fadvise work finishes shortly after the last write
+        await asyncio.sleep(1)
+        cache_after = page_cache_mb()
+        if cache_before is not None and cache_after is not None:
+            result['page_cache_growth_mb'] = round(cache_after - cache_before, 1)
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Scenarios
+# ---------------------------------------------------------------------------
+
+async def scenario_huge_file(ctx):
+    """One large file at full speed - raw per-byte engine cost"""
+    size = max(MB, int(ctx.scale * 2 * GB))
+    return await run_downloads(ctx.base_url, ctx.workdir, 'huge_file',
+                               [('huge.bin', size, '')], max_concurrent=1)
+
+
+async def scenario_huge_file_direct(ctx):
+    """huge_file with TRANSFER_MODE=direct - libcurl writes the file itself"""
+    size = max(MB, int(ctx.scale * 2 * GB))
+    return await run_downloads(ctx.base_url, ctx.workdir, 'huge_file_direct',
+                               [('huge.bin', size, '')], max_concurrent=1,
+                               transfer_mode='direct')
+
+
+async def scenario_huge_file_fadvise(ctx):
+    """huge_file with WRITE_MODE=fadvise - written data dropped from the page cache"""
+    size = max(MB, int(ctx.scale * 2 * GB))
+    return await run_downloads(ctx.base_url, ctx.workdir, 'huge_file_fadvise',
+                               [('huge.bin', size, '')], max_concurrent=1, write_mode='fadvise')
+
+
+async def scenario_huge_file_odirect(ctx):
+    """huge_file with WRITE_MODE=odirect - aligned writes that bypass the page cache"""
+    size = max(MB, int(ctx.scale * 2 * GB))
+    return await run_downloads(ctx.base_url, ctx.workdir, 'huge_file_odirect',
+                               [('huge.bin', size, '')], max_concurrent=1, write_mode='odirect')
+
+
+async def scenario_parallel_workers(ctx):
+    """Four large files over two worker processes (CPU is the workers', not counted here)"""
+    size = max(MB, int(ctx.scale * 512 * MB))
+    files = [(f"parallel-{i}.bin", size, '') for i in range(4)]
+    return await run_downloads(ctx.base_url, ctx.workdir, 'parallel_workers', files,
+                               max_concurrent=4, workers=2)
+
+
+async def scenario_mirrors(ctx):
+    """One file from three mirrors capped at 4 MB/s each - combined throughput"""
+    size = max(MB, int(ctx.scale * 256 * MB))
+    # Distinct URLs on the same stub; the primary's own cap applies to all (per connection)
+    files = [('mirrored.bin', size, f'&bw={4 * MB}', ['&mirror=1', '&mirror=2'])]
+    return await run_downloads(ctx.base_url, ctx.workdir, 'mirrors', files, max_concurrent=1)
+
+
+async def scenario_tiny_files(ctx):
+    """Many tiny files - per-download overhead (session setup, DB rows, queue ticks)"""
+    count = max(10, int(ctx.scale * 10000))
+    files = [(f"tiny-{i:05d}.bin", 4096, '') for i in range(count)]
+    result = await run_downloads(ctx.base_url, ctx.workdir, 'tiny_files', files,
+                                 max_concurrent=32)
+    result['files_per_s'] = round(result['completed'] / result['wall_s'], 2) if result['wall_s'] else 0.0
+    return result
+
+
+async def scenario_rate_limited_mix(ctx):
+    """Mixed sizes under a global rate limit - limiter accuracy and overhead"""
+    limit = 20 * MB
+    sizes = [int(ctx.scale * s) or 1024 for s in (64 * MB, 32 * MB, 8 * MB, 8 * MB, MB, MB, 256 * 1024)]
+    files = [(f"mix-{i}.bin", size, '') for i, size in enumerate(sizes)]
+    result = await run_downloads(ctx.base_url, ctx.workdir, 'rate_limited_mix', files,
+                                 max_concurrent=4, rate_limit=limit)
+    achieved = result['bytes'] / result['wall_s'] if result['wall_s'] else 0
+    result['rate_limit_bps'] = limit
+    result['rate_accuracy_pct'] = round(achieved / limit * 100, 1)
+    return result
+
+
+async def scenario_slow_flaky_mix(ctx):
+    """High latency, throttled and failing origins - resilience under bad networks"""
+    count = max(4, int(ctx.scale * 40))
+    files = []
+    for i in range(count):
+        query = '&latency=0.2&bw=2000000'
+        if i % 4 == 1:
+            query += '&drop=0.5'
+        elif i % 4 == 2:
+            query += '&error=0.5'
+        files.append((f"flaky-{i}.bin", 4 * MB, query))
+    return await run_downloads(ctx.base_url, ctx.workdir, 'slow_flaky_mix', files,
+                               max_concurrent=8)
+
+
+class FakeWebSocket:
+    """Stands in for a flask-sock connection and counts what it is sent"""
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        self.last = None
+
+    def send(self, message):
+        self.messages += 1
+        self.bytes += len(message)
+        self.last = message
+
+
+async def scenario_websocket_clients(ctx):
+    """Broadcaster cost with many clients and a large download list"""
+    import app
+
+    clients = max(10, int(ctx.scale * 200))
+    download_count = max(50, int(ctx.scale * 2000))
+    duration = max(3.0, ctx.scale * 10)
+
+    db_path, download_path = new_environment(ctx.workdir, 'websocket_clients')
+    manager = DownloadManager(db_path=db_path, download_path=download_path)
+    statuses = ['downloading', 'queued', 'paused', 'completed']
+    for i in range(download_count):
+        download = Download(str(uuid.uuid4()), f"https://example.com/files/some/deep/path/file-{i}.iso",
+                            'bench', f"file-{i}.iso", db_path, download_path, manager)
+        download.status = statuses[i % len(statuses)]
+        download.total_bytes = 4 * GB
+        download.downloaded_bytes = i * MB
+        download.speed_bps = 1000000 + i
+        manager.downloads[download.id] = download
+
+    previous_manager = app.download_manager
+    app.download_manager = manager
+    fakes = [FakeWebSocket() for _ in range(clients)]
+    app.websocket_clients.update(fakes)
+    try:
+        async with Measurement() as m:
+            task = asyncio.create_task(app.broadcast_downloads())
+            await asyncio.sleep(duration)
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+    finally:
+        app.websocket_clients.difference_update(fakes)
+        app.download_manager = previous_manager
+
+    ticks = max(1, fakes[0].messages)
+    result = m.metrics()
+    result.update({
+        'clients': clients,
+        'downloads': download_count,
+        'ticks': ticks,
+        'cpu_ms_per_tick': round(m.cpu / ticks * 1000, 2),
+        'bytes_per_tick': sum(f.bytes for f in fakes) // ticks,
+    })
+    return result
+
+
+async def scenario_websocket_encodings(ctx):
+    """Broadcaster cost and payload size per negotiated WebSocket encoding"""
+    import zlib
+    import app
+    from ws_encoding import available_encodings
+
+    encodings = available_encodings()
+    clients_per_encoding = max(5, int(ctx.scale * 50))
+    download_count = max(50, int(ctx.scale * 2000))
+    duration = max(3.0, ctx.scale * 10)
+
+    db_path, download_path = new_environment(ctx.workdir, 'websocket_encodings')
+    manager = DownloadManager(db_path=db_path, download_path=download_path)
+    statuses = ['downloading', 'queued', 'paused', 'completed']
+    for i in range(download_count):
+        download = Download(str(uuid.uuid4()), f"https://example.com/files/some/deep/path/file-{i}.iso",
+                            'bench', f"file-{i}.iso", db_path, download_path, manager)
+        download.status = statuses[i % len(statuses)]
+        download.total_bytes = 4 * GB
+        download.downloaded_bytes = i * MB
+        download.speed_bps = 1000000 + i
+        manager.downloads[download.id] = download
+
+    previous_manager = app.download_manager
+    app.download_manager = manager
+    fakes = {encoding: [FakeWebSocket() for _ in range(clients_per_encoding)] for encoding in encodings}
+    for encoding, group in fakes.items():
+        for fake in group:
+            app.websocket_encodings[fake] = encoding
+            app.websocket_clients.add(fake)
+    try:
+        async with Measurement() as m:
+            task = asyncio.create_task(app.broadcast_downloads())
+            await asyncio.sleep(duration)
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+    finally:
+        for group in fakes.values():
+            for fake in group:
+                app.websocket_clients.discard(fake)
+                app.websocket_encodings.pop(fake, None)
+        app.download_manager = previous_manager
+
+    result = m.metrics()
+    result.update({'clients': clients_per_encoding * len(encodings), 'downloads': download_count})
+    ticks = max(1, fakes['json'][0].messages)
+    result['cpu_ms_per_tick'] = round(m.cpu / ticks * 1000, 2)
+    for encoding, group in fakes.items():
+        last = group[0].last or b''
+        if isinstance(last, str):
+            last = last.encode()
+        # What permessage-deflate puts on the wire for the same message
+        compressor = zlib.compressobj(wbits=-15)
+        deflated = len(compressor.compress(last) + compressor.flush(zlib.Z_SYNC_FLUSH))
+        result[f"{encoding}_bytes_per_message"] = len(last)
+        result[f"{encoding}_deflated_bytes_per_message"] = deflated
+    return result
+
+
+async def scenario_restart_10k(ctx):
+    """Startup with a large resumable backlog in the database"""
+    rows = max(100, int(ctx.scale * 10000))
+    db_path, download_path = new_environment(ctx.workdir, 'restart_10k')
+    conn = sqlite3.connect(db_path)
+    statuses = ['queued', 'paused', 'downloading']
+    conn.executemany(
+        "INSERT INTO downloads (id, url, filename, folder, status, downloaded_bytes, total_bytes) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(str(uuid.uuid4()), f"https://example.com/f/{i}.bin", f"{i}.bin", 'bench',
+          statuses[i % len(statuses)], i * 1024, 10 * MB) for i in range(rows)]
+    )
+    conn.commit()
+    conn.close()
+
+    rss_before = current_rss_mb()
+    async with Measurement() as m:
+        load_start = time.perf_counter()
+        manager = DownloadManager(db_path=db_path, download_path=download_path)
+        load_s = time.perf_counter() - load_start
+    result = m.metrics()
+    result.update({
+        'rows': rows,
+        'loaded': len(manager.downloads),
+        'load_s': round(load_s, 3),
+        'rss_delta_mb': round(current_rss_mb() - rss_before, 1),
+    })
+    return result
+
+
+async def scenario_crawl_tree(ctx):
+    """Crawl a large autoindex tree and bulk-enqueue it (downloads stay paused)"""
+    files_per_dir = max(10, int(ctx.scale * 500))
+    db_path, download_path = new_environment(ctx.workdir, 'crawl_tree')
+    manager = DownloadManager(db_path=db_path, download_path=download_path)
+    manager.global_paused = True
+
+    async with Measurement() as m:
+        crawl_id = await manager.start_crawl(f"{ctx.base_url}/tree/10x{files_per_dir}x2/",
+                                             'bench', max_depth=2, concurrency=8)
+        crawl = manager.crawls[crawl_id]
+        await crawl.task
+
+    result = m.metrics()
+    result.update({
+        'status': crawl.status,
+        'pages': crawl.pages_fetched,
+        'files_queued': crawl.files_queued,
+        'files_per_s': round(crawl.files_queued / m.wall, 1) if m.wall else 0.0,
+    })
+    return result
+
+
+SCENARIOS = {
+    'huge_file': scenario_huge_file,
+    'huge_file_direct': scenario_huge_file_direct,
+    'huge_file_fadvise': scenario_huge_file_fadvise,
+    'huge_file_odirect': scenario_huge_file_odirect,
+    'parallel_workers': scenario_parallel_workers,
+    'mirrors': scenario_mirrors,
+    'tiny_files': scenario_tiny_files,
+    'rate_limited_mix': scenario_rate_limited_mix,
+    'slow_flaky_mix': scenario_slow_flaky_mix,
+    'websocket_clients': scenario_websocket_clients,
+    'websocket_encodings': scenario_websocket_encodings,
+    'restart_10k': scenario_restart_10k,
+    'crawl_tree': scenario_crawl_tree,
+}
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=SERVER_DIR, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare_results(current: dict, previous: dict, threshold: float) -> int:
+    """Print a per-metric comparison and return the number of regressions"""
+    regressions = 0
+    print(f"\nComparison against {previous['meta'].get('git_revision', '?')} "
+          f"({previous['meta'].get('timestamp', '?')})")
+    for name, metrics in current['scenarios'].items():
+        old = previous['scenarios'].get(name)
+        if not old:
+            continue
+        print(f"  {name}")
+        for key, higher_is_better in METRIC_DIRECTIONS.items():
+            if key not in metrics or key not in old or not old[key]:
+                continue
+            change = (metrics[key] - old[key]) / abs(old[key]) * 100
+            flag = ''
+            if higher_is_better is not None:
+                worse = -change if higher_is_better else change
+                if worse > threshold:
+                    flag = '  REGRESSION'
+                    regressions += 1
+            print(f"    {key:<20} {old[key]:>12} -> {metrics[key]:>12}  ({change:+.1f}%){flag}")
+    return regressions
+
+
+async def run_scenarios(args, base_url: str) -> dict:
+    ctx = argparse.Namespace(base_url=base_url, workdir=args.workdir, scale=args.scale)
+    results = {}
+    for name in args.scenario or list(SCENARIOS):
+        print(f"Running {name} ...", flush=True)
+        output = io.StringIO()
+        redirect = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(output)
+        with redirect:
+            results[name] = await SCENARIOS[name](ctx)
+        print('  ' + ', '.join(f"{k}={v}" for k, v in results[name].items()), flush=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the nas-downloader engine')
+    parser.add_argument('-s', '--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='Scenario to run (repeatable, default: all)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Multiply sizes/counts/durations (e.g. 0.1 for a quick run)')
+    parser.add_argument('-o', '--output', default='bench-results.json',
+                        help='Where to write machine-readable results')
+    parser.add_argument('--compare', help='Previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Percent change counted as a regression (default: 10)')
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help='Exit with status 1 if any regression is detected')
+    parser.add_argument('--workdir', help='Scratch directory (default: a temp dir, removed afterwards)')
+    parser.add_argument('--verbose', action='store_true', help='Show download manager logging')
+    args = parser.parse_args(argv)
+
+    cleanup = args.workdir is None
+    args.workdir = args.workdir or tempfile.mkdtemp(prefix='nas-bench-')
+    os.makedirs(args.workdir, exist_ok=True)
+
+    try:
+        with stub_server() as base_url:
+            scenarios = asyncio.run(run_scenarios(args, base_url))
+    finally:
+        if cleanup:
+            shutil.rmtree(args.workdir, ignore_errors=True)
+
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'scale': args.scale,
+        },
+        'scenarios': scenarios,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        regressions = compare_results(results, previous, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+"""Local HTTP stand-in server for benchmarks.
+
+Serves deterministic synthetic files so the download engine can be driven
+without touching the internet. Behaviour is configurable per server (command
+line flags) and per request (query string), so a single server can mix fast,
+slow, throttled and flaky files:
+
+    GET /data/<name>?size=1048576&latency=0.05&bw=5000000&ranges=0&error=0.1&drop=0.1
+
+Query parameters:
+    size     File size in bytes (default: --default-size)
+    latency  Seconds to wait before sending the response headers
+    bw       Per-connection bandwidth cap in bytes/sec (0 = unlimited)
+    ranges   1 to honour Range requests, 0 to always send the full file
+    error    Probability (0-1) of answering 500 instead of the file
+    drop     Probability (0-1) of closing the connection halfway through
+
+Synthetic autoindex trees for crawl benchmarks live under ``/tree/``. The
+first path segment encodes the shape as ``<dirs>x<files>x<depth>``; every
+directory lists ``dirs`` subdirectories (until ``depth``) and ``files`` files,
+Apache-style, and the files are served like ``/data/`` files:
+
+    GET /tree/4x50x2/          -> listing with 4 subdirectories and 50 files
+    GET /tree/4x50x2/d1/f3.bin -> default-size synthetic file
+
+Byte N of every file is N % 251, so a resumed download can be verified
+without keeping a copy of the source around.
+
+Run standalone with ``python stub_server.py --port 8800``. When started with
+``--port 0`` the chosen port is printed as ``READY <port>`` on stdout.
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Pattern block reused for every response body (multiple of 251 so offsets line up)
+PATTERN_PERIOD = 251
+BLOCK = bytes(i % PATTERN_PERIOD for i in range(PATTERN_PERIOD)) * 1044  # ~256 KiB
+
+
+def pattern_bytes(offset: int, length: int) -> bytes:
+    """Return ``length`` bytes of the synthetic file starting at ``offset``"""
+    start = offset % PATTERN_PERIOD
+    out = bytearray()
+    while length > 0:
+        piece = BLOCK[start:start + length]
+        out += piece
+        length -= len(piece)
+        start = 0
+    return bytes(out)
+
+
+class StubConfig:
+    """Server-wide defaults, overridable per request via the query string"""
+
+    def __init__(self, default_size: int = 1024 * 1024, latency: float = 0.0,
+                 bandwidth: int = 0, ranges: bool = True, error_rate: float = 0.0,
+                 drop_rate: float = 0.0):
+        self.default_size = default_size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.ranges = ranges
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Request handler for synthetic files"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'nas-downloader-stub/1.0'
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable
+        pass
+
+    def _options(self):
+        config = self.server.config
+        query = parse_qs(urlparse(self.path).query)
+
+        def get(name, default, cast):
+            if name in query:
+                try:
+                    return cast(query[name][0])
+                except ValueError:
+                    return default
+            return default
+
+        return {
+            'size': get('size', config.default_size, int),
+            'latency': get('latency', config.latency, float),
+            'bw': get('bw', config.bandwidth, int),
+            'ranges': get('ranges', int(config.ranges), int) == 1,
+            'error': get('error', config.error_rate, float),
+            'drop': get('drop', config.drop_rate, float),
+        }
+
+    def _parse_range(self, size: int):
+        """Return (start, end) for a single ``bytes=`` range, or None"""
+        header = self.headers.get('Range')
+        if not header or not header.startswith('bytes='):
+            return None
+        spec = header[len('bytes='):].split(',')[0].strip()
+        start_str, _, end_str = spec.partition('-')
+        try:
+            if start_str == '':
+                length = int(end_str)
+                return max(0, size - length), size - 1
+            start = int(start_str)
+            end = int(end_str) if end_str else size - 1
+        except ValueError:
+            return None
+        return start, min(end, size - 1)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def _send_listing(self, path: str, send_body: bool):
+        """Apache-style autoindex page for a /tree/<dirs>x<files>x<depth>/... directory"""
+        parts = [p for p in path.split('/') if p][1:]
+        try:
+            dirs, files, depth = (int(n) for n in parts[0].split('x'))
+        except (IndexError, ValueError):
+            self.send_error(404)
+            return
+        level = len(parts) - 1
+
+        rows = ['<a href="?C=N;O=D">Name</a>', '<a href="../">Parent Directory</a>']
+        if level < depth:
+            rows += [f'<a href="d{i}/">d{i}/</a>' for i in range(dirs)]
+        rows += [f'<a href="f{i}.bin">f{i}.bin</a>' for i in range(files)]
+        body = ('<html><head><title>Index of ' + path + '</title></head><body><pre>\n'
+                + '\n'.join(rows) + '\n</pre></body></html>\n').encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html;charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _respond(self, send_body: bool):
+        path = urlparse(self.path).path
+        if path.startswith('/tree/') and path.endswith('/'):
+            self.server.stats_request()
+            self._send_listing(path, send_body)
+            return
+        if not path.startswith(('/data/', '/tree/')):
+            self.send_error(404)
+            return
+
+        opts = self._options()
+        self.server.stats_request()
+
+        if opts['latency'] > 0:
+            time.sleep(opts['latency'])
+
+        if opts['error'] > 0 and random.random() < opts['error']:
+            self.server.stats_error()
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        size = opts['size']
+        start, end = 0, size - 1
+        status = 200
+        byte_range = self._parse_range(size) if opts['ranges'] else None
+        if byte_range is not None:
+            start, end = byte_range
+            if start >= size or start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        length = end - start + 1 if size > 0 else 0
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(length))
+        self.send_header('ETag', f'"stub-{size}"')
+        if opts['ranges']:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+
+        if not send_body or length == 0:
+            return
+
+        drop_at = None
+        if opts['drop'] > 0 and random.random() < opts['drop']:
+            drop_at = length // 2
+
+        self._send_body(start, length, opts['bw'], drop_at)
+
+    def _send_body(self, offset: int, length: int, bandwidth: int, drop_at):
+        sent = 0
+        block_size = len(BLOCK) - PATTERN_PERIOD
+        if bandwidth > 0:
+            # Send in ~10 slices per second so throttling is smooth
+            block_size = max(1024, min(block_size, bandwidth // 10))
+        started = time.monotonic()
+
+        try:
+            while sent < length:
+                if drop_at is not None and sent >= drop_at:
+                    self.server.stats_drop()
+                    self.close_connection = True
+                    return
+                piece = min(block_size, length - sent)
+                self.wfile.write(pattern_bytes(offset + sent, piece))
+                sent += piece
+                self.server.stats_bytes(piece)
+
+                if bandwidth > 0:
+                    expected = sent / bandwidth
+                    elapsed = time.monotonic() - started
+                    if expected > elapsed:
+                        time.sleep(expected - elapsed)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+class StubServer(ThreadingHTTPServer):
+    """Threaded HTTP server with simple request/byte counters"""
+
+    daemon_threads = True
+
+    def __init__(self, address, config: StubConfig):
+        super().__init__(address, StubHandler)
+        self.config = config
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'errors': 0, 'drops': 0, 'bytes_sent': 0}
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-response are expected (pause, cancel, timeouts)
+        if isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            return
+        super().handle_error(request, client_address)
+
+    def _bump(self, key, amount=1):
+        with self._lock:
+            self.counters[key] += amount
+
+    def stats_request(self):
+        self._bump('requests')
+
+    def stats_error(self):
+        self._bump('errors')
+
+    def stats_drop(self):
+        self._bump('drops')
+
+    def stats_bytes(self, amount):
+        self._bump('bytes_sent', amount)
+
+    def start_in_thread(self) -> threading.Thread:
+        """Serve from a daemon thread (for in-process use)"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Synthetic HTTP file server for benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--default-size', type=int, default=1024 * 1024)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds before response headers')
+    parser.add_argument('--bandwidth', type=int, default=0, help='Per-connection bytes/sec (0 = unlimited)')
+    parser.add_argument('--no-ranges', action='store_true', help='Ignore Range headers')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 500')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Fraction of responses cut off halfway')
+    args = parser.parse_args(argv)
+
+    config = StubConfig(
+        default_size=args.default_size,
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        ranges=not args.no_ranges,
+        error_rate=args.error_rate,
+        drop_rate=args.drop_rate,
+    )
+    server = StubServer((args.host, args.port), config)
+    print(f"READY {server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
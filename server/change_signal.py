@@ -0,0 +1,39 @@
+import threading
+import time
+
+
+class ChangeSignal:
+    """Change counter that request threads can block on (long polling)
+
+    Bumping it is an attribute store plus a check for waiters, so it can sit
+    on hot paths (every Download attribute change); waiters sleep on a
+    condition until the value changes instead of polling it.
+    """
+
+    def __init__(self):
+        self.value = 0
+        self.condition = threading.Condition()
+        self.waiters = 0
+
+    def set(self, value: int):
+        self.value = value
+        # A waiter registers under the lock before it reads value, so it either sees
+        # the new value or is already waiting when we notify
+        if self.waiters:
+            with self.condition:
+                self.condition.notify_all()
+
+    def wait(self, version: int, timeout: float) -> int:
+        """Wait up to timeout seconds for the value to differ from version; returns the value"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            self.waiters += 1
+            try:
+                while self.value == version:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+            finally:
+                self.waiters -= 1
+        return self.value
@@ -0,0 +1,305 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from curl_cffi.requests import AsyncSession
+
+from worker_pool import Worker, WorkerPool
+
+
+# Cluster mode reuses the worker pool protocol (see worker_pool.py) over HTTP.
+# Workers poll the coordinator: every heartbeat carries the messages the worker
+# produced since the last one and the ids of the transfers it is running, and
+# the response carries the commands queued for it ('start', 'stop', 'rate').
+# Nodes and their transfers are leased: a node that misses heartbeats for
+# lease_seconds is dropped, and a transfer a live node stops reporting is
+# taken back. Either way the download is requeued for another node.
+
+
+class ClusterNode:
+    """Coordinator-side view of one registered worker node"""
+
+    def __init__(self, index: int, node_id: str, capacity: int):
+        self.index = index
+        self.node_id = node_id
+        self.capacity = capacity
+        self.registered_at = time.time()
+        self.last_seen = time.monotonic()
+        self.jobs: Dict[str, asyncio.Future] = {}
+        self.leases: Dict[str, float] = {}  # download id -> lease expiry (monotonic)
+        self.outbox: List[Tuple] = []
+        self.speed_bps = 0
+
+    def free_slots(self) -> int:
+        return self.capacity - len(self.jobs)
+
+
+class ClusterCoordinator(WorkerPool):
+    """Assigns downloads to worker nodes that register over HTTP
+
+    Plugs into DownloadManager the same way as the local worker pool: the
+    coordinator keeps the queue and database, Download.start() hands the
+    transfer to the node with the most free slots, and progress reported in
+    heartbeats is applied to the Download objects, so the dashboard shows every
+    node's transfers in one list. Queue capacity is the sum of the live nodes'
+    capacities.
+    """
+
+    remote_storage = True
+
+    def __init__(self, manager, lease_seconds: float = 30):
+        super().__init__(manager, 0)
+        self.lease_seconds = lease_seconds
+        self.nodes: Dict[str, ClusterNode] = {}
+        self.capacity_changed = None
+        self.expiry_task = None
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.capacity_changed = asyncio.Event()
+        self.expiry_task = asyncio.create_task(self._expire_leases())
+
+    # ------------------------------------------------------------------
+    # WorkerPool hooks
+    # ------------------------------------------------------------------
+
+    def _send(self, node: ClusterNode, message: Tuple) -> bool:
+        # Delivered with the node's next heartbeat response
+        node.outbox.append(message)
+        return True
+
+    def _choose_worker(self):
+        return max(self.workers, key=lambda n: n.free_slots())
+
+    def capacity(self) -> Optional[int]:
+        return sum(node.capacity for node in self.workers)
+
+    async def run(self, download) -> Tuple[str, Optional[str]]:
+        # The queue only starts what fits, but a node may have left since
+        while not self.closing and not any(node.free_slots() > 0 for node in self.workers):
+            self.capacity_changed.clear()
+            await self.capacity_changed.wait()
+
+        return await super().run(download)
+
+    def _assigned(self, node: ClusterNode, download):
+        download.node = node.node_id
+        node.leases[download.id] = time.monotonic() + self.lease_seconds
+
+    def _detach(self, node: ClusterNode, result: Tuple[str, Optional[str]]) -> bool:
+        if node not in self.workers:
+            return False
+        self.workers.remove(node)
+        self.nodes.pop(node.node_id, None)
+        for future in node.jobs.values():
+            if not future.done():
+                future.set_result(result)
+        node.jobs.clear()
+        node.leases.clear()
+        return True
+
+    def _handle(self, node: ClusterNode, message: Tuple):
+        kind = message[0]
+        if kind == 'progress':
+            # Only transfers this node still holds (others were taken back)
+            updates = [u for u in message[1] if u[0] in node.jobs]
+            node.speed_bps = sum(u[3] for u in updates)
+            message = ('progress', updates)
+        elif kind in ('state', 'finished', 'stall'):
+            if message[1] not in node.jobs:
+                return
+            if kind == 'finished':
+                node.leases.pop(message[1], None)
+                self.capacity_changed.set()
+        elif kind == 'folder':
+            # Files live on the node, not in this server's download directory
+            return
+        super()._handle(node, message)
+
+    # ------------------------------------------------------------------
+    # HTTP API (called on the background loop)
+    # ------------------------------------------------------------------
+
+    async def register(self, node_id: str, capacity: int) -> Dict:
+        """Add (or re-add after a restart) a worker node"""
+        previous = self.nodes.get(node_id)
+        if previous is not None:
+            # The node restarted - whatever it was running is gone
+            self._detach(previous, ('paused', None))
+
+        node = ClusterNode(next(self._indexes), node_id, max(1, capacity))
+        self.nodes[node_id] = node
+        self.workers.append(node)
+        self._rebalance()
+        self.capacity_changed.set()
+        print(f"Cluster node {node_id} registered (capacity {node.capacity})")
+        return {'node_id': node_id, 'lease_seconds': self.lease_seconds}
+
+    async def heartbeat(self, node_id: str, jobs: List[str], messages: List[List],
+                        capacity: Optional[int] = None) -> Optional[Dict]:
+        """Apply a node's messages and renew its leases. Returns None for unknown nodes."""
+        node = self.nodes.get(node_id)
+        if node is None:
+            return None
+
+        now = time.monotonic()
+        node.last_seen = now
+        if capacity is not None and capacity != node.capacity:
+            node.capacity = max(1, capacity)
+            self.capacity_changed.set()
+
+        for message in messages:
+            self._handle(node, tuple(message))
+
+        for download_id in jobs:
+            if download_id in node.jobs:
+                node.leases[download_id] = now + self.lease_seconds
+            else:
+                # Lease expired (or cancelled) here - the node must not keep writing
+                self._send(node, ('stop', download_id, False))
+
+        commands, node.outbox = node.outbox, []
+        return {'commands': commands}
+
+    async def _expire_leases(self):
+        while True:
+            await asyncio.sleep(1)
+            now = time.monotonic()
+            for node in list(self.workers):
+                if now - node.last_seen > self.lease_seconds:
+                    print(f"Cluster node {node.node_id} missed its heartbeats, requeueing its downloads")
+                    self._detach(node, ('paused', None))
+                    self._rebalance()
+                    continue
+
+                for download_id, expires in list(node.leases.items()):
+                    if now > expires:
+                        print(f"Lease on {download_id} held by {node.node_id} expired, requeueing")
+                        node.leases.pop(download_id, None)
+                        future = node.jobs.pop(download_id, None)
+                        if future is not None and not future.done():
+                            future.set_result(('paused', None))
+                        self.capacity_changed.set()
+
+    async def close(self):
+        self.closing = True
+        if self.expiry_task:
+            self.expiry_task.cancel()
+        for node in list(self.workers):
+            self._detach(node, ('paused', None))
+        self.capacity_changed.set()
+
+    def get_status(self) -> List[Dict]:
+        now = time.monotonic()
+        return [
+            {
+                'index': node.index,
+                'node_id': node.node_id,
+                'capacity': node.capacity,
+                'downloads': list(node.jobs),
+                'speed_bps': node.speed_bps,
+                'last_seen_seconds': round(now - node.last_seen, 1),
+                'registered_at': node.registered_at
+            }
+            for node in self.workers
+        ]
+
+
+class ClusterWorker(Worker):
+    """Runs downloads assigned by a cluster coordinator into this node's DOWNLOAD_PATH"""
+
+    # Seconds between heartbeats (and retries while the coordinator is unreachable)
+    HEARTBEAT_INTERVAL = 1.0
+
+    def __init__(self, coordinator_url: str, api_key: str, node_id: str, capacity: int,
+                 download_path: str, transfer_mode: str, write_mode: str = 'cached',
+                 large_file_threshold: int = 0):
+        super().__init__(None, download_path, transfer_mode, write_mode, large_file_threshold)
+        self.coordinator_url = coordinator_url.rstrip('/')
+        self.api_key = api_key
+        self.node_id = node_id
+        self.capacity = capacity
+        self.outbox: List[Tuple] = []
+        self.registered = False
+        self.connected = False
+        self.session = None
+
+    def send(self, message: Tuple):
+        self.outbox.append(message)
+
+    async def _post(self, path: str, payload: Dict):
+        return await self.session.post(
+            f"{self.coordinator_url}{path}",
+            json=payload,
+            headers={'Authorization': f'Bearer {self.api_key}'},
+            timeout=10
+        )
+
+    async def _register(self):
+        response = await self._post('/api/cluster/register',
+                                    {'node_id': self.node_id, 'capacity': self.capacity})
+        if response.status_code != 200:
+            raise RuntimeError(f"register failed: HTTP {response.status_code}")
+        self.registered = True
+        print(f"Registered with cluster coordinator {self.coordinator_url} as {self.node_id}")
+
+    async def _heartbeat(self):
+        messages, self.outbox = self.outbox, []
+        try:
+            response = await self._post('/api/cluster/heartbeat', {
+                'node_id': self.node_id,
+                'capacity': self.capacity,
+                'jobs': list(self.downloads),
+                'messages': messages
+            })
+        except Exception:
+            # Keep state changes for the next attempt; progress is resent anyway
+            self.outbox = [m for m in messages if m[0] != 'progress'] + self.outbox
+            raise
+
+        if response.status_code == 404:
+            # Coordinator restarted or dropped us - register again
+            self.registered = False
+            return
+        if response.status_code != 200:
+            raise RuntimeError(f"heartbeat failed: HTTP {response.status_code}")
+
+        for command in response.json().get('commands', []):
+            self._handle(tuple(command))
+
+    async def serve(self):
+        self.stopped = asyncio.Event()
+        self.session = AsyncSession()
+        reporter = asyncio.create_task(self._report_progress())
+        try:
+            while not self.stopped.is_set():
+                try:
+                    if not self.registered:
+                        await self._register()
+                    await self._heartbeat()
+                    self.connected = True
+                except Exception as e:
+                    if self.connected:
+                        print(f"Cluster coordinator unreachable: {e}")
+                    self.connected = False
+
+                try:
+                    await asyncio.wait_for(self.stopped.wait(), timeout=self.HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            reporter.cancel()
+            tasks = [d.task for d in self.downloads.values() if d.task]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.session.close()
+
+    def get_status(self) -> Dict:
+        return {
+            'node_id': self.node_id,
+            'coordinator_url': self.coordinator_url,
+            'connected': self.connected,
+            'capacity': self.capacity,
+            'downloads': list(self.downloads)
+        }
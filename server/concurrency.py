@@ -0,0 +1,193 @@
+import time
+from collections import deque
+from typing import Dict, Optional
+
+
+class ConcurrencyController:
+    """Picks how many downloads run at once from measured throughput, errors and disk latency
+
+    Used when the concurrency_mode setting is 'auto'. The download manager calls
+    tick() from its queue loop; every INTERVAL seconds the controller compares
+    what happened in the last interval and moves the limit (AIMD with hill
+    climbing, within the auto_concurrency_min/max settings):
+
+    - While downloads are waiting for a slot, the limit grows by one as long as
+      each step raises total throughput by at least GAIN_THRESHOLD. A step that
+      doesn't is undone and the limit is held for HOLD_INTERVALS before probing
+      again.
+    - Downloads failing (servers throttling or refusing connections) or file
+      writes slowing down (disks saturated) cut the limit by DECREASE_FACTOR.
+    """
+
+    # Seconds between decisions
+    INTERVAL = 5.0
+
+    # Throughput gain (fraction) an added slot has to bring to be kept
+    GAIN_THRESHOLD = 0.05
+
+    # Limit is multiplied by this on errors or slow disks
+    DECREASE_FACTOR = 0.7
+
+    # Fraction of running downloads failing within an interval that counts as throttling
+    ERROR_RATE_LIMIT = 0.2
+
+    # Disk is considered saturated when writes take this many times longer per MB
+    # than the best interval seen, and at least LATENCY_FLOOR_MS per MB
+    LATENCY_FACTOR = 4.0
+    LATENCY_FLOOR_MS = 20.0
+
+    # Intervals to wait after undoing a step before probing upwards again
+    HOLD_INTERVALS = 6
+
+    # Limit changes kept for the API
+    HISTORY = 50
+
+    def __init__(self, manager, minimum: int, maximum: int, initial: int):
+        self.manager = manager
+        self.limit = initial
+        self.set_bounds(minimum, maximum)
+
+        self.interval_started = time.monotonic()
+        self.interval_index = 0
+        self.hold_until = 0
+        self.last_action = None
+        self.last_throughput = None
+        self.latency_baseline = None
+
+        self.bytes_seen: Dict[str, int] = {}
+        self.statuses: Dict[str, str] = {}
+        self.interval_bytes = 0
+        self.interval_failures = 0
+        self.interval_running = 0
+        self.write_seconds = manager.write_seconds
+        self.write_bytes = manager.write_bytes
+
+        self.last_decision: Optional[Dict] = None
+        self.history = deque(maxlen=self.HISTORY)
+
+    def _clamp(self, value: int) -> int:
+        return max(self.minimum, min(self.maximum, value))
+
+    def set_bounds(self, minimum: int, maximum: int):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = self._clamp(self.limit)
+
+    def _observe(self):
+        """Accumulate bytes and failures since the previous tick"""
+        running = 0
+        for download in self.manager.downloads.values():
+            previous_status = self.statuses.get(download.id)
+            self.statuses[download.id] = download.status
+            if download.status == 'failed' and previous_status not in (None, 'failed'):
+                self.interval_failures += 1
+
+            if download.status == 'downloading':
+                running += 1
+                last = self.bytes_seen.get(download.id, download.downloaded_bytes)
+                # Negative when a server ignored Range and the download restarted
+                self.interval_bytes += max(0, download.downloaded_bytes - last)
+                self.bytes_seen[download.id] = download.downloaded_bytes
+            else:
+                self.bytes_seen.pop(download.id, None)
+
+        self.interval_running = max(self.interval_running, running)
+
+        if len(self.statuses) > len(self.manager.downloads):
+            self.statuses = {k: v for k, v in self.statuses.items() if k in self.manager.downloads}
+
+    def tick(self) -> Optional[Dict]:
+        """Called about once a second; returns the decision when an interval ended"""
+        self._observe()
+        now = time.monotonic()
+        elapsed = now - self.interval_started
+        if elapsed < self.INTERVAL:
+            return None
+
+        write_seconds = self.manager.write_seconds - self.write_seconds
+        write_bytes = self.manager.write_bytes - self.write_bytes
+        self.write_seconds = self.manager.write_seconds
+        self.write_bytes = self.manager.write_bytes
+
+        sample = {
+            'throughput_bps': int(self.interval_bytes / elapsed),
+            'running': self.interval_running,
+            'queued': sum(1 for d in self.manager.downloads.values() if d.status == 'queued'),
+            'failures': self.interval_failures,
+            'error_rate': round(self.interval_failures / max(1, self.interval_running), 3),
+            'write_ms_per_mb': (round(write_seconds * 1000 / (write_bytes / 1048576), 2)
+                                if write_bytes >= 1048576 else None)
+        }
+        decision = self._decide(sample)
+
+        self.interval_started = now
+        self.interval_index += 1
+        self.interval_bytes = 0
+        self.interval_failures = 0
+        self.interval_running = 0
+        return decision
+
+    def _disk_saturated(self, latency: Optional[float]) -> bool:
+        if latency is None:
+            return False
+        if self.latency_baseline is None or latency < self.latency_baseline:
+            self.latency_baseline = latency
+        else:
+            # Drift upwards slowly so a permanently slower disk becomes the new normal
+            self.latency_baseline *= 1.01
+        return latency >= max(self.LATENCY_FLOOR_MS, self.LATENCY_FACTOR * self.latency_baseline)
+
+    def _decide(self, sample: Dict) -> Dict:
+        previous = self.limit
+        throughput = sample['throughput_bps']
+        rate_limit = self.manager.global_rate_limit_bps
+        disk_saturated = self._disk_saturated(sample['write_ms_per_mb'])
+
+        if sample['failures'] and sample['error_rate'] >= self.ERROR_RATE_LIMIT:
+            action, reason = 'decrease', 'downloads failing'
+            self.limit = self._clamp(min(self.limit - 1, int(self.limit * self.DECREASE_FACTOR)))
+        elif disk_saturated:
+            action, reason = 'decrease', 'disk writes slowing down'
+            self.limit = self._clamp(min(self.limit - 1, int(self.limit * self.DECREASE_FACTOR)))
+        elif (self.last_action == 'increase' and self.last_throughput is not None
+              and throughput < self.last_throughput * (1 + self.GAIN_THRESHOLD)):
+            action, reason = 'decrease', 'last added slot did not raise throughput'
+            self.limit = self._clamp(self.limit - 1)
+            self.hold_until = self.interval_index + self.HOLD_INTERVALS
+        elif sample['queued'] == 0:
+            action, reason = 'hold', 'no downloads waiting'
+        elif sample['running'] < self.limit:
+            action, reason = 'hold', 'slots not filled yet'
+        elif rate_limit and throughput >= rate_limit * 0.9:
+            action, reason = 'hold', 'at the global rate limit'
+        elif self.interval_index < self.hold_until:
+            action, reason = 'hold', 'settling after last change'
+        elif self.limit >= self.maximum:
+            action, reason = 'hold', 'at auto_concurrency_max'
+        else:
+            action, reason = 'increase', 'probing for more throughput'
+            self.limit = self._clamp(self.limit + 1)
+
+        if self.limit == previous and action != 'hold':
+            action, reason = 'hold', f"{reason} (at auto_concurrency_{'min' if action == 'decrease' else 'max'})"
+
+        self.last_action = action
+        self.last_throughput = throughput
+
+        decision = dict(sample, time=time.time(), action=action, reason=reason,
+                        previous_limit=previous, limit=self.limit)
+        self.last_decision = decision
+        if self.limit != previous:
+            self.history.append(decision)
+            print(f"Auto concurrency: {previous} -> {self.limit} ({reason}, "
+                  f"{throughput / 1048576:.1f} MB/s)")
+        return decision
+
+    def get_status(self) -> Dict:
+        return {
+            'limit': self.limit,
+            'min': self.minimum,
+            'max': self.maximum,
+            'last_decision': self.last_decision,
+            'history': list(self.history)
+        }
@@ -0,0 +1,287 @@
+import asyncio
+import codecs
+import fnmatch
+import time
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+from urllib.parse import urljoin, urlparse, unquote, urldefrag
+
+from curl_cffi.requests import AsyncSession
+
+from download_manager import build_browser_headers
+
+
+class LinkParser(HTMLParser):
+    """Incremental <a href> extractor - fed page chunks as they arrive"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'a':
+            return
+        for name, value in attrs:
+            if name == 'href' and value:
+                self.links.append(value)
+
+    def drain(self) -> List[str]:
+        """Return and clear links found so far"""
+        links, self.links = self.links, []
+        return links
+
+
+def sanitize_segment(segment: str) -> Optional[str]:
+    """Turn a decoded URL path segment into a safe local folder/file name"""
+    segment = segment.replace('/', '_').replace('\\', '_').strip()
+    if segment in ('', '.', '..'):
+        return None
+    return segment
+
+
+class DirectoryCrawler:
+    """Crawls an open directory listing (Apache/nginx autoindex) and enqueues its files
+
+    Index pages are fetched concurrently with the same impersonated session the
+    downloads use, parsed while they stream in, and discovered files are handed
+    to the download manager in batches. Only the directory frontier is kept in
+    memory, never the full file list.
+    """
+
+    # Files per add_downloads() transaction
+    BATCH_SIZE = 500
+
+    def __init__(self, crawl_id: str, url: str, folder: str, manager,
+                 include: Optional[List[str]] = None, exclude: Optional[List[str]] = None,
+                 max_depth: int = 5, concurrency: int = 4, max_files: int = 0,
+                 user_agent: Optional[str] = None, cookies: Optional[str] = None):
+        # Crawl root must be a directory URL so relative paths can be computed
+        if not urlparse(url).path.endswith('/'):
+            url += '/'
+
+        self.id = crawl_id
+        self.url = url
+        self.folder = folder
+        self.manager = manager
+        self.include = include or []
+        self.exclude = exclude or []
+        self.max_depth = max_depth
+        self.concurrency = concurrency
+        self.max_files = max_files
+        self.user_agent = user_agent
+        self.cookies = cookies
+
+        self.status = 'crawling'
+        self.error_message = None
+        self.pages_fetched = 0
+        self.pages_failed = 0
+        self.files_found = 0
+        self.files_queued = 0
+        self.files_skipped = 0
+        self.errors: List[Dict] = []
+        self.started_at = None
+        self.finished_at = None
+
+        self.root = urlparse(url)
+        self.session = None
+        self.task = None
+        self.cancelled = False
+        self._visited = set()
+        self._pending: List[Dict] = []
+        self._frontier = None
+
+    def _relative_parts(self, url: str) -> Optional[List[str]]:
+        """Decoded path segments of url below the crawl root, or None if outside it"""
+        parsed = urlparse(url)
+        if parsed.scheme != self.root.scheme or parsed.netloc != self.root.netloc:
+            return None
+        if not parsed.path.startswith(self.root.path):
+            return None
+        relative = parsed.path[len(self.root.path):]
+        return [unquote(part) for part in relative.split('/') if part]
+
+    def _matches_filters(self, relative_path: str) -> bool:
+        """Apply include/exclude glob patterns to a file's path relative to the root"""
+        name = relative_path.rsplit('/', 1)[-1]
+
+        def matches(pattern):
+            return fnmatch.fnmatch(relative_path, pattern) or fnmatch.fnmatch(name, pattern)
+
+        if self.include and not any(matches(p) for p in self.include):
+            return False
+        if any(matches(p) for p in self.exclude):
+            return False
+        return True
+
+    def _limit_reached(self) -> bool:
+        return self.max_files > 0 and self.files_found >= self.max_files
+
+    async def run(self):
+        """Crawl the tree and enqueue every matching file"""
+        self.started_at = time.time()
+        self.session = AsyncSession(impersonate="chrome120")
+        self._frontier = asyncio.Queue()
+        self._visited.add(self.url)
+        self._frontier.put_nowait((self.url, 0))
+
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        try:
+            await self._frontier.join()
+            await self._flush()
+
+            if self.cancelled:
+                self.status = 'cancelled'
+            elif self.pages_fetched == 0:
+                self.status = 'failed'
+                self.error_message = self.errors[0]['error'] if self.errors else 'No pages fetched'
+            else:
+                self.status = 'completed'
+
+        except asyncio.CancelledError:
+            self.status = 'cancelled'
+            # Keep whatever was discovered before the cancel
+            await self._flush()
+
+        except Exception as e:
+            self.status = 'failed'
+            self.error_message = str(e)
+
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self.finished_at = time.time()
+            if self.session:
+                await self.session.close()
+
+    async def _worker(self):
+        while True:
+            url, depth = await self._frontier.get()
+            try:
+                if not self.cancelled and not self._limit_reached():
+                    await self._crawl_page(url, depth)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.pages_failed += 1
+                if len(self.errors) < 20:
+                    self.errors.append({'url': url, 'error': str(e)})
+            finally:
+                self._frontier.task_done()
+
+    async def _crawl_page(self, url: str, depth: int):
+        """Fetch one index page and process its links as they stream in"""
+        headers = build_browser_headers(url, self.cookies)
+        if self.user_agent:
+            headers['User-Agent'] = self.user_agent
+
+        response = await self.session.get(url, headers=headers, timeout=60, stream=True)
+        try:
+            if response.status_code != 200:
+                raise ValueError(f"HTTP {response.status_code}")
+
+            content_type = response.headers.get('Content-Type', '')
+            if 'html' not in content_type.lower():
+                raise ValueError(f"Not a directory listing (Content-Type: {content_type or 'unknown'})")
+
+            parser = LinkParser()
+            try:
+                decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+            except LookupError:
+                decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            async for chunk in response.aiter_content():
+                if self.cancelled:
+                    return
+                parser.feed(decoder.decode(chunk))
+                await self._handle_links(url, depth, parser.drain())
+
+            parser.feed(decoder.decode(b'', final=True))
+            parser.close()
+            await self._handle_links(url, depth, parser.drain())
+            self.pages_fetched += 1
+        finally:
+            await response.aclose()
+
+    async def _handle_links(self, page_url: str, depth: int, links: List[str]):
+        for href in links:
+            if href.startswith(('?', '#', 'mailto:', 'javascript:')):
+                # Column sort links, anchors and non-file links
+                continue
+
+            target, _ = urldefrag(urljoin(page_url, href))
+            if urlparse(target).query:
+                continue
+
+            parts = self._relative_parts(target)
+            if not parts:
+                # Parent directory, the page itself, or a different site
+                continue
+
+            if target.endswith('/'):
+                if depth < self.max_depth and target not in self._visited:
+                    self._visited.add(target)
+                    self._frontier.put_nowait((target, depth + 1))
+                continue
+
+            self._add_file(target, parts)
+
+        if len(self._pending) >= self.BATCH_SIZE:
+            await self._flush()
+
+    def _add_file(self, url: str, parts: List[str]):
+        if self._limit_reached():
+            return
+
+        safe_parts = [sanitize_segment(part) for part in parts]
+        if None in safe_parts:
+            self.files_skipped += 1
+            return
+
+        if not self._matches_filters('/'.join(safe_parts)):
+            self.files_skipped += 1
+            return
+
+        # Recreate the remote folder structure below the chosen folder
+        folder = '/'.join(p for p in [self.folder.strip('/')] + safe_parts[:-1] if p)
+        self._pending.append({'url': url, 'folder': folder, 'filename': safe_parts[-1]})
+        self.files_found += 1
+
+    async def _flush(self):
+        """Hand pending files to the download manager in one transaction"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        await self.manager.add_downloads(batch, user_agent=self.user_agent, cookies=self.cookies)
+        self.files_queued += len(batch)
+
+    async def cancel(self):
+        """Stop crawling (files already queued stay queued)"""
+        self.cancelled = True
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    def get_status(self) -> Dict:
+        """Get current crawl progress info"""
+        return {
+            'id': self.id,
+            'url': self.url,
+            'folder': self.folder,
+            'status': self.status,
+            'error_message': self.error_message,
+            'include': self.include,
+            'exclude': self.exclude,
+            'max_depth': self.max_depth,
+            'pages_fetched': self.pages_fetched,
+            'pages_failed': self.pages_failed,
+            'pages_pending': self._frontier.qsize() if self._frontier else 0,
+            'files_found': self.files_found,
+            'files_queued': self.files_queued,
+            'files_skipped': self.files_skipped,
+            'errors': self.errors,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
@@ -3,11 +3,16 @@ CREATE TABLE IF NOT EXISTS downloads (
     url TEXT NOT NULL,
     filename TEXT NOT NULL,
     folder TEXT NOT NULL,
-    status TEXT NOT NULL,  -- queued, downloading, paused, completed, failed
+    status TEXT NOT NULL,  -- queued, downloading, paused, moving, completed, failed
     downloaded_bytes INTEGER DEFAULT 0,
     total_bytes INTEGER DEFAULT 0,
     error_message TEXT,
     user_agent TEXT,  -- Browser User-Agent for download requests
+    mirrors TEXT,  -- JSON list of other URLs serving the same file
+    job_type TEXT DEFAULT 'file',  -- file, or stream (HLS/DASH manifest saved as one media file)
+    volume TEXT,  -- Download root the file was placed on (NULL = not started yet, or DOWNLOAD_PATH)
+    probe TEXT,  -- JSON metadata probe result (size, range support, ETag, filename) fetched while queued
+    duplicate_of TEXT,  -- In-flight download of the same URL whose file this one links when it completes
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     completed_at TIMESTAMP
 );
@@ -25,4 +30,7 @@ CREATE TABLE IF NOT EXISTS settings (
 INSERT OR IGNORE INTO settings (key, value) VALUES
     ('global_rate_limit_bps', '0'),
     ('max_concurrent_downloads', '3'),
-    ('default_download_folder', '');
+    ('default_download_folder', ''),
+    ('concurrency_mode', 'fixed'),
+    ('auto_concurrency_min', '1'),
+    ('auto_concurrency_max', '8');
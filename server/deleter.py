@@ -0,0 +1,107 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+
+# Files bigger than this are shrunk in steps of this size before the unlink, so no single
+# filesystem call has to free hundreds of GB of extents (which stalls other writers)
+TRUNCATE_STEP = 1024 * 1024 * 1024
+
+# Pause between truncate steps (seconds)
+TRUNCATE_PAUSE = 0.05
+
+# Temp name a file gets while it waits for deletion
+TOMBSTONE_SUFFIX = '.ndelete'
+
+
+class FileDeleter:
+    """Deletes files on a background thread instead of the caller's
+
+    delete() only renames the file to a hidden tombstone next to it (so the
+    name is free again at once) and queues it; one daemon thread removes
+    queued files in order. Large files are truncated step by step before the
+    unlink. Deleting thousands of finished files or a 200 GB partial file
+    therefore never blocks the event loop or running transfers.
+    """
+
+    def __init__(self, on_deleted: Optional[Callable[[Optional[str]], None]] = None):
+        # Called with the folder passed to delete() once the file is gone (from the thread;
+        # not for files deleted without a folder, e.g. staged files)
+        self.on_deleted = on_deleted
+        self.queue: 'queue.Queue' = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pending_files = 0
+        self.pending_bytes = 0
+        self.deleted_files = 0
+        self.failed_files = 0
+
+    def delete(self, path: str, folder: Optional[str] = None) -> bool:
+        """Queue path for deletion; False if it doesn't exist"""
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
+            return False
+        tombstone = os.path.join(os.path.dirname(path), f".{uuid.uuid4().hex}{TOMBSTONE_SUFFIX}")
+        try:
+            os.rename(path, tombstone)
+        except OSError:
+            tombstone = path  # Delete it under its own name then
+
+        with self.lock:
+            self.pending_files += 1
+            self.pending_bytes += size
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='file-deleter', daemon=True)
+                self.thread.start()
+        self.queue.put((tombstone, size, folder))
+        return True
+
+    def _run(self):
+        while True:
+            path, size, folder = self.queue.get()
+            try:
+                self._remove(path, size)
+                deleted = True
+            except FileNotFoundError:
+                deleted = True
+            except OSError as e:
+                print(f"Failed to delete {path}: {e}")
+                deleted = False
+
+            with self.lock:
+                self.pending_files -= 1
+                self.pending_bytes -= size
+                if deleted:
+                    self.deleted_files += 1
+                else:
+                    self.failed_files += 1
+            if self.on_deleted is not None and folder is not None:
+                try:
+                    self.on_deleted(folder)
+                except Exception as e:
+                    print(f"File deleter callback failed: {e}")
+
+    def _remove(self, path: str, size: int):
+        if size > TRUNCATE_STEP:
+            fd = os.open(path, os.O_WRONLY)
+            try:
+                while size > TRUNCATE_STEP:
+                    size -= TRUNCATE_STEP
+                    os.ftruncate(fd, size)
+                    time.sleep(TRUNCATE_PAUSE)
+            finally:
+                os.close(fd)
+        os.remove(path)
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            return {
+                'pending_files': self.pending_files,
+                'pending_bytes': self.pending_bytes,
+                'deleted_files': self.deleted_files,
+                'failed_files': self.failed_files
+            }
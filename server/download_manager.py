@@ -1,13 +1,185 @@
 import asyncio
-from curl_cffi.requests import AsyncSession
+import json
+import math
+from curl_cffi import CurlECode, CurlInfo, CurlOpt
+from curl_cffi.curl import CURL_WRITEFUNC_ERROR
+from curl_cffi.requests import AsyncSession, RequestsError
 import os
+import shutil
 import sqlite3
 import uuid
 import time
 from datetime import datetime
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
 from urllib.parse import urlparse
 
+from change_signal import ChangeSignal
+from concurrency import ConcurrencyController
+from deleter import FileDeleter
+from file_writer import FileWriter, WRITE_MODES, choose_write_mode, release_range
+from mover import FileMover
+from scheduling import SIZE_POLICIES, order_queue
+from settings_store import SettingsStore
+from singleflight import IN_FLIGHT_STATUSES, InFlightIndex
+from stall_watchdog import StallWatchdog, TransferStalled, WatchdogConfig
+from volumes import VolumeSet
+
+# Response Content-Length as a double, -1 if unknown (curl_cffi's CurlInfo doesn't
+# list it and can't read the off_t variant)
+CURLINFO_CONTENT_LENGTH_DOWNLOAD = 0x300000 + 15
+
+
+# Manifest extensions downloaded as streams (segments saved as one file) by default
+STREAM_MANIFEST_EXTENSIONS = {'.m3u8': '.ts', '.mpd': '.mp4'}
+
+
+def build_browser_headers(url: str, cookies: Optional[str] = None) -> Dict[str, str]:
+    """Browser-like request headers for url (avoids abuse detection on file hosts)
+
+    Args:
+        url: URL being requested (used to derive the Referer)
+        cookies: Browser cookies for this domain (optional, from Chrome extension)
+    """
+    # Extract referer from URL (use parent directory as referer)
+    parsed_url = urlparse(url)
+    # Use the directory path as referer (like clicking from a file listing)
+    referer_path = '/'.join(parsed_url.path.split('/')[:-1]) + '/'
+    referer = f"{parsed_url.scheme}://{parsed_url.netloc}{referer_path}"
+
+    headers = {
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept-Encoding': 'gzip, deflate, br, zstd',
+        'Connection': 'keep-alive',
+        'Referer': referer,
+        # Chrome Client Hints - these identify as Chrome 120
+        'Sec-CH-UA': '"Not_A Brand";v="8", "Chromium";v="120", "Google Chrome";v="120"',
+        'Sec-CH-UA-Mobile': '?0',
+        'Sec-CH-UA-Platform': '"Windows"',
+        # Sec-Fetch headers - indicate navigation context
+        'Sec-Fetch-Dest': 'document',
+        'Sec-Fetch-Mode': 'navigate',
+        'Sec-Fetch-Site': 'same-origin',
+        'Sec-Fetch-User': '?1',
+        'Upgrade-Insecure-Requests': '1',
+        'Priority': 'u=0, i',
+    }
+    # Add browser cookies if provided (from Chrome extension)
+    if cookies:
+        headers['Cookie'] = cookies
+    return headers
+
+
+# Text formats where a compressed response saves real bandwidth; everything else
+# (archives, media, images, executables, unknown) is fetched as identity
+COMPRESSIBLE_EXTENSIONS = frozenset({
+    '.txt', '.log', '.csv', '.tsv', '.json', '.xml', '.html', '.htm', '.md', '.js', '.css',
+    '.svg', '.srt', '.vtt', '.sql', '.yaml', '.yml', '.ini', '.conf', '.nfo'
+})
+
+
+def choose_accept_encoding(url: str, resume_offset: int, direct: bool = False) -> str:
+    """Accept-Encoding for a file request
+
+    Identity unless the file is a text format and the transfer starts from the
+    beginning: a Range of a compressed response is a slice of the compressed
+    bytes, which can't be appended to the decoded bytes already on disk, and
+    binary files gain nothing from compression but still cost CPU to decode.
+    Direct transfers always use identity (libcurl can't tell us the encoding
+    before the body arrives, so Content-Length couldn't be trusted).
+    """
+    if resume_offset > 0 or direct:
+        return 'identity'
+    extension = os.path.splitext(urlparse(url).path)[1].lower()
+    return 'gzip, deflate, br, zstd' if extension in COMPRESSIBLE_EXTENSIONS else 'identity'
+
+
+class RateLimiter:
+    """Per-second byte budget shared by all downloads of one process"""
+
+    def __init__(self, limit_bps: int = 0):
+        self.limit_bps = limit_bps
+        self.window_start = time.time()
+        self.bytes_this_second = 0
+
+    def set_limit(self, limit_bps: int):
+        self.limit_bps = max(0, limit_bps)
+        # Start a fresh accounting window at the new rate
+        self.window_start = time.time()
+        self.bytes_this_second = 0
+
+    async def throttle(self, bytes_downloaded: int):
+        """Sleep as needed so downloads don't exceed limit_bps"""
+        if self.limit_bps == 0:
+            return
+
+        current_time = time.time()
+        elapsed = current_time - self.window_start
+
+        # Reset counter every second
+        if elapsed >= 1.0:
+            self.window_start = current_time
+            self.bytes_this_second = 0
+            elapsed = 0
+
+        self.bytes_this_second += bytes_downloaded
+
+        # Calculate how long we should have taken to download this many bytes
+        expected_time = self.bytes_this_second / self.limit_bps
+
+        # If we're going too fast, sleep to match the rate limit
+        if expected_time > elapsed:
+            sleep_time = expected_time - elapsed
+            await asyncio.sleep(sleep_time)
+
+        # If we've completed a full second worth of data, reset
+        if self.bytes_this_second >= self.limit_bps:
+            self.window_start = time.time()
+            self.bytes_this_second = 0
+
+
+class DirectSession(AsyncSession):
+    """AsyncSession that remembers the curl handle of its (single) transfer
+
+    Direct transfers need the handle inside libcurl's write callback to read
+    the response status and length before the first block is written.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(max_clients=1, **kwargs)
+        self.curl = None
+
+    async def pop_curl(self):
+        self.curl = await super().pop_curl()
+        return self.curl
+
+
+class _Published:
+    """Download attribute whose changes bump the manager's change version
+
+    Only attributes that change a few times per download are published this
+    way; the per-chunk counters (bytes, speed, ETA) are plain attributes that
+    process_queue publishes once per tick, so the transfer hot path does no
+    extra work and long polls aren't woken for every chunk.
+    """
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, download, owner=None):
+        if download is None:
+            return self
+        try:
+            return download.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(self.name) from None
+
+    def __set__(self, download, value):
+        download.__dict__[self.name] = value
+        manager = download.__dict__.get('manager')
+        if manager is not None:
+            manager.version += 1
+
 
 class Download:
     """Individual download handler"""
@@ -15,11 +187,36 @@ class Download:
     # Default User-Agent to use if none provided (mimics Chrome on Windows)
     DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
 
+    # Write buffer for direct transfers (bytes collected per file write)
+    DIRECT_BUFFER_SIZE = 1024 * 1024
+
+    # Abort a direct transfer that receives nothing for this long (seconds, with the watchdog off)
+    DIRECT_STALL_TIMEOUT = 300
+
+    # Attributes get_progress() reports other than the progress counters (downloaded_bytes,
+    # total_bytes, speed_bps, eta_seconds, moved_bytes); setting one bumps the manager's
+    # change version
+    url = _Published()
+    filename = _Published()
+    folder = _Published()
+    job_type = _Published()
+    status = _Published()
+    error_message = _Published()
+    node = _Published()
+    mirrors = _Published()
+    sources = _Published()
+    stream = _Published()
+    probe = _Published()
+    reconnects = _Published()
+    duplicate_of = _Published()
+
     def __init__(self, download_id: str, url: str, folder: str, filename: str,
                  db_path: str, download_path: str, manager, user_agent: str = None,
-                 cookies: str = None):
+                 cookies: str = None, mirrors: Optional[List[str]] = None, job_type: str = 'file'):
         self.id = download_id
         self.url = url
+        self.mirrors = mirrors or []  # Other URLs serving the same file
+        self.job_type = job_type or 'file'  # 'file', or 'stream' for HLS/DASH manifests
         self.folder = folder
         self.filename = filename
         self.db_path = db_path
@@ -40,6 +237,37 @@ class Download:
         self.cancelled = False
         self.paused = False
 
+        # Cluster node running this download (cluster coordinator only)
+        self.node = None
+
+        # Per-mirror state while a multi-source transfer runs
+        self.sources = []
+
+        # HLS/DASH transfer of a stream download (for segment progress)
+        self.stream = None
+
+        # Content-Encoding of the last file response (decoded bytes are written,
+        # so the temp file always holds the identity representation)
+        self.content_encoding = 'identity'
+
+        # Bytes copied from the staging area so far while status is 'moving'
+        self.moved_bytes = 0
+
+        # Download root the file was placed on (None until the transfer first starts)
+        self.volume = None
+
+        # Metadata probe result (size, range support, ETag, filename) - None until probed
+        self.probe = None
+
+        # Named after the URL (the probe may replace it with the server's Content-Disposition name)
+        self.filename_from_url = False
+
+        # Connections the stall watchdog replaced during this download
+        self.reconnects = 0
+
+        # In-flight download of the same URL whose file this one links once it completes
+        self.duplicate_of = None
+
         # For speed calculation
         self.last_update_time = None
         self.last_update_bytes = 0
@@ -50,25 +278,44 @@ class Download:
         return os.path.join(folder_path, self.filename)
 
     def get_temp_file_path(self) -> str:
-        """Get full path to temporary download file (uses ID for uniqueness and crash recovery)"""
+        """Get full path to temporary download file (uses ID for uniqueness and crash recovery)
+
+        With a staging path configured the file lives there, unless a partial
+        file from before staging was enabled is still next to the final file.
+        """
         folder_path = os.path.join(self.download_path, self.folder)
-        return os.path.join(folder_path, f"{self.id}.ndownload")
+        temp_file_path = os.path.join(folder_path, f"{self.id}.ndownload")
+        staging_path = self.manager.staging_path
+        if not staging_path or os.path.exists(temp_file_path):
+            return temp_file_path
+        return os.path.join(staging_path, f"{self.id}.ndownload")
+
+    def get_segments_file_path(self) -> str:
+        """Get full path to the segment tracking file of a multi-source or stream download"""
+        return self.get_temp_file_path() + '.segments'
+
+    UPDATE_SQL = """
+        UPDATE downloads
+        SET status = ?, downloaded_bytes = ?, total_bytes = ?,
+            error_message = ?, completed_at = ?
+        WHERE id = ?
+    """
+
+    def db_values(self) -> tuple:
+        """Parameters of UPDATE_SQL for the current state"""
+        completed_at = datetime.utcnow().isoformat() if self.status == 'completed' else None
+        return (self.status, self.downloaded_bytes, self.total_bytes,
+                self.error_message, completed_at, self.id)
 
     def update_db(self):
-        """Save current state to database"""
+        """Save current state to database (held for the batch while the manager batches writes)"""
+        if self.manager.pending_writes is not None:
+            self.manager.pending_writes[self.id] = self
+            return
+
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-
-        completed_at = datetime.utcnow().isoformat() if self.status == 'completed' else None
-
-        cursor.execute("""
-            UPDATE downloads
-            SET status = ?, downloaded_bytes = ?, total_bytes = ?,
-                error_message = ?, completed_at = ?
-            WHERE id = ?
-        """, (self.status, self.downloaded_bytes, self.total_bytes,
-              self.error_message, completed_at, self.id))
-
+        cursor.execute(self.UPDATE_SQL, self.db_values())
         conn.commit()
         conn.close()
 
@@ -99,7 +346,12 @@ class Download:
 
     async def start(self):
         """Start downloading"""
+        if self.manager.worker_pool is not None:
+            await self._run_in_worker()
+            return
+
         try:
+            self.manager.place(self)
             self.status = 'downloading'
             self.update_db()
 
@@ -114,123 +366,141 @@ class Download:
             if os.path.exists(temp_file_path):
                 self.downloaded_bytes = os.path.getsize(temp_file_path)
 
-            # Prepare headers with browser-like headers to avoid abuse detection
-            # Extract referer from URL (use parent directory as referer)
-            parsed_url = urlparse(self.url)
-            # Use the directory path as referer (like clicking from a file listing)
-            referer_path = '/'.join(parsed_url.path.split('/')[:-1]) + '/'
-            referer = f"{parsed_url.scheme}://{parsed_url.netloc}{referer_path}"
-
-            headers = {
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br, zstd',
-                'Connection': 'keep-alive',
-                'Referer': referer,
-                # Chrome Client Hints - these identify as Chrome 120
-                'Sec-CH-UA': '"Not_A Brand";v="8", "Chromium";v="120", "Google Chrome";v="120"',
-                'Sec-CH-UA-Mobile': '?0',
-                'Sec-CH-UA-Platform': '"Windows"',
-                # Sec-Fetch headers - indicate navigation context
-                'Sec-Fetch-Dest': 'document',
-                'Sec-Fetch-Mode': 'navigate',
-                'Sec-Fetch-Site': 'same-origin',
-                'Sec-Fetch-User': '?1',
-                'Upgrade-Insecure-Requests': '1',
-                'Priority': 'u=0, i',
-            }
-            # Add browser cookies if provided (from Chrome extension)
-            if self.cookies:
-                headers['Cookie'] = self.cookies
-            if self.downloaded_bytes > 0:
-                headers['Range'] = f'bytes={self.downloaded_bytes}-'
+            finished = None
+            if self.job_type == 'stream':
+                from media_stream import MediaStreamTransfer
+                finished = await MediaStreamTransfer(self, temp_file_path).run()
+            elif self.mirrors:
+                from multi_source import MultiSourceTransfer
+                finished = await MultiSourceTransfer(self, temp_file_path).run()
+                if finished is None:
+                    print(f"No mirror of {self.id} supports range requests, downloading from {self.url}")
+                    segments_path = self.get_segments_file_path()
+                    if os.path.exists(segments_path):
+                        # Preallocated with gaps - only a multi-source transfer can resume it
+                        os.remove(segments_path)
+                        if os.path.exists(temp_file_path):
+                            os.remove(temp_file_path)
+                    self.downloaded_bytes = os.path.getsize(temp_file_path) if os.path.exists(temp_file_path) else 0
+
+            if finished is None:
+                finished = await self._transfer_single(temp_file_path)
 
-            # Create curl_cffi session with Chrome TLS fingerprint impersonation
-            # This makes the request appear to come from a real Chrome browser
-            self.session = AsyncSession(impersonate="chrome120")
+            # Final update
+            if finished:
+                await self._complete(temp_file_path)
 
-            response = await self.session.get(
-                self.url,
-                headers=headers,
-                timeout=300,
-                stream=True
-            )
+        except asyncio.CancelledError:
+            # Requeued or cancelled downloads keep the status they were given
+            if self.status == 'downloading':
+                self.status = 'paused'
+            self.speed_bps = 0
+            self.eta_seconds = 0
+            self.update_db()
 
-            # Check if server supports ranges (curl_cffi uses status_code)
-            if self.downloaded_bytes > 0 and response.status_code != 206:
-                # Server doesn't support ranges, restart download
-                self.downloaded_bytes = 0
-                file_mode = 'wb'
-            else:
-                file_mode = 'ab' if self.downloaded_bytes > 0 else 'wb'
+        except Exception as e:
+            self.status = 'failed'
+            self.error_message = str(e)
+            self.speed_bps = 0
+            self.eta_seconds = 0
+            self.update_db()
 
-            # Get total size
-            if 'Content-Length' in response.headers:
-                content_length = int(response.headers['Content-Length'])
-                if response.status_code == 206:
-                    # Partial content, add to existing bytes
-                    self.total_bytes = self.downloaded_bytes + content_length
-                else:
-                    self.total_bytes = content_length
+        finally:
+            if self.session:
+                await self.session.close()
 
-            self.update_db()
+    async def _complete(self, temp_file_path: str):
+        """Put the finished temp file in place and mark the download completed"""
+        self.speed_bps = 0
+        self.eta_seconds = 0
 
-            # Download in chunks
-            # Use smaller chunk size if rate limiting is enabled
-            if self.manager.global_rate_limit_bps > 0:
-                # Use 1/4 of rate limit or 1KB minimum to allow smooth throttling
-                chunk_size = max(1024, self.manager.global_rate_limit_bps // 4)
-            else:
-                chunk_size = 8192
+        # (filename is already unique from _get_unique_filename, so no conflict)
+        final_file_path = self.get_file_path()
+        if os.path.exists(temp_file_path):
+            if self.manager.mover is not None:
+                self.status = 'moving'
+                self.update_db()
+                await self.manager.mover.move(self, temp_file_path, final_file_path)
+            elif not self.manager.staging_path:
+                os.rename(temp_file_path, final_file_path)
+            # Otherwise this is a worker process: the coordinator moves the staged file
 
-            last_db_update = time.time()
+        self.status = 'completed'
+        self.update_db()
+        self.manager.notify_folder_changed(self.folder)
 
-            with open(temp_file_path, file_mode) as f:
-                # curl_cffi uses aiter_content() for async streaming
-                async for chunk in response.aiter_content():
-                    if self.cancelled:
-                        break
+    async def finish_move(self):
+        """Restart the move of a download that was 'moving' when the server stopped"""
+        try:
+            await self._complete(self.get_temp_file_path())
+        except asyncio.CancelledError:
+            pass  # Cancelled: cancel() removes it
+        except Exception as e:
+            self.status = 'failed'
+            self.error_message = f"Moving from staging failed: {e}"
+            self.update_db()
 
-                    # Wait if paused
-                    while self.paused and not self.cancelled:
-                        await asyncio.sleep(0.1)
+    async def link_from(self, source: 'Download'):
+        """Complete this duplicate from source's finished file: a hardlink, or a copy where
+        linking isn't possible (other filesystem, no hardlink support)"""
+        try:
+            self.manager.place(self, root=source.download_path)
+            self.status = 'downloading'
+            self.update_db()
 
-                    if self.cancelled:
-                        break
+            source_path = source.get_file_path()
+            final_file_path = self.get_file_path()
+            os.makedirs(os.path.dirname(final_file_path), exist_ok=True)
+            try:
+                os.link(source_path, final_file_path)
+            except OSError:
+                loop = asyncio.get_running_loop()
+                try:
+                    await loop.run_in_executor(None, shutil.copyfile, source_path, final_file_path)
+                except BaseException:
+                    if os.path.exists(final_file_path):
+                        os.remove(final_file_path)
+                    raise
+
+            self.downloaded_bytes = self.total_bytes = os.path.getsize(final_file_path)
+            self.status = 'completed'
+            self.update_db()
+            self.manager.notify_folder_changed(self.folder)
 
-                    # Apply rate limiting BEFORE writing
-                    await self.manager.rate_limit(len(chunk))
+        except asyncio.CancelledError:
+            if self.status == 'downloading':
+                self.status = 'queued'
+                self.update_db()
 
-                    # Write chunk
-                    f.write(chunk)
-                    self.downloaded_bytes += len(chunk)
+        except Exception as e:
+            self.status = 'failed'
+            self.error_message = f"Copying the file of {source.id} failed: {e}"
+            self.update_db()
 
-                    # Calculate speed
-                    self.calculate_speed(self.downloaded_bytes)
+    async def _run_in_worker(self):
+        """Run the transfer in a worker process; progress is applied to this object as it arrives"""
+        try:
+            self.manager.place(self)
+            self.status = 'downloading'
+            self.update_db()
 
-                    # Update DB periodically (every 5 seconds)
-                    current_time = time.time()
-                    if current_time - last_db_update >= 5.0:
-                        self.update_db()
-                        last_db_update = current_time
+            status, error_message = await self.manager.worker_pool.run(self)
 
-            # Final update
-            if not self.cancelled:
-                self.status = 'completed'
+            if status == 'completed':
+                # With staging the worker leaves the file there for our mover
+                await self._complete(self.get_temp_file_path())
+            elif status == 'failed':
+                raise RuntimeError(error_message)
+            elif self.status == 'downloading':
+                # Stopped without us asking (worker shut down) - run it again later
+                self.status = 'queued'
                 self.speed_bps = 0
                 self.eta_seconds = 0
-
-                # Rename temp file to final filename
-                final_file_path = self.get_file_path()
-                if os.path.exists(temp_file_path):
-                    # Rename temp file to final filename
-                    # (filename is already unique from _get_unique_filename, so no conflict)
-                    os.rename(temp_file_path, final_file_path)
-
                 self.update_db()
 
         except asyncio.CancelledError:
-            self.status = 'paused'
+            if self.status != 'moving':  # An interrupted move is restarted at startup
+                self.status = 'paused'
             self.speed_bps = 0
             self.eta_seconds = 0
             self.update_db()
@@ -242,9 +512,288 @@ class Download:
             self.eta_seconds = 0
             self.update_db()
 
+    def _build_request_headers(self) -> Dict[str, str]:
+        """Headers of a single-connection request, resuming from downloaded_bytes"""
+        headers = build_browser_headers(self.url, self.cookies)
+        headers['Accept-Encoding'] = choose_accept_encoding(
+            self.url, self.downloaded_bytes, self.manager.transfer_mode == 'direct')
+        if self.downloaded_bytes > 0:
+            headers['Range'] = f'bytes={self.downloaded_bytes}-'
+            etag = (self.probe or {}).get('etag')
+            if etag and not etag.startswith('W/'):
+                # Changed since the probe: the server sends the whole file (restart)
+                headers['If-Range'] = etag
+        return headers
+
+    async def _transfer_single(self, temp_file_path: str) -> bool:
+        """Download over one connection, re-established whenever the stall watchdog gives up on it
+
+        Each reconnect resumes with a Range from downloaded_bytes. The download
+        fails once max_reconnects reconnects in a row brought no new bytes.
+        """
+        unproductive = 0
+        while True:
+            headers = self._build_request_headers()
+            connected_at = self.downloaded_bytes
+            try:
+                if self.manager.transfer_mode == 'direct':
+                    return await self._transfer_direct(headers, temp_file_path)
+                return await self._transfer_stream(headers, temp_file_path)
+            except TransferStalled as e:
+                reason = e.reason
+
+            await self.session.close()
+            self.session = None
+            self.speed_bps = 0
+            self.eta_seconds = 0
+
+            unproductive = 0 if self.downloaded_bytes > connected_at else unproductive + 1
+            max_reconnects = self.manager.watchdog.max_reconnects
+            if unproductive > max_reconnects:
+                self.manager.record_stall(self, reason, gave_up=True)
+                raise RuntimeError(f"Connection {reason}, no progress after {max_reconnects} reconnects")
+
+            self.manager.record_stall(self, reason)
+            print(f"Connection of {self.id} {reason} at {self.downloaded_bytes} bytes, reconnecting")
+            # Back off while reconnecting doesn't help
+            await asyncio.sleep(min(unproductive, 10))
+
+    def _watchdog_checks_speed(self) -> bool:
+        """Whether the minimum speed applies (not while the rate limit holds this download below it)"""
+        share = self.manager.get_rate_limit_share()
+        return share == 0 or share > self.manager.watchdog.min_speed_bps
+
+    async def _watch(self, reader: asyncio.Task):
+        """Wait for reader, raising TransferStalled when the watchdog gives up on its connection"""
+        watchdog = StallWatchdog(self.manager.watchdog)
+        while True:
+            done, _ = await asyncio.wait({reader}, timeout=1.0)
+            if done:
+                return reader.result()
+            if self.paused:
+                watchdog.reset()  # Nothing is read while paused
+                continue
+            reason = watchdog.check(self.downloaded_bytes, self._watchdog_checks_speed())
+            if reason:
+                raise TransferStalled(reason)
+
+    async def _transfer_stream(self, headers: Dict[str, str], temp_file_path: str) -> bool:
+        """Download by iterating response chunks in Python. Returns False if cancelled."""
+        # Create curl_cffi session with Chrome TLS fingerprint impersonation
+        # This makes the request appear to come from a real Chrome browser
+        self.session = AsyncSession(impersonate="chrome120")
+
+        response = await self.session.get(
+            self.url,
+            headers=headers,
+            timeout=300,
+            stream=True
+        )
+
+        self.content_encoding = response.headers.get('Content-Encoding', 'identity').lower()
+        encoded = self.content_encoding != 'identity'
+        if encoded and self.downloaded_bytes > 0 and response.status_code == 206:
+            self._discard_partial(temp_file_path)
+
+        # Check if server supports ranges (curl_cffi uses status_code)
+        if self.downloaded_bytes > 0 and response.status_code != 206:
+            # Server doesn't support ranges, restart download
+            self.downloaded_bytes = 0
+
+        # Get total size (Content-Length of a compressed response is not the file size)
+        if encoded:
+            self.total_bytes = 0
+        elif 'Content-Length' in response.headers:
+            content_length = int(response.headers['Content-Length'])
+            if response.status_code == 206:
+                # Partial content, add to existing bytes
+                self.total_bytes = self.downloaded_bytes + content_length
+            else:
+                self.total_bytes = content_length
+
+        self.update_db()
+
+        last_db_update = time.time()
+
+        write_mode = choose_write_mode(self.manager.write_mode, self.manager.large_file_threshold,
+                                       self.total_bytes)
+        f = FileWriter(temp_file_path, self.downloaded_bytes, write_mode)
+
+        async def read():
+            nonlocal last_db_update
+            # curl_cffi uses aiter_content() for async streaming
+            async for chunk in response.aiter_content():
+                if self.cancelled:
+                    break
+
+                # Wait if paused
+                while self.paused and not self.cancelled:
+                    await asyncio.sleep(0.1)
+
+                if self.cancelled:
+                    break
+
+                # Apply rate limiting BEFORE writing
+                await self.manager.rate_limit(len(chunk))
+
+                # Write chunk
+                write_started = time.perf_counter()
+                f.write(chunk)
+                self.manager.record_write(time.perf_counter() - write_started, len(chunk))
+                self.downloaded_bytes += len(chunk)
+
+                # Calculate speed
+                self.calculate_speed(self.downloaded_bytes)
+
+                # Update DB periodically (every 5 seconds)
+                current_time = time.time()
+                if current_time - last_db_update >= 5.0:
+                    self.update_db()
+                    last_db_update = current_time
+
+        # Read in a task of its own so the watchdog can abandon a connection stuck in aiter_content()
+        reader = asyncio.create_task(read())
+        try:
+            await self._watch(reader)
         finally:
-            if self.session:
-                await self.session.close()
+            if not reader.done():
+                reader.cancel()
+                await asyncio.wait({reader})
+            f.close()
+
+        if encoded and not self.cancelled:
+            self.total_bytes = self.downloaded_bytes
+        return not self.cancelled
+
+    def _discard_partial(self, temp_file_path: str):
+        """Drop a partial file after a server answered a Range request with compressed bytes"""
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+        self.downloaded_bytes = 0
+        self.total_bytes = 0
+        raise RuntimeError(f"Server sent a {self.content_encoding}-encoded partial response; "
+                           f"partial file discarded, retry to download from the start")
+
+    async def _transfer_direct(self, headers: Dict[str, str], temp_file_path: str) -> bool:
+        """Download with libcurl writing straight into the temp file
+
+        libcurl calls write() from inside its socket callback; blocks are
+        collected in a reusable DIRECT_BUFFER_SIZE buffer and written to the
+        file in large writes, without passing through an asyncio queue. Speed and DB updates come from a
+        once-a-second reporter task, and the global rate limit is enforced by
+        libcurl as this download's share of it. Pausing aborts the transfer
+        (resume continues with a Range request). Returns False if stopped early.
+        """
+        # libcurl is the stall watchdog here: it aborts the transfer when the average speed
+        # stays below low_speed_limit for low_speed_time seconds
+        watchdog = self.manager.watchdog
+        low_speed_limit, low_speed_time = 1, self.DIRECT_STALL_TIMEOUT
+        if watchdog.window > 0:
+            low_speed_time = max(1, math.ceil(watchdog.window))
+            if watchdog.min_speed_bps and self._watchdog_checks_speed():
+                low_speed_limit = watchdog.min_speed_bps
+
+        self.session = DirectSession(impersonate="chrome120", curl_options={
+            # Larger socket reads (callbacks still get at most 16 KB each)
+            CurlOpt.BUFFERSIZE: self.DIRECT_BUFFER_SIZE // 2,
+            # No overall timeout (large files), only a stall timeout
+            CurlOpt.CONNECTTIMEOUT: self.DIRECT_STALL_TIMEOUT,
+            CurlOpt.LOW_SPEED_LIMIT: low_speed_limit,
+            CurlOpt.LOW_SPEED_TIME: low_speed_time,
+        })
+
+        resume_from = self.downloaded_bytes
+        headers_seen = False
+        stopped = False
+        last_block_at = time.monotonic()
+
+        # libcurl delivers at most 16 KB per callback; collect blocks in one
+        # reusable buffer so the file sees a few large writes
+        buffer = bytearray(self.DIRECT_BUFFER_SIZE)
+        view = memoryview(buffer)
+        filled = 0
+
+        f = FileWriter(temp_file_path, resume_from)
+
+        def flush(data):
+            write_started = time.perf_counter()
+            f.write(data)
+            self.manager.record_write(time.perf_counter() - write_started, len(data))
+
+        def write(block: bytes):
+            nonlocal headers_seen, stopped, filled, last_block_at
+            last_block_at = time.monotonic()
+            if self.cancelled or self.paused:
+                stopped = True
+                return CURL_WRITEFUNC_ERROR
+
+            if not headers_seen:
+                headers_seen = True
+                curl = self.session.curl
+                if resume_from > 0 and curl.getinfo(CurlInfo.RESPONSE_CODE) != 206:
+                    # Server doesn't support ranges, restart download
+                    f.restart()
+                    self.downloaded_bytes = 0
+                content_length = int(curl.getinfo(CURLINFO_CONTENT_LENGTH_DOWNLOAD))
+                if content_length >= 0:
+                    self.total_bytes = self.downloaded_bytes + content_length
+                f.set_mode(choose_write_mode(self.manager.write_mode, self.manager.large_file_threshold,
+                                             self.total_bytes))
+
+            size = len(block)
+            if filled + size > len(buffer):
+                flush(view[:filled])
+                filled = 0
+            if size > len(buffer):
+                flush(block)
+            else:
+                view[filled:filled + size] = block
+                filled += size
+            self.downloaded_bytes += size
+            return size
+
+        reporter = asyncio.create_task(self._report_progress())
+        try:
+            response = await self.session.get(
+                self.url,
+                headers=headers,
+                timeout=None,
+                content_callback=write,
+                max_recv_speed=self.manager.get_rate_limit_share()
+            )
+        except RequestsError as e:
+            if stopped:
+                return False
+            if e.code == CurlECode.OPERATION_TIMEDOUT and headers_seen and watchdog.window > 0:
+                stalled = time.monotonic() - last_block_at >= low_speed_time
+                raise TransferStalled('stalled' if stalled else 'slow')
+            raise
+        finally:
+            reporter.cancel()
+            # Keep what was received, also when pausing (resume continues from here)
+            if filled:
+                flush(view[:filled])
+            view.release()
+            f.close()
+
+        # Identity was asked for; a server that compresses anyway got decoded by libcurl
+        self.content_encoding = response.headers.get('Content-Encoding', 'identity').lower()
+        if self.content_encoding != 'identity':
+            if resume_from > 0 and response.status_code == 206:
+                self._discard_partial(temp_file_path)
+            self.total_bytes = self.downloaded_bytes
+        return not self.cancelled
+
+    async def _report_progress(self):
+        """Speed/ETA every second and DB every 5 seconds while a direct transfer runs"""
+        last_db_update = time.time()
+        self.update_db()
+        while True:
+            await asyncio.sleep(1.0)
+            self.calculate_speed(self.downloaded_bytes)
+            if time.time() - last_db_update >= 5.0:
+                self.update_db()
+                last_db_update = time.time()
 
     async def pause(self):
         """Pause download - only if queued or downloading"""
@@ -255,6 +804,19 @@ class Download:
         self.speed_bps = 0
         self.eta_seconds = 0
         self.update_db()
+        if self.manager.worker_pool is not None:
+            self.manager.worker_pool.stop(self.id)
+
+    def requeue(self):
+        """Stop the running transfer and put the download back in the queue (partial data is kept)"""
+        self.status = 'queued'
+        self.speed_bps = 0
+        self.eta_seconds = 0
+        self.update_db()
+        if self.manager.worker_pool is not None:
+            self.manager.worker_pool.stop(self.id)
+        elif self.task and not self.task.done():
+            self.task.cancel()
 
     async def resume(self):
         """Resume download - only if paused"""
@@ -292,24 +854,21 @@ class Download:
             # Default behavior: only delete if download was incomplete
             should_delete = original_status != 'completed'
 
-        # Delete file if requested or if incomplete
+        # Delete file if requested or if incomplete (in the background - it may be huge)
         if should_delete:
-            # For incomplete downloads, delete the temp file
             if original_status != 'completed':
-                temp_file_path = self.get_temp_file_path()
-                if os.path.exists(temp_file_path):
-                    try:
-                        os.remove(temp_file_path)
-                    except Exception as e:
-                        print(f"Failed to delete temp file {temp_file_path}: {e}")
+                # For incomplete downloads, delete the temp file
+                paths = (self.get_temp_file_path(), self.get_segments_file_path())
             else:
                 # For completed downloads, delete the final file
-                file_path = self.get_file_path()
-                if os.path.exists(file_path):
-                    try:
-                        os.remove(file_path)
-                    except Exception as e:
-                        print(f"Failed to delete file {file_path}: {e}")
+                paths = (self.get_file_path(),)
+            for path in paths:
+                try:
+                    self.manager.deleter.delete(path, self.folder)
+                except Exception as e:
+                    print(f"Failed to delete {path}: {e}")
+
+            self.manager.notify_folder_changed(self.folder)
 
     def get_progress(self) -> Dict:
         """Get current progress info"""
@@ -327,11 +886,12 @@ class Download:
                 current_speed = 0
                 current_eta = 0
 
-        return {
+        progress = {
             'id': self.id,
             'url': self.url,
             'filename': self.filename,
             'folder': self.folder,
+            'type': self.job_type,
             'status': self.status,
             'error_message': self.error_message,
             'progress': {
@@ -342,27 +902,129 @@ class Download:
                 'eta_seconds': int(current_eta)
             }
         }
+        if self.node is not None:
+            progress['node'] = self.node
+        if self.mirrors:
+            progress['mirrors'] = self.mirrors
+            if self.sources:
+                progress['sources'] = [source.get_status() for source in self.sources]
+        if self.stream is not None:
+            progress['stream'] = self.stream.get_status()
+        if self.status == 'moving':
+            progress['progress']['moved_bytes'] = self.moved_bytes
+        if self.probe is not None:
+            progress['probe'] = self.probe
+        if self.reconnects:
+            progress['reconnects'] = self.reconnects
+        if self.duplicate_of is not None:
+            progress['duplicate_of'] = self.duplicate_of
+        return progress
 
 
 class DownloadManager:
     """Manages download queue and execution"""
 
-    def __init__(self, db_path: str, download_path: str):
+    # 'stream': Python iterates response chunks (per-chunk rate limiting and progress)
+    # 'direct': libcurl writes into the file itself (much less CPU at high speeds)
+    TRANSFER_MODES = ('stream', 'direct')
+
+    # Actions of bulk_update() and the statuses each applies to (None = any)
+    BULK_ACTIONS = {
+        'pause': ('queued', 'downloading'),
+        'resume': ('paused',),
+        'retry': ('failed',),
+        'cancel': ('queued', 'downloading', 'paused', 'moving', 'failed'),
+        'delete': None,
+    }
+
+    def __init__(self, db_path: str, download_path: str, settings: Optional[SettingsStore] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None, transfer_mode: str = 'stream',
+                 write_mode: str = 'cached', large_file_threshold: int = 0,
+                 staging_path: Optional[str] = None, mover_concurrency: int = 1,
+                 mover_rate_limit_bps: int = 0, volumes: Optional[VolumeSet] = None,
+                 probe_concurrency: int = 4, probe_filenames: bool = False,
+                 watchdog: Optional[WatchdogConfig] = None):
+        if transfer_mode not in self.TRANSFER_MODES:
+            raise ValueError(f"Unknown transfer mode '{transfer_mode}'")
+        if write_mode not in WRITE_MODES:
+            raise ValueError(f"Unknown write mode '{write_mode}'")
+
         self.db_path = db_path
         self.download_path = download_path
+        self.transfer_mode = transfer_mode
+
+        # Download roots new files are spread over (download_path is the primary one)
+        self.volumes = volumes or VolumeSet([download_path])
+
+        # How files of at least large_file_threshold bytes are written (see file_writer)
+        self.write_mode = write_mode
+        self.large_file_threshold = large_file_threshold
+
+        # Temp files go to staging_path (e.g. an SSD) and the mover copies finished ones
+        # into download_path; without one they are renamed in place
+        self.staging_path = staging_path or None
+        self.mover = None
+        if self.staging_path:
+            os.makedirs(self.staging_path, exist_ok=True)
+            self.mover = FileMover(mover_concurrency, mover_rate_limit_bps)
+
+        # Learns sizes etc. of queued downloads before they start (None = no probing); only
+        # used while a size queue policy needs them. With probe_filenames, downloads named
+        # after their URL take the server's Content-Disposition filename from the probe.
+        self.prober = None
+        if probe_concurrency > 0:
+            from probe import MetadataProber
+            self.prober = MetadataProber(self, probe_concurrency)
+        self.probe_filenames = probe_filenames
+
+        # When stalled or too slow connections are replaced, and how often that happened
+        self.watchdog = watchdog or WatchdogConfig()
+        self.watchdog_events = {'stalled': 0, 'slow': 0, 'reconnects': 0, 'failed': 0}
+
+        # Removes cancelled/deleted files on a background thread
+        self.deleter = FileDeleter(on_deleted=self.notify_folder_changed)
+
+        # Downloads whose update_db() is held for one transaction while a bulk change runs
+        self.pending_writes: Optional[Dict[str, Download]] = None
+
+        # Event loop the downloads run on (used when settings change from another thread)
+        self.loop = loop
         self.downloads: Dict[str, Download] = {}
         self.active_tasks: List[asyncio.Task] = []
 
+        # In-flight downloads by URL and folder, so a URL added twice isn't transferred twice
+        self.in_flight = InFlightIndex(self.downloads)
+
+        # Directory crawl jobs (in memory only - queued files are persisted as downloads)
+        self.crawls = {}
+
+        # Folder tree cache to notify when files change (set by app, optional)
+        self.folder_index = None
+
         # Global pause state
         self.global_paused = False
 
+        # Bumped on every change to what get_downloads() returns (ETag of GET /api/downloads)
+        self.changes = ChangeSignal()
+
         # Rate limiting
         self.global_rate_limit_bps = 0
-        self.last_rate_limit_time = time.time()
-        self.bytes_this_second = 0
+        self.rate_limiter = RateLimiter()
+
+        # Worker processes that run the transfers (None = run them on this loop)
+        self.worker_pool = None
+
+        # Time spent in file writes (input for the auto concurrency controller)
+        self.write_seconds = 0.0
+        self.write_bytes = 0
 
-        # Load settings from DB
+        # Picks the concurrency limit when concurrency_mode is 'auto'
+        self.concurrency_controller: Optional[ConcurrencyController] = None
+
+        # Settings store is the source of truth; we only mirror the values we use
+        self.settings = settings or SettingsStore(db_path)
         self.load_settings()
+        self.settings.subscribe(self._on_settings_changed)
 
         # Load existing downloads from DB
         self.load_downloads()
@@ -371,23 +1033,60 @@ class DownloadManager:
         self.processing = False
 
     def load_settings(self):
-        """Load settings from database"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT key, value FROM settings")
-        settings = {}
-        for row in cursor.fetchall():
-            try:
-                settings[row['key']] = int(row['value']) if row['value'] else 0
-            except ValueError:
-                settings[row['key']] = 0
-
-        self.global_rate_limit_bps = settings.get('global_rate_limit_bps', 0)
-        self.max_concurrent_downloads = settings.get('max_concurrent_downloads', 3)
-
-        conn.close()
+        """Load settings from the settings store"""
+        self.global_rate_limit_bps = self.settings.get('global_rate_limit_bps')
+        self.rate_limiter.set_limit(self.global_rate_limit_bps)
+        self.max_concurrent_downloads = self.settings.get('max_concurrent_downloads')
+        self.queue_policy = self.settings.get('queue_policy')
+        self._configure_concurrency()
+
+    def _configure_concurrency(self):
+        """Create, update or remove the auto concurrency controller to match the settings"""
+        minimum = self.settings.get('auto_concurrency_min')
+        maximum = self.settings.get('auto_concurrency_max')
+        if self.settings.get('concurrency_mode') != 'auto':
+            self.concurrency_controller = None
+        elif self.concurrency_controller is None:
+            self.concurrency_controller = ConcurrencyController(
+                self, minimum, maximum, initial=self.max_concurrent_downloads)
+        else:
+            self.concurrency_controller.set_bounds(minimum, maximum)
+
+    def _on_settings_changed(self, changed: Dict, previous: Dict):
+        """Apply settings changes (called by the settings store, possibly from another thread)"""
+        if 'global_rate_limit_bps' in changed:
+            self.global_rate_limit_bps = max(0, changed['global_rate_limit_bps'])
+            self.rate_limiter.set_limit(self.global_rate_limit_bps)
+            if self.worker_pool is not None:
+                self._run_soon(self.worker_pool.set_rate_limit(self.global_rate_limit_bps))
+
+        if 'max_concurrent_downloads' in changed:
+            self.max_concurrent_downloads = max(1, changed['max_concurrent_downloads'])
+            # If limit was reduced, enforce it by pausing excess downloads
+            if self.max_concurrent_downloads < (previous.get('max_concurrent_downloads') or 0):
+                self._run_soon(self.enforce_concurrency_limit())
+
+        if 'queue_policy' in changed:
+            self.queue_policy = changed['queue_policy']
+
+        if changed.keys() & {'concurrency_mode', 'auto_concurrency_min', 'auto_concurrency_max'}:
+            self._configure_concurrency()
+            self._run_soon(self.enforce_concurrency_limit())
+
+    def _run_soon(self, coro):
+        """Schedule a coroutine on the download loop from any thread"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is not None and (self.loop is None or running is self.loop):
+            running.create_task(coro)
+        elif self.loop is not None:
+            asyncio.run_coroutine_threadsafe(coro, self.loop)
+        else:
+            coro.close()
+            raise RuntimeError("Download manager has no event loop to schedule on")
 
     def load_downloads(self):
         """Load existing downloads from database"""
@@ -396,20 +1095,26 @@ class DownloadManager:
         cursor = conn.cursor()
 
         cursor.execute("""
-            SELECT id, url, filename, folder, status, downloaded_bytes, total_bytes, user_agent
+            SELECT id, url, filename, folder, status, downloaded_bytes, total_bytes, user_agent, mirrors,
+                   job_type, volume, probe, duplicate_of
             FROM downloads
-            WHERE status IN ('queued', 'downloading', 'paused')
+            WHERE status IN ('queued', 'downloading', 'paused', 'moving')
         """)
 
         for row in cursor.fetchall():
             download = Download(
                 row['id'], row['url'], row['folder'], row['filename'],
-                self.db_path, self.download_path, self,
-                user_agent=row['user_agent']
+                self.db_path, row['volume'] or self.download_path, self,
+                user_agent=row['user_agent'],
+                mirrors=json.loads(row['mirrors']) if row['mirrors'] else None,
+                job_type=row['job_type']
             )
+            download.volume = row['volume']
             download.status = row['status']
             download.downloaded_bytes = row['downloaded_bytes']
             download.total_bytes = row['total_bytes']
+            download.probe = json.loads(row['probe']) if row['probe'] else None
+            download.duplicate_of = row['duplicate_of']
 
             # Reset downloading status to queued on startup
             if download.status == 'downloading':
@@ -417,37 +1122,165 @@ class DownloadManager:
                 download.update_db()
 
             self.downloads[download.id] = download
+            if download.duplicate_of is None:
+                self.in_flight.add(download)
 
         conn.close()
 
+    def resume_moves(self):
+        """Restart moves out of staging that the last run didn't finish (call on the loop)"""
+        for download in self.downloads.values():
+            if download.status == 'moving':
+                download.task = asyncio.create_task(download.finish_move())
+                self.active_tasks.append(download.task)
+
     async def rate_limit(self, bytes_downloaded: int):
         """Apply rate limiting - ensures download speed doesn't exceed global_rate_limit_bps"""
+        await self.rate_limiter.throttle(bytes_downloaded)
+
+    def get_rate_limit_share(self) -> int:
+        """Per-download bytes/sec for transfers throttled by libcurl (0 = unlimited)
+
+        The global limit is split evenly between the downloads running when the
+        transfer starts; the share is fixed for the rest of that transfer.
+        """
         if self.global_rate_limit_bps == 0:
+            return 0
+        active = sum(1 for d in self.downloads.values() if d.status == 'downloading')
+        return max(1024, self.global_rate_limit_bps // max(1, active))
+
+    def volume_load(self):
+        """Transfers writing to each download root and the bytes they still have to write"""
+        active_writes: Dict[str, int] = {}
+        pending_bytes: Dict[str, int] = {}
+        for download in self.downloads.values():
+            if download.volume is None:
+                continue
+            if download.status == 'moving':
+                remaining = download.total_bytes - download.moved_bytes
+            elif download.status == 'downloading' and not self.staging_path:
+                remaining = download.total_bytes - download.downloaded_bytes
+            else:
+                continue
+            active_writes[download.volume] = active_writes.get(download.volume, 0) + 1
+            pending_bytes[download.volume] = pending_bytes.get(download.volume, 0) + max(0, remaining)
+        return active_writes, pending_bytes
+
+    async def choose_volume(self, folder: str) -> str:
+        """Download root a new file in folder would be placed on now"""
+        return self.volumes.choose(folder, *self.volume_load())
+
+    async def get_volume_status(self) -> Dict:
+        """Download roots with free space and the transfers writing to each"""
+        return {
+            'policy': self.volumes.policy,
+            'volumes': self.volumes.get_status(self.volume_load()[0])
+        }
+
+    def place(self, download: Download, load=None, root: Optional[str] = None):
+        """Choose the download root of a download that hasn't been placed yet
+
+        load is volume_load()'s result, for callers placing several downloads at once.
+        root places it on that root instead of choosing one.
+        """
+        if download.volume is not None:
             return
+        if root is None:
+            root = self.download_path
+            temp_file_path = download.get_temp_file_path()
+            staged = self.staging_path is not None and temp_file_path.startswith(self.staging_path + os.sep)
+            if len(self.volumes.roots) > 1 and (staged or not os.path.exists(temp_file_path)):
+                root = self.volumes.choose(download.folder, *(load or self.volume_load()))
+        download.volume = root
+        download.download_path = root
 
-        current_time = time.time()
-        elapsed = current_time - self.last_rate_limit_time
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE downloads SET volume = ? WHERE id = ?", (root, download.id))
+        conn.commit()
+        conn.close()
 
-        # Reset counter every second
-        if elapsed >= 1.0:
-            self.last_rate_limit_time = current_time
-            self.bytes_this_second = 0
-            elapsed = 0
+    def _by_volume_load(self, queued: List[Download], count: int) -> List[Download]:
+        """Up to count queued downloads to start, spreading their writes over the roots"""
+        if len(self.volumes.roots) == 1:
+            return queued[:count]
+        active_writes, pending_bytes = self.volume_load()
+        candidates = list(queued)
+        chosen = []
+        while candidates and len(chosen) < count:
+            def load(download):
+                if download.volume is not None:
+                    return active_writes.get(download.volume, 0)
+                # Unplaced downloads can go to the least busy root (or their pinned one)
+                pinned = self.volumes.pinned_root(download.folder)
+                if pinned is not None:
+                    return active_writes.get(pinned, 0)
+                return min(active_writes.get(root, 0) for root in self.volumes.roots)
+            download = min(candidates, key=load)  # Stable: queue order breaks ties
+            candidates.remove(download)
+            self.place(download, (active_writes, pending_bytes))
+            # Count it before it starts, so the next one sees this root as busier
+            active_writes[download.volume] = active_writes.get(download.volume, 0) + 1
+            pending_bytes[download.volume] = (pending_bytes.get(download.volume, 0)
+                                              + max(0, download.total_bytes - download.downloaded_bytes))
+            chosen.append(download)
+        return chosen
+
+    def apply_probe(self, download: Download, result: Dict):
+        """Store a metadata probe result; a download that hasn't transferred anything yet takes
+        its size and (if it was named after the URL and probe_filenames is on) the server's
+        filename from it"""
+        if self.downloads.get(download.id) is not download:
+            return  # Cancelled meanwhile
+        download.probe = result
+        untouched = download.status in ('queued', 'paused') and download.downloaded_bytes == 0
+        if untouched and result.get('total_bytes') and download.total_bytes == 0:
+            download.total_bytes = result['total_bytes']
+        remote_filename = result.get('filename')
+        if (untouched and self.probe_filenames and download.filename_from_url and remote_filename
+                and remote_filename != download.filename):
+            reserved = self._get_in_progress_filenames().get(download.folder.replace('\\', '/').strip('/'), set())
+            reserved.discard(download.filename)
+            download.filename = self._get_unique_filename(download.folder, remote_filename, reserved)
+        download.filename_from_url = False
 
-        self.bytes_this_second += bytes_downloaded
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE downloads SET probe = ?, total_bytes = ?, filename = ? WHERE id = ?",
+                     (json.dumps(result), download.total_bytes, download.filename, download.id))
+        conn.commit()
+        conn.close()
 
-        # Calculate how long we should have taken to download this many bytes
-        expected_time = self.bytes_this_second / self.global_rate_limit_bps
+    @property
+    def version(self) -> int:
+        return self.changes.value
 
-        # If we're going too fast, sleep to match the rate limit
-        if expected_time > elapsed:
-            sleep_time = expected_time - elapsed
-            await asyncio.sleep(sleep_time)
+    @version.setter
+    def version(self, value: int):
+        self.changes.set(value)
 
-        # If we've completed a full second worth of data, reset
-        if self.bytes_this_second >= self.global_rate_limit_bps:
-            self.last_rate_limit_time = time.time()
-            self.bytes_this_second = 0
+    def mark_changed(self):
+        """Note a change to the download list that no Download attribute reflects"""
+        self.version += 1
+
+    def record_write(self, seconds: float, nbytes: int):
+        """Account one file write (disk latency input for the auto concurrency controller)"""
+        self.write_seconds += seconds
+        self.write_bytes += nbytes
+
+    def record_stall(self, download: Download, reason: str, gave_up: bool = False):
+        """Count a connection the stall watchdog gave up on ('stalled' or 'slow')"""
+        if reason not in ('stalled', 'slow'):
+            return
+        self.watchdog_events[reason] += 1
+        if gave_up:
+            self.watchdog_events['failed'] += 1
+        else:
+            self.watchdog_events['reconnects'] += 1
+            download.reconnects += 1
+
+    def notify_folder_changed(self, folder: str):
+        """Tell the folder index cache that files in folder changed"""
+        if self.folder_index is not None:
+            self.folder_index.invalidate(folder)
 
     def check_filename_conflict(self, folder: str, filename: str) -> str:
         """Check if filename conflicts and return unique alternative
@@ -461,28 +1294,35 @@ class DownloadManager:
         """
         return self._get_unique_filename(folder, filename)
 
-    def _get_unique_filename(self, folder: str, filename: str) -> str:
+    def _get_in_progress_filenames(self) -> Dict[str, set]:
+        """Map of normalized folder -> filenames of queued/downloading/paused/moving downloads"""
+        in_progress = {}
+        for download in self.downloads.values():
+            if download.status in ['queued', 'downloading', 'paused', 'moving']:
+                # Normalize the download's folder for comparison
+                download_folder = download.folder.replace('\\', '/').strip('/')
+                in_progress.setdefault(download_folder, set()).add(download.filename)
+        return in_progress
+
+    def _get_unique_filename(self, folder: str, filename: str,
+                             in_progress_filenames: Optional[set] = None) -> str:
         """Generate unique filename by appending (1), (2), etc. if file exists
 
         Args:
             folder: Folder path relative to download_path
             filename: Desired filename
+            in_progress_filenames: Precomputed in-progress filenames for this folder
+                                   (optional, computed from self.downloads if omitted)
 
         Returns:
             Unique filename that doesn't conflict with existing files or in-progress downloads
         """
-        folder_path = os.path.join(self.download_path, folder)
-
-        # Normalize folder for comparison (use forward slashes, strip leading/trailing slashes)
-        normalized_folder = folder.replace('\\', '/').strip('/')
+        if in_progress_filenames is None:
+            # Normalize folder for comparison (use forward slashes, strip leading/trailing slashes)
+            normalized_folder = folder.replace('\\', '/').strip('/')
 
-        # Get set of filenames that are in-progress downloads in the same folder
-        in_progress_filenames = set()
-        for download in self.downloads.values():
-            # Normalize the download's folder for comparison
-            download_folder = download.folder.replace('\\', '/').strip('/')
-            if download_folder == normalized_folder and download.status in ['queued', 'downloading', 'paused']:
-                in_progress_filenames.add(download.filename)
+            # Get set of filenames that are in-progress downloads in the same folder
+            in_progress_filenames = self._get_in_progress_filenames().get(normalized_folder, set())
 
         # Split filename into name and extension
         if '.' in filename:
@@ -498,10 +1338,8 @@ class DownloadManager:
         counter = 1
 
         while True:
-            final_path = os.path.join(folder_path, test_filename)
-
-            # Check both: file doesn't exist on disk AND not an in-progress download
-            file_exists = os.path.exists(final_path)
+            # Check both: file doesn't exist on any root AND not an in-progress download
+            file_exists = self.volumes.find_file(folder, test_filename) is not None
             in_progress = test_filename in in_progress_filenames
 
             if not file_exists and not in_progress:
@@ -511,9 +1349,17 @@ class DownloadManager:
             test_filename = f"{name} ({counter}){ext}"
             counter += 1
 
+    def _ensure_folder(self, folder: str):
+        """Create folder if no root has it yet, on the root new files in it would go to"""
+        if not self.volumes.roots_with(folder):
+            root = self.volumes.choose(folder, *self.volume_load())
+            os.makedirs(os.path.join(root, folder), exist_ok=True)
+        self.notify_folder_changed(folder)
+
     async def add_download(self, url: str, folder: str, filename: Optional[str] = None,
                            overwrite: bool = False, user_agent: Optional[str] = None,
-                           cookies: Optional[str] = None) -> str:
+                           cookies: Optional[str] = None, mirrors: Optional[List[str]] = None,
+                           job_type: Optional[str] = None, duplicate_of: Optional[str] = None) -> str:
         """Add new download to queue
 
         Args:
@@ -523,28 +1369,37 @@ class DownloadManager:
             overwrite: If True, delete existing file with same name. If False, auto-rename.
             user_agent: Browser User-Agent string to use for download requests (optional)
             cookies: Browser cookies for this domain (optional, from Chrome extension)
+            mirrors: Other URLs serving the same file, fetched from in parallel (optional)
+            job_type: 'file' or 'stream' (default: 'stream' for .m3u8/.mpd URLs)
+            duplicate_of: ID of an in-flight download of the same URL; this one waits for it
+                          and links its file instead of transferring (see submit_download)
 
         Returns:
             Download ID
         """
+        extension = os.path.splitext(urlparse(url).path)[1].lower()
+        if job_type is None:
+            job_type = 'stream' if extension in STREAM_MANIFEST_EXTENSIONS else 'file'
+
         # Generate filename if not provided
+        filename_from_url = filename is None and job_type == 'file'
         if filename is None:
             filename = url.split('/')[-1].split('?')[0]
             if not filename:
                 filename = 'download'
+            if job_type == 'stream':
+                # Name the saved media, not the manifest
+                filename = os.path.splitext(filename)[0] + STREAM_MANIFEST_EXTENSIONS.get(extension, '.ts')
 
         # Ensure folder exists
-        folder_path = os.path.join(self.download_path, folder)
-        os.makedirs(folder_path, exist_ok=True)
+        self._ensure_folder(folder)
 
         # Handle overwrite or unique filename
         if overwrite:
             # Delete existing final file if overwrite is requested
             # (temp files are ID-based and belong to active downloads, so we don't touch them)
-            final_path = os.path.join(folder_path, filename)
-
-            if os.path.exists(final_path):
-                os.remove(final_path)
+            for root in self.volumes.roots:
+                self.deleter.delete(os.path.join(root, folder, filename), folder)
         else:
             # Get unique filename to avoid overwriting existing files
             filename = self._get_unique_filename(folder, filename)
@@ -560,9 +1415,11 @@ class DownloadManager:
         cursor = conn.cursor()
 
         cursor.execute("""
-            INSERT INTO downloads (id, url, filename, folder, status, user_agent)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (download_id, url, filename, folder, initial_status, user_agent))
+            INSERT INTO downloads (id, url, filename, folder, status, user_agent, mirrors, job_type,
+                                   duplicate_of)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (download_id, url, filename, folder, initial_status, user_agent,
+              json.dumps(mirrors) if mirrors else None, job_type, duplicate_of))
 
         conn.commit()
         conn.close()
@@ -572,46 +1429,186 @@ class DownloadManager:
             download_id, url, folder, filename,
             self.db_path, self.download_path, self,
             user_agent=user_agent,
-            cookies=cookies
+            cookies=cookies,
+            mirrors=mirrors,
+            job_type=job_type
         )
 
+        download.filename_from_url = filename_from_url
+        download.duplicate_of = duplicate_of
+
         # Set status to match what was saved in DB (Download.__init__ defaults to 'queued')
         download.status = initial_status
         if initial_status == 'paused':
             download.paused = True
 
         self.downloads[download_id] = download
+        if duplicate_of is None:
+            self.in_flight.add(download)
 
         # Start processing if not already running
         if not self.processing:
             print(f"Starting process_queue task for download {download_id}")
-            asyncio.create_task(self.process_queue())
+            self._start_processing()
         else:
             print(f"Process queue already running for download {download_id}")
 
         return download_id
 
+    async def submit_download(self, url: str, folder: str, filename: Optional[str] = None,
+                              **options) -> Tuple[str, bool]:
+        """add_download, unless url is already in flight into folder (singleflight)
+
+        With the duplicate_policy setting at 'attach' the in-flight download's ID
+        is returned instead of adding one; with 'link' the new download waits for
+        that transfer and hardlinks (or copies) its file; 'off' always transfers.
+        URLs are compared normalized (see singleflight.normalize_url).
+
+        Returns:
+            (download ID, True if it is the existing download)
+        """
+        policy = self.settings.get('duplicate_policy')
+        existing = self.in_flight.get(url, folder) if policy != 'off' else None
+        if existing is None:
+            return await self.add_download(url, folder, filename, **options), False
+        if policy == 'attach':
+            print(f"{url} is already downloading into '{folder}' as {existing.id}")
+            return existing.id, True
+        return await self.add_download(url, folder, filename, duplicate_of=existing.id, **options), False
+
+    async def add_downloads(self, items: List[Dict], user_agent: Optional[str] = None,
+                            cookies: Optional[str] = None) -> List[str]:
+        """Add many downloads to the queue in a single DB transaction
+
+        Used by directory crawls, where adding entries one at a time would open a
+        connection and rescan all downloads for filename conflicts per entry.
+
+        Args:
+            items: Dicts with 'url', 'folder' and optional 'filename'
+            user_agent: Browser User-Agent string to use for download requests (optional)
+            cookies: Browser cookies for this domain (optional, from Chrome extension)
+
+        Returns:
+            List of download IDs (same order as items)
+        """
+        if not items:
+            return []
+
+        in_progress = self._get_in_progress_filenames()
+        initial_status = 'paused' if self.global_paused else 'queued'
+        created_folders = set()
+        rows = []
+
+        for item in items:
+            url = item['url']
+            folder = item.get('folder', '')
+            filename = item.get('filename')
+            if not filename:
+                filename = url.split('/')[-1].split('?')[0] or 'download'
+
+            if folder not in created_folders:
+                self._ensure_folder(folder)
+                created_folders.add(folder)
+
+            # Reserve the name so later items in this batch don't collide with it
+            reserved = in_progress.setdefault(folder.replace('\\', '/').strip('/'), set())
+            filename = self._get_unique_filename(folder, filename, reserved)
+            reserved.add(filename)
+
+            rows.append((str(uuid.uuid4()), url, filename, folder, initial_status, user_agent))
+
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.executemany("""
+                INSERT INTO downloads (id, url, filename, folder, status, user_agent)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+        conn.close()
+
+        for download_id, url, filename, folder, status, _ in rows:
+            download = Download(
+                download_id, url, folder, filename,
+                self.db_path, self.download_path, self,
+                user_agent=user_agent,
+                cookies=cookies
+            )
+            download.status = status
+            self.in_flight.add(download)
+            if status == 'paused':
+                download.paused = True
+            self.downloads[download_id] = download
+
+        if not self.processing:
+            self._start_processing()
+
+        return [row[0] for row in rows]
+
+    def get_concurrency_limit(self) -> int:
+        """How many downloads may run at once (the cluster's capacity in cluster mode)"""
+        if self.worker_pool is not None:
+            capacity = self.worker_pool.capacity()
+            if capacity is not None:
+                return capacity
+        if self.concurrency_controller is not None:
+            return self.concurrency_controller.limit
+        return self.max_concurrent_downloads
+
+    async def get_concurrency_status(self) -> Dict:
+        """Current limit and, in auto mode, the controller's recent decisions"""
+        status = {
+            'mode': 'auto' if self.concurrency_controller is not None else 'fixed',
+            'limit': self.get_concurrency_limit(),
+            'running': sum(1 for d in self.downloads.values() if d.status == 'downloading')
+        }
+        if self.concurrency_controller is not None:
+            status['controller'] = self.concurrency_controller.get_status()
+        return status
+
+    def _start_processing(self):
+        """Start the process_queue task (marks processing first so it only starts once)"""
+        self.processing = True
+        asyncio.create_task(self.process_queue())
+
     async def process_queue(self):
         """Process download queue respecting concurrency limits"""
         self.processing = True
         print("process_queue started")
+        progressing = False
 
         while True:
+            if self.concurrency_controller is not None:
+                decision = self.concurrency_controller.tick()
+                if decision is not None and decision['limit'] < decision['previous_limit']:
+                    await self.enforce_concurrency_limit()
+
+            max_concurrent = self.get_concurrency_limit()
+
             # Count active downloads (check both status and tasks)
             active_count = sum(1 for d in self.downloads.values()
                              if d.status == 'downloading')
-
-            # Find queued downloads
-            queued = [d for d in self.downloads.values() if d.status == 'queued']
+            moving = any(d.status == 'moving' for d in self.downloads.values())
+            if active_count or moving or progressing:
+                # Byte counters, speed/ETA and mirror/segment state change without a published
+                # attribute set; one more tick after the last transfer ends publishes its final values
+                self.mark_changed()
+            progressing = bool(active_count or moving)
+
+            # Find queued downloads, in the order the queue policy starts them
+            queued = [d for d in self.downloads.values()
+                      if d.status == 'queued' and not self._waits_for_duplicate(d)]
+            if self.prober is not None and self.queue_policy in SIZE_POLICIES:
+                self.prober.schedule(queued)
+            queued = order_queue(self.queue_policy, queued,
+                                 [d for d in self.downloads.values() if d.status == 'downloading'])
 
             # Clean up completed tasks FIRST
             self.active_tasks = [t for t in self.active_tasks if not t.done()]
 
-            print(f"process_queue: active={active_count}, queued={len(queued)}, tasks={len(self.active_tasks)}, max={self.max_concurrent_downloads}, global_paused={self.global_paused}")
+            print(f"process_queue: active={active_count}, queued={len(queued)}, tasks={len(self.active_tasks)}, max={max_concurrent}, global_paused={self.global_paused}")
 
             # Start new downloads if under limit and not globally paused
-            if not self.global_paused and active_count < self.max_concurrent_downloads and queued:
-                for download in queued[:self.max_concurrent_downloads - active_count]:
+            if not self.global_paused and active_count < max_concurrent and queued:
+                for download in self._by_volume_load(queued, max_concurrent - active_count):
                     print(f"Starting download {download.id}")
                     task = asyncio.create_task(download.start())
                     download.task = task
@@ -626,6 +1623,30 @@ class DownloadManager:
 
             await asyncio.sleep(1)
 
+    def _waits_for_duplicate(self, download: Download) -> bool:
+        """Whether download waits for the in-flight download it duplicates; starts linking
+        its file once that completes and lets it transfer itself if that doesn't complete"""
+        if download.duplicate_of is None:
+            return False
+        if download.task is not None and not download.task.done():
+            return True  # Linking
+        source = self.downloads.get(download.duplicate_of)
+        if source is not None and source.status in IN_FLIGHT_STATUSES:
+            return True
+        if source is not None and source.status == 'completed' and os.path.exists(source.get_file_path()):
+            download.task = asyncio.create_task(download.link_from(source))
+            self.active_tasks.append(download.task)
+            return True
+
+        print(f"{download.duplicate_of} didn't complete, {download.id} downloads {download.url} itself")
+        download.duplicate_of = None
+        self.in_flight.add(download)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE downloads SET duplicate_of = NULL WHERE id = ?", (download.id,))
+        conn.commit()
+        conn.close()
+        return False
+
     async def pause_download(self, download_id: str):
         """Pause specific download"""
         if download_id in self.downloads:
@@ -637,6 +1658,14 @@ class DownloadManager:
             download = self.downloads[download_id]
             await download.resume()  # This will raise ValueError if not paused
 
+            if download.duplicate_of is not None:
+                # Waits for the download it duplicates again
+                download.status = 'queued'
+                download.update_db()
+                if not self.processing:
+                    self._start_processing()
+                return
+
             # Start download immediately, bypassing global pause
             download.status = 'downloading'
             download.update_db()
@@ -648,7 +1677,7 @@ class DownloadManager:
 
             # Ensure processing loop is running for queue management
             if not self.processing:
-                asyncio.create_task(self.process_queue())
+                self._start_processing()
 
     async def cancel_download(self, download_id: str, delete_file: bool = None):
         """Cancel download and remove from queue
@@ -659,8 +1688,11 @@ class DownloadManager:
                         If None (default), delete only if download is incomplete.
         """
         if download_id in self.downloads:
+            if self.prober is not None:
+                self.prober.cancel(download_id)
             await self.downloads[download_id].cancel(delete_file=delete_file)
             del self.downloads[download_id]
+            self.mark_changed()
 
             # Remove from database
             conn = sqlite3.connect(self.db_path)
@@ -669,14 +1701,34 @@ class DownloadManager:
             conn.commit()
             conn.close()
 
+    def _begin_batch(self):
+        """Hold update_db() writes until _end_batch() (downloads running meanwhile are held too)"""
+        if self.pending_writes is None:
+            self.pending_writes = {}
+
+    def _end_batch(self, deleted_ids=()):
+        """Write the held updates and delete the rows of deleted_ids in one transaction"""
+        pending, self.pending_writes = self.pending_writes or {}, None
+        deleted_ids = set(deleted_ids)
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.executemany(Download.UPDATE_SQL, [download.db_values() for download in pending.values()
+                                                   if download.id not in deleted_ids])
+            conn.executemany("DELETE FROM downloads WHERE id = ?", [(i,) for i in deleted_ids])
+        conn.close()
+
     async def pause_all(self):
         """Enable global pause mode - pauses all downloads and prevents new ones from starting"""
         self.global_paused = True
 
         # Pause all downloads that are downloading or queued
-        for download in self.downloads.values():
-            if download.status in ['downloading', 'queued']:
-                await download.pause()
+        self._begin_batch()
+        try:
+            for download in self.downloads.values():
+                if download.status in ['downloading', 'queued']:
+                    await download.pause()
+        finally:
+            self._end_batch()
 
     async def resume_all(self):
         """Disable global pause mode - resumes all paused downloads"""
@@ -684,69 +1736,206 @@ class DownloadManager:
 
         # Change paused downloads to queued status
         # Let process_queue() handle starting them with proper concurrency limits
-        for download in self.downloads.values():
-            if download.status == 'paused':
-                download.paused = False
-                download.status = 'queued'
-                download.update_db()
+        self._begin_batch()
+        try:
+            for download in self.downloads.values():
+                if download.status == 'paused':
+                    download.paused = False
+                    download.status = 'queued'
+                    download.update_db()
+        finally:
+            self._end_batch()
 
         # Start processing queue if not already running
         if not self.processing:
-            asyncio.create_task(self.process_queue())
+            self._start_processing()
+
+    async def bulk_update(self, action: str, download_filter, delete_files: bool = False) -> Dict:
+        """Apply action to every download download_filter matches, with one DB transaction
+
+        'pause', 'resume' (back to the queue) and 'retry' (failed downloads back
+        to the queue, keeping partial data) change statuses; 'cancel' stops and
+        removes unfinished downloads with their partial files; 'delete' removes
+        downloads in any state - their finished files only if delete_files.
+        Files are deleted by the background deleter. Downloads whose status the
+        action doesn't apply to are skipped.
+
+        Args:
+            action: One of BULK_ACTIONS
+            download_filter: ws_subscriptions.DownloadFilter selecting the downloads
+
+        Returns:
+            {'updated': [ids], 'skipped': {id: reason}, 'not_found': [ids]}
+        """
+        if action not in self.BULK_ACTIONS:
+            raise ValueError(f"Unknown action '{action}'")
+        statuses = self.BULK_ACTIONS[action]
+
+        targets = []
+        skipped = {}
+        for download in self.downloads.values():
+            if not download_filter.matches(download):
+                continue
+            if statuses is not None and download.status not in statuses:
+                skipped[download.id] = f"Cannot {action} download with status '{download.status}'"
+            else:
+                targets.append(download)
+        not_found = sorted(set(download_filter.ids or ()) - self.downloads.keys())
+
+        removed = []
+        self._begin_batch()
+        try:
+            if action == 'pause':
+                for download in targets:
+                    await download.pause()
+            elif action in ('resume', 'retry'):
+                for download in targets:
+                    download.paused = False
+                    download.status = 'queued'
+                    download.error_message = None
+                    download.speed_bps = 0
+                    download.eta_seconds = 0
+                    download.update_db()
+            else:
+                for download in targets:
+                    if self.prober is not None:
+                        self.prober.cancel(download.id)
+                await asyncio.gather(*(download.cancel(delete_file=True if delete_files else None)
+                                       for download in targets), return_exceptions=True)
+                for download in targets:
+                    self.downloads.pop(download.id, None)
+                    removed.append(download.id)
+        finally:
+            self._end_batch(removed)
+
+        if targets:
+            self.mark_changed()
+            if action in ('resume', 'retry') and not self.processing:
+                self._start_processing()
+
+        return {
+            'updated': [download.id for download in targets],
+            'skipped': skipped,
+            'not_found': not_found
+        }
+
+    async def get_deletion_status(self) -> Dict:
+        return self.deleter.get_status()
+
+    async def get_watchdog_status(self) -> Dict:
+        """Stall watchdog settings, event counters and the downloads that needed reconnects"""
+        return {
+            **self.watchdog.to_dict(),
+            'events': dict(self.watchdog_events),
+            'downloads': [
+                {'id': d.id, 'status': d.status, 'reconnects': d.reconnects}
+                for d in self.downloads.values() if d.reconnects
+            ]
+        }
+
+    async def start_crawl(self, url: str, folder: str, include: Optional[List[str]] = None,
+                          exclude: Optional[List[str]] = None, max_depth: int = 5,
+                          concurrency: int = 4, max_files: int = 0,
+                          user_agent: Optional[str] = None, cookies: Optional[str] = None) -> str:
+        """Start crawling a directory listing and enqueue every file found
+
+        Args:
+            url: URL of the index page (Apache/nginx autoindex style listing)
+            folder: Folder path relative to download_path; the remote tree is recreated below it
+            include: Glob patterns a file's relative path or name must match (optional)
+            exclude: Glob patterns that skip a file (optional)
+            max_depth: How many directory levels below the index page to follow
+            concurrency: Index pages fetched in parallel
+            max_files: Stop after this many files (0 = no limit)
+            user_agent: Browser User-Agent string (optional)
+            cookies: Browser cookies for this domain (optional, from Chrome extension)
+
+        Returns:
+            Crawl ID
+        """
+        from crawler import DirectoryCrawler
+
+        crawl_id = str(uuid.uuid4())
+        crawl = DirectoryCrawler(
+            crawl_id, url, folder, self,
+            include=include, exclude=exclude, max_depth=max_depth,
+            concurrency=concurrency, max_files=max_files,
+            user_agent=user_agent, cookies=cookies
+        )
+        self.crawls[crawl_id] = crawl
+        crawl.task = asyncio.create_task(crawl.run())
+        return crawl_id
+
+    async def cancel_crawl(self, crawl_id: str):
+        """Stop a running crawl and forget it (already queued downloads are kept)"""
+        if crawl_id in self.crawls:
+            await self.crawls[crawl_id].cancel()
+            del self.crawls[crawl_id]
+
+    async def get_crawls(self) -> List[Dict]:
+        """Get all crawl jobs with progress info"""
+        return [crawl.get_status() for crawl in self.crawls.values()]
 
     async def get_downloads(self) -> List[Dict]:
         """Get all downloads with progress info"""
         return [download.get_progress() for download in self.downloads.values()]
 
+    async def find_unfinished(self, folder: str, filename: str) -> Optional[Download]:
+        """Queued/downloading/paused/moving download that will create folder/filename"""
+        folder = folder.replace('\\', '/').strip('/')
+        for download in self.downloads.values():
+            if (download.status in ('queued', 'downloading', 'paused', 'moving')
+                    and download.filename == filename
+                    and download.folder.replace('\\', '/').strip('/') == folder):
+                return download
+        return None
+
+    async def start_workers(self, count: int):
+        """Run transfers in count worker processes from now on (this manager coordinates)"""
+        from worker_pool import WorkerPool
+
+        pool = WorkerPool(self, count)
+        pool.start()
+        await pool.set_rate_limit(self.global_rate_limit_bps)
+        self.worker_pool = pool
+
+    async def start_cluster(self, lease_seconds: float = 30):
+        """Coordinate a cluster: downloads run on worker nodes that register over HTTP"""
+        from cluster import ClusterCoordinator
+
+        coordinator = ClusterCoordinator(self, lease_seconds=lease_seconds)
+        coordinator.start()
+        await coordinator.set_rate_limit(self.global_rate_limit_bps)
+        self.worker_pool = coordinator
+
+    async def stop_workers(self):
+        """Stop the worker processes (running transfers are paused and requeued)"""
+        if self.worker_pool is not None:
+            pool, self.worker_pool = self.worker_pool, None
+            await pool.close()
+
     async def set_rate_limit(self, bps: int):
         """Set global rate limit"""
-        self.global_rate_limit_bps = max(0, bps)
-
-        # Update database
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE settings SET value = ? WHERE key = 'global_rate_limit_bps'",
-            (str(bps),)
-        )
-        conn.commit()
-        conn.close()
+        self.settings.update({'global_rate_limit_bps': max(0, bps)})
 
     async def set_max_concurrent_downloads(self, max_concurrent: int):
         """Set max concurrent downloads and enforce the limit immediately"""
-        old_value = self.max_concurrent_downloads
-        self.max_concurrent_downloads = max(1, max_concurrent)
-
-        # Update database
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE settings SET value = ? WHERE key = 'max_concurrent_downloads'",
-            (str(max_concurrent),)
-        )
-        conn.commit()
-        conn.close()
-
-        # If limit was reduced, enforce it by pausing excess downloads
-        if self.max_concurrent_downloads < old_value:
-            await self.enforce_concurrency_limit()
+        self.settings.update({'max_concurrent_downloads': max(1, max_concurrent)})
 
     async def enforce_concurrency_limit(self):
         """Pause excess downloads if over the max concurrent limit"""
         # Get all currently downloading items
         downloading = [d for d in self.downloads.values() if d.status == 'downloading']
 
+        max_concurrent = self.get_concurrency_limit()
+
         # If we're over the limit, pause excess downloads (keep the first N)
-        if len(downloading) > self.max_concurrent_downloads:
+        if len(downloading) > max_concurrent:
             # Sort by some order (could be start time, but we'll just use the order we find them)
-            # Keep the first max_concurrent_downloads, pause the rest
-            to_pause = downloading[self.max_concurrent_downloads:]
+            # Keep the first max_concurrent, requeue the rest
+            to_pause = downloading[max_concurrent:]
 
             for download in to_pause:
                 print(f"Enforcing concurrency limit: pausing download {download.id}")
-                # Set paused flag and update status - this will make the download stop gracefully
-                download.paused = True
-                download.status = 'queued'  # Set to queued so it will resume when slot opens
-                download.speed_bps = 0
-                download.eta_seconds = 0
-                download.update_db()
+                # Back to queued so it resumes (from its temp file) when a slot opens
+                download.requeue()
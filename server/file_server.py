@@ -0,0 +1,78 @@
+import os
+import time
+from typing import Callable, Optional
+
+
+# Fallback body (no raw socket from the server): bytes read per chunk
+READ_CHUNK = 1024 * 1024
+
+# Following an in-progress file: how often to look for new data, and when to give up
+# on a transfer that stopped growing (paused, stalled) - the response then ends short
+FOLLOW_POLL_INTERVAL = 0.5
+FOLLOW_TIMEOUT = 60.0
+
+
+def file_etag(st: os.stat_result) -> str:
+    """Strong ETag of a finished file (changes whenever the file is replaced or modified)"""
+    return f"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"
+
+
+class FileBody:
+    """WSGI response body sending length bytes of an open file from start
+
+    Under the development server the route passes the connection's socket
+    (environ['werkzeug.socket']): the body then yields one empty chunk, which
+    makes the server send the status line and headers, and writes the file
+    itself with socket.sendfile (os.sendfile - the data never enters Python).
+    Elsewhere it falls back to yielding READ_CHUNK reads.
+
+    For an in-progress download, growing() says whether the transfer may still
+    add data; bytes past the current end of the file are waited for until
+    they are written, the transfer ends, or FOLLOW_TIMEOUT passes without
+    growth. The file object is kept open, so a download that finishes and is
+    moved meanwhile is still read to the end.
+    """
+
+    def __init__(self, f, start: int, length: int, socket=None,
+                 growing: Optional[Callable[[], bool]] = None):
+        self.f = f
+        self.start = start
+        self.length = length
+        self.socket = socket
+        self.growing = growing
+
+    def _available(self, position: int) -> int:
+        """Bytes readable at position now, waiting for growth if there are none yet"""
+        waited_since = time.monotonic()
+        while True:
+            available = os.fstat(self.f.fileno()).st_size - position
+            if available > 0 or self.growing is None:
+                return max(0, available)
+            if not self.growing() or time.monotonic() - waited_since > FOLLOW_TIMEOUT:
+                return 0
+            time.sleep(FOLLOW_POLL_INTERVAL)
+
+    def __iter__(self):
+        position = self.start
+        end = self.start + self.length
+        if self.socket is not None:
+            yield b''  # The server sends the headers before its first body write
+        while position < end:
+            count = min(end - position, self._available(position))
+            if count == 0:
+                return
+            if self.socket is not None:
+                sent = self.socket.sendfile(self.f, position, count)
+                if sent == 0:
+                    return
+                position += sent
+            else:
+                self.f.seek(position)
+                data = self.f.read(min(count, READ_CHUNK))
+                if not data:
+                    return
+                position += len(data)
+                yield data
+
+    def close(self):
+        self.f.close()
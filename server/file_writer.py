@@ -0,0 +1,210 @@
+import mmap
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+
+# 'cached':  plain writes through the page cache (default)
+# 'fadvise': plain writes, flushed and dropped from the page cache as the file grows
+# 'odirect': aligned O_DIRECT writes that bypass the page cache entirely
+WRITE_MODES = ('cached', 'fadvise', 'odirect')
+
+# O_DIRECT needs file offsets, lengths and buffer addresses aligned to the block size
+ALIGNMENT = 4096
+
+# fadvise mode: written bytes are flushed and dropped once this much has accumulated
+DROP_INTERVAL = 64 * 1024 * 1024
+
+# odirect mode: bytes collected per aligned write (two buffers per file)
+DIRECT_BLOCK_SIZE = 4 * 1024 * 1024
+
+# Disk work (fdatasync + fadvise, O_DIRECT writes) runs here so the event loop never
+# waits for the device; each file has at most one job in flight
+_io_pool: Optional[ThreadPoolExecutor] = None
+
+
+def choose_write_mode(mode: str, threshold: int, total_bytes: int) -> str:
+    """Write mode for a file of total_bytes (0 = unknown): mode only applies from threshold up"""
+    if mode == 'cached' or total_bytes < max(threshold, 1):
+        return 'cached'
+    return mode
+
+
+def _submit(fn, *args) -> Future:
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='file-writer')
+    return _io_pool.submit(fn, *args)
+
+
+def _flush_and_drop(fd: int, offset: int, length: int):
+    """Write back a range and drop it from the page cache (closes fd, a dup)"""
+    try:
+        os.fdatasync(fd)
+        os.posix_fadvise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass  # Only a cache hint - the data itself was written
+    finally:
+        os.close(fd)
+
+
+def _pwrite_all(fd: int, data, offset: int):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+def release_range(fd: int, offset: int, length: int) -> Optional[Future]:
+    """Flush and drop offset..offset+length of fd from the page cache in the background"""
+    if length <= 0 or not hasattr(os, 'posix_fadvise'):
+        return None
+    return _submit(_flush_and_drop, os.dup(fd), offset, length)
+
+
+class FileWriter:
+    """Appends a transfer's bytes to its temp file in one of the WRITE_MODES
+
+    Multi-hundred-GB downloads written through the page cache push everything
+    else out of it (directory metadata, other services' working sets) for data
+    nobody reads soon. 'fadvise' keeps normal buffered writes but every
+    DROP_INTERVAL bytes hands the written range to a background thread that
+    fdatasync()s it and drops it with posix_fadvise(DONTNEED). 'odirect' collects
+    DIRECT_BLOCK_SIZE blocks in page-aligned buffers and writes them with
+    O_DIRECT from a background thread while the next block fills; an unaligned
+    head (when resuming) and the final tail go through the normal descriptor.
+    Filesystems without O_DIRECT (tmpfs, some network mounts) fall back to
+    'fadvise'.
+    """
+
+    def __init__(self, path: str, offset: int, mode: str = 'cached'):
+        """Open path for appending at offset (0 = create/truncate)"""
+        if mode not in WRITE_MODES:
+            raise ValueError(f"Unknown write mode '{mode}'")
+        self.path = path
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_TRUNC if offset == 0 else 0)
+        self.fd = os.open(path, flags, 0o644)
+        os.lseek(self.fd, offset, os.SEEK_SET)
+        self.offset = offset
+        self.mode = 'cached'
+        self.released = offset  # fadvise: everything before this was handed to the dropper
+
+        self.direct_fd = None
+        self.buffers = []
+        self.filled = 0
+        self.pending: Optional[Future] = None
+        self.set_mode(mode)
+
+    def set_mode(self, mode: str):
+        """Switch modes (before anything was written, after restart(), or from 'cached')"""
+        if mode == self.mode:
+            return
+        if mode == 'odirect':
+            if not self._open_direct():
+                mode = 'fadvise'
+        elif self.direct_fd is not None:
+            os.close(self.direct_fd)
+            self.direct_fd = None
+        self.mode = mode
+        self.released = self.offset
+
+    def _open_direct(self) -> bool:
+        if not hasattr(os, 'O_DIRECT'):
+            return False
+        try:
+            self.direct_fd = os.open(self.path, os.O_WRONLY | os.O_DIRECT)
+        except OSError as e:
+            print(f"O_DIRECT not available for {self.path} ({e}), using fadvise write mode")
+            return False
+        if not self.buffers:
+            # Anonymous mmaps are page aligned, as O_DIRECT requires
+            self.buffers = [mmap.mmap(-1, DIRECT_BLOCK_SIZE), mmap.mmap(-1, DIRECT_BLOCK_SIZE)]
+        return True
+
+    def write(self, data):
+        view = memoryview(data).cast('B')
+        if self.mode == 'odirect':
+            self._write_direct(view)
+            return
+        self.offset += len(view)
+        while view:
+            written = os.write(self.fd, view)
+            view = view[written:]
+        if self.mode == 'fadvise' and self.offset - self.released >= DROP_INTERVAL:
+            self._release()
+
+    def _release(self):
+        release_range(self.fd, self.released, self.offset - self.released)
+        self.released = self.offset
+
+    def _write_direct(self, data: memoryview):
+        # Unaligned start (resume): write up to the next boundary through the page cache
+        buffered_offset = self.offset + self.filled
+        head = (-buffered_offset) % ALIGNMENT if self.filled == 0 else 0
+        if head:
+            part = data[:head]
+            _pwrite_all(self.fd, part, self.offset)
+            release_range(self.fd, self.offset, len(part))
+            self.offset += len(part)
+            data = data[len(part):]
+
+        while data:
+            buffer = self.buffers[0]
+            size = min(len(data), DIRECT_BLOCK_SIZE - self.filled)
+            buffer[self.filled:self.filled + size] = data[:size]
+            self.filled += size
+            data = data[size:]
+            if self.filled == DIRECT_BLOCK_SIZE:
+                self._submit_block()
+
+    def _submit_block(self):
+        self._wait()
+        buffer = self.buffers[0]
+        self.pending = _submit(_pwrite_all, self.direct_fd, buffer, self.offset)
+        self.offset += DIRECT_BLOCK_SIZE
+        self.filled = 0
+        # Fill the other buffer while this one is written
+        self.buffers.reverse()
+
+    def _wait(self):
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            pending.result()  # Raises the write's OSError here
+
+    def flush(self) -> int:
+        """Wait for background writes; returns how many bytes of the file are written
+        ('odirect' holds back a partly filled block until it is full or the file is closed)"""
+        self._wait()
+        return self.offset
+
+    def restart(self):
+        """Discard everything written (server ignored Range) and start at offset 0"""
+        self._wait()
+        self.filled = 0
+        os.ftruncate(self.fd, 0)
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        self.offset = 0
+        self.released = 0
+
+    def close(self):
+        try:
+            self._wait()
+            if self.mode == 'odirect' and self.filled:
+                # Tail shorter than a block: normal write, then drop it too
+                tail = memoryview(self.buffers[0])[:self.filled]
+                _pwrite_all(self.fd, tail, self.offset)
+                tail.release()
+                release_range(self.fd, self.offset, self.filled)
+                self.offset += self.filled
+                self.filled = 0
+            elif self.mode == 'fadvise':
+                self._release()
+        finally:
+            if self.direct_fd is not None:
+                os.close(self.direct_fd)
+                self.direct_fd = None
+            os.close(self.fd)
+            for buffer in self.buffers:
+                buffer.close()
+            self.buffers = []
@@ -0,0 +1,357 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class FolderNode:
+    """One cached directory in the folder index"""
+
+    __slots__ = ('path', 'name', 'parent', 'mtime_ns', 'checked_at', 'subdirs',
+                 'file_count', 'file_bytes', 'total_files', 'total_bytes', 'scanned',
+                 'identity', 'loop')
+
+    def __init__(self, path: str, parent: Optional['FolderNode']):
+        self.path = path                      # Relative to root, forward slashes, '' for root
+        self.name = path.rsplit('/', 1)[-1]
+        self.parent = parent
+        self.mtime_ns = None                  # Directory mtime at last scan
+        self.checked_at = 0.0                 # When mtime was last compared
+        self.subdirs: Dict[str, 'FolderNode'] = {}
+        self.file_count = 0                   # Files directly in this folder
+        self.file_bytes = 0
+        self.total_files = 0                  # Including all scanned subfolders
+        self.total_bytes = 0
+        self.scanned = False
+        self.identity = None                  # (st_dev, st_ino) of the directory
+        self.loop = False                     # Symlink to one of its ancestors: listed, not expanded
+
+
+class FolderIndex:
+    """In-memory cache of the download directory tree
+
+    Each folder is scanned once with os.scandir and then only revalidated by
+    comparing its mtime (one stat), at most once per ttl seconds. Creating,
+    renaming or deleting an entry changes the parent directory's mtime, so a
+    changed folder is rescanned and the change in its file count/size is
+    propagated to its ancestors instead of re-walking the tree. Callers that
+    change files themselves (downloads, folder creation) call invalidate() so
+    the next request sees the change without waiting for the ttl.
+    """
+
+    def __init__(self, root: str, ttl: float = 5.0, track_sizes: bool = True):
+        self.root = os.path.abspath(root)
+        self.ttl = ttl
+        self.track_sizes = track_sizes
+        self.nodes: Dict[str, FolderNode] = {'': FolderNode('', None)}
+        self.lock = threading.RLock()
+        self.warm = False
+        self.scans = 0
+
+    @staticmethod
+    def normalize(relative_path: str) -> str:
+        """Normalize a relative path to the index key format"""
+        return relative_path.replace('\\', '/').strip('/')
+
+    def _abs(self, node: FolderNode) -> str:
+        return os.path.join(self.root, node.path) if node.path else self.root
+
+    # ------------------------------------------------------------------
+    # Scanning
+    # ------------------------------------------------------------------
+
+    def _propagate(self, node: Optional[FolderNode], files_delta: int, bytes_delta: int):
+        while node is not None and (files_delta or bytes_delta):
+            node.total_files += files_delta
+            node.total_bytes += bytes_delta
+            node = node.parent
+
+    def _drop(self, node: FolderNode):
+        """Remove node and its subtree from the index"""
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            stack.extend(current.subdirs.values())
+            self.nodes.pop(current.path, None)
+
+    def _scan(self, node: FolderNode, mtime_ns: int):
+        """Re-read one directory and fold the differences into the aggregates"""
+        subdir_names = set()
+        file_count = 0
+        file_bytes = 0
+
+        loops = set()
+
+        with os.scandir(self._abs(node)) as entries:
+            for entry in entries:
+                try:
+                    # Symlinked folders are followed (NAS trees are often assembled from links)
+                    if entry.is_dir():
+                        subdir_names.add(entry.name)
+                        if entry.is_symlink() and self._is_ancestor(node, entry.stat()):
+                            loops.add(entry.name)
+                    elif entry.is_file(follow_symlinks=False):
+                        file_count += 1
+                        if self.track_sizes:
+                            file_bytes += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    # Entry vanished while scanning
+                    continue
+
+        files_delta = file_count - node.file_count
+        bytes_delta = file_bytes - node.file_bytes
+
+        for name in list(node.subdirs):
+            if name not in subdir_names:
+                removed = node.subdirs.pop(name)
+                files_delta -= removed.total_files
+                bytes_delta -= removed.total_bytes
+                self._drop(removed)
+
+        for name in subdir_names:
+            if name not in node.subdirs:
+                child_path = f"{node.path}/{name}" if node.path else name
+                child = FolderNode(child_path, node)
+                node.subdirs[name] = child
+                self.nodes[child_path] = child
+            node.subdirs[name].loop = name in loops
+
+        node.file_count = file_count
+        node.file_bytes = file_bytes
+        node.mtime_ns = mtime_ns
+        node.scanned = True
+        self._propagate(node, files_delta, bytes_delta)
+        self.scans += 1
+
+    @staticmethod
+    def _is_ancestor(node: FolderNode, st: os.stat_result) -> bool:
+        """Whether st is the directory of node or one of its ancestors (a symlink loop)"""
+        identity = (st.st_dev, st.st_ino)
+        while node is not None:
+            if node.identity == identity:
+                return True
+            node = node.parent
+        return False
+
+    def _refresh(self, node: FolderNode, force: bool = False) -> bool:
+        """Revalidate node against disk if its ttl expired. Returns False if it no longer exists."""
+        now = time.monotonic()
+        if not force and node.scanned and now - node.checked_at < self.ttl:
+            return True
+
+        try:
+            st = os.stat(self._abs(node))
+        except OSError:
+            if node.parent is not None:
+                node.parent.subdirs.pop(node.name, None)
+                self._propagate(node.parent, -node.total_files, -node.total_bytes)
+                self._drop(node)
+            return False
+
+        node.checked_at = now
+        node.identity = (st.st_dev, st.st_ino)
+        if node.loop:
+            node.scanned = True
+            return True
+        if not node.scanned or st.st_mtime_ns != node.mtime_ns:
+            try:
+                self._scan(node, st.st_mtime_ns)
+            except (NotADirectoryError, FileNotFoundError, PermissionError):
+                return False
+        return True
+
+    def _lookup(self, relative_path: str) -> Optional[FolderNode]:
+        """Find (or lazily attach) the node for a relative path, refreshing each level"""
+        key = self.normalize(relative_path)
+        node = self.nodes.get(key)
+        if node is not None:
+            return node if self._refresh(node) else None
+
+        # Walk down from the root so parents are indexed and the path is validated
+        node = self.nodes['']
+        if not self._refresh(node):
+            return None
+        for part in key.split('/'):
+            child = node.subdirs.get(part)
+            if child is None and self._refresh(node, force=True):
+                # Created since the last scan? (one stat if nothing changed)
+                child = node.subdirs.get(part)
+            if child is None or not self._refresh(child):
+                return None
+            node = child
+        return node
+
+    def warm_up(self):
+        """Scan the whole tree (run in a background thread at startup)"""
+        stack = [self.nodes['']]
+        while stack:
+            with self.lock:
+                node = stack.pop()
+                if self._refresh(node):
+                    stack.extend(node.subdirs.values())
+        self.warm = True
+
+    def start_warm_up(self) -> threading.Thread:
+        thread = threading.Thread(target=self.warm_up, daemon=True)
+        thread.start()
+        return thread
+
+    def invalidate(self, relative_path: str):
+        """Force the next access to rescan this folder and revalidate its indexed parent"""
+        key = self.normalize(relative_path)
+        with self.lock:
+            node = self.nodes.get(key)
+            if node is not None:
+                node.checked_at = 0.0
+                node.mtime_ns = None
+
+            # New folders (possibly several levels, from makedirs) change the
+            # listing of the closest ancestor that is already indexed
+            while key:
+                key = key.rsplit('/', 1)[0] if '/' in key else ''
+                parent = self.nodes.get(key)
+                if parent is not None:
+                    parent.checked_at = 0.0
+                    break
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def _describe(self, node: FolderNode, depth: int, sizes: bool) -> Dict:
+        info = {'name': node.name, 'path': node.path}
+        exists = self._refresh(node) if sizes or depth > 1 else True
+        if sizes:
+            info['file_count'] = node.total_files
+            info['total_bytes'] = node.total_bytes if self.track_sizes else None
+        if depth > 1:
+            if exists:
+                info['folders'] = [
+                    self._describe(child, depth - 1, sizes)
+                    for child in sorted(node.subdirs.values(), key=lambda n: n.name.lower())
+                ]
+            else:
+                info['folders'] = []
+        return info
+
+    def exists(self, relative_path: str) -> bool:
+        with self.lock:
+            return self._lookup(relative_path) is not None
+
+    def list_folders(self, relative_path: str = '', depth: int = 1,
+                     sizes: bool = False) -> Optional[List[Dict]]:
+        """Subfolders of relative_path, nested up to depth levels. None if the path doesn't exist."""
+        with self.lock:
+            node = self._lookup(relative_path)
+            if node is None:
+                return None
+            return [
+                self._describe(child, depth, sizes)
+                for child in sorted(node.subdirs.values(), key=lambda n: n.name.lower())
+            ]
+
+    def search(self, prefix: str, relative_path: str = '', limit: int = 100,
+               sizes: bool = False) -> Optional[List[Dict]]:
+        """Indexed folders below relative_path whose name or path starts with prefix"""
+        base = self.normalize(relative_path)
+        needle = self.normalize(prefix).lower()
+        results = []
+
+        with self.lock:
+            if self._lookup(base) is None:
+                return None
+            for path, node in self.nodes.items():
+                if not path or (base and not path.startswith(base + '/')):
+                    continue
+                relative = path[len(base) + 1:] if base else path
+                if relative.lower().startswith(needle) or node.name.lower().startswith(needle):
+                    results.append(node)
+
+            results.sort(key=lambda n: n.path.lower())
+            results = [self._describe(node, 1, sizes) for node in results[:limit]]
+        return results
+
+    def get_summary(self, relative_path: str = '') -> Optional[Dict]:
+        """Aggregate file count/size for a folder"""
+        with self.lock:
+            node = self._lookup(relative_path)
+            if node is None:
+                return None
+            return {
+                'path': node.path,
+                'file_count': node.total_files,
+                'total_bytes': node.total_bytes if self.track_sizes else None,
+                'complete': self.warm
+            }
+
+
+class MultiRootFolderIndex:
+    """Merged view of several FolderIndex trees (one per download volume)
+
+    Same interface as FolderIndex. A folder present on several roots appears
+    once; its file counts and sizes are the sums over the roots.
+    """
+
+    def __init__(self, roots: List[str], ttl: float = 5.0, track_sizes: bool = True):
+        self.indexes = [FolderIndex(root, ttl=ttl, track_sizes=track_sizes) for root in roots]
+        self.track_sizes = track_sizes
+
+    @property
+    def warm(self) -> bool:
+        return all(index.warm for index in self.indexes)
+
+    def start_warm_up(self) -> List[threading.Thread]:
+        return [index.start_warm_up() for index in self.indexes]
+
+    def invalidate(self, relative_path: str):
+        for index in self.indexes:
+            index.invalidate(relative_path)
+
+    def exists(self, relative_path: str) -> bool:
+        return any(index.exists(relative_path) for index in self.indexes)
+
+    @staticmethod
+    def _merge(listings: List[List[Dict]]) -> List[Dict]:
+        merged: Dict[str, Dict] = {}
+        nested: Dict[str, List[List[Dict]]] = {}
+        for listing in listings:
+            for info in listing:
+                current = merged.get(info['path'])
+                if current is None:
+                    merged[info['path']] = current = {k: v for k, v in info.items() if k != 'folders'}
+                elif 'file_count' in info:
+                    current['file_count'] += info['file_count']
+                    if current['total_bytes'] is not None:
+                        current['total_bytes'] += info['total_bytes']
+                if 'folders' in info:
+                    nested.setdefault(info['path'], []).append(info['folders'])
+        for path, children in nested.items():
+            merged[path]['folders'] = MultiRootFolderIndex._merge(children)
+        return sorted(merged.values(), key=lambda info: info['name'].lower())
+
+    def list_folders(self, relative_path: str = '', depth: int = 1,
+                     sizes: bool = False) -> Optional[List[Dict]]:
+        listings = [index.list_folders(relative_path, depth, sizes) for index in self.indexes]
+        listings = [listing for listing in listings if listing is not None]
+        return self._merge(listings) if listings else None
+
+    def search(self, prefix: str, relative_path: str = '', limit: int = 100,
+               sizes: bool = False) -> Optional[List[Dict]]:
+        results = [index.search(prefix, relative_path, limit, sizes) for index in self.indexes]
+        results = [result for result in results if result is not None]
+        if not results:
+            return None
+        merged = sorted(self._merge(results), key=lambda info: info['path'].lower())
+        return merged[:limit]
+
+    def get_summary(self, relative_path: str = '') -> Optional[Dict]:
+        summaries = [index.get_summary(relative_path) for index in self.indexes]
+        summaries = [summary for summary in summaries if summary is not None]
+        if not summaries:
+            return None
+        return {
+            'path': summaries[0]['path'],
+            'file_count': sum(s['file_count'] for s in summaries),
+            'total_bytes': sum(s['total_bytes'] for s in summaries) if self.track_sizes else None,
+            'complete': self.warm
+        }
@@ -0,0 +1,251 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Dict, List, Optional
+
+
+class LoopMonitor:
+    """Event loop health monitor for the background download loop
+
+    Two parts:
+    - Lag sampler (always on): a coroutine that sleeps for a fixed interval and
+      records how late it wakes up. Lag means something blocked the loop.
+    - Slow callback detector (opt-in): wraps asyncio's callback dispatch for
+      this loop, and a watchdog thread grabs the loop thread's stack while a
+      callback is still running past the threshold. Finished slow callbacks
+      are aggregated so the worst offenders can be inspected via the API.
+    """
+
+    # Lag above this is counted as a stall (seconds)
+    STALL_THRESHOLD = 0.1
+
+    # Maximum distinct offenders to keep (least severe are dropped first)
+    MAX_OFFENDERS = 50
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, sample_interval: float = 0.5,
+                 window_size: int = 600):
+        self.loop = loop
+        self.sample_interval = sample_interval
+
+        # Lag sampler state
+        self.lag_samples = deque(maxlen=window_size)
+        self.max_lag = 0.0
+        self.stall_count = 0
+        self.sampler_future = None
+
+        # Slow callback detector state
+        self.slow_callback_threshold = 0.0  # seconds, 0 = disabled
+        self.loop_thread_id = None
+        self.offenders: Dict[tuple, Dict] = {}
+        self.slow_callback_count = 0
+        self._current = None  # (token, handle, start_time) of the running callback
+        self._captured_stacks: Dict[int, List[str]] = {}
+        self._token = 0
+        self._lock = threading.Lock()
+        self._watchdog = None
+        self._watchdog_stop = threading.Event()
+        self._original_handle_run = None
+
+    # ------------------------------------------------------------------
+    # Lag sampler
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Start the lag sampler on the monitored loop (thread-safe)"""
+        if self.sampler_future is None:
+            self.sampler_future = asyncio.run_coroutine_threadsafe(self._sample_lag(), self.loop)
+
+    async def _sample_lag(self):
+        """Sleep for the sample interval and record how late we woke up"""
+        self.loop_thread_id = threading.get_ident()
+        while True:
+            expected = self.loop.time() + self.sample_interval
+            await asyncio.sleep(self.sample_interval)
+            lag = max(0.0, self.loop.time() - expected)
+
+            self.lag_samples.append(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if lag >= self.STALL_THRESHOLD:
+                self.stall_count += 1
+
+    def get_lag_stats(self) -> Dict:
+        """Summary of recent loop lag in milliseconds"""
+        samples = sorted(self.lag_samples)
+        if not samples:
+            return {
+                'current_ms': 0, 'mean_ms': 0, 'p99_ms': 0, 'window_max_ms': 0,
+                'max_ms': 0, 'stalls': 0, 'samples': 0
+            }
+
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        return {
+            'current_ms': round(self.lag_samples[-1] * 1000, 2),
+            'mean_ms': round(sum(samples) / len(samples) * 1000, 2),
+            'p99_ms': round(p99 * 1000, 2),
+            'window_max_ms': round(samples[-1] * 1000, 2),
+            'max_ms': round(self.max_lag * 1000, 2),
+            'stalls': self.stall_count,
+            'samples': len(samples)
+        }
+
+    # ------------------------------------------------------------------
+    # Slow callback detector
+    # ------------------------------------------------------------------
+
+    def enable_slow_callback_detection(self, threshold_ms: int):
+        """Start recording callbacks that run longer than threshold_ms (0 disables)"""
+        if threshold_ms <= 0:
+            self.disable_slow_callback_detection()
+            return
+
+        self.slow_callback_threshold = threshold_ms / 1000
+        if self._original_handle_run is not None:
+            # Already installed, only the threshold changed
+            return
+
+        monitor = self
+        original_run = asyncio.events.Handle._run
+        self._original_handle_run = original_run
+
+        def _run(handle):
+            if handle._loop is not monitor.loop:
+                return original_run(handle)
+            token = monitor._begin_callback(handle)
+            try:
+                return original_run(handle)
+            finally:
+                monitor._end_callback(token, handle)
+
+        asyncio.events.Handle._run = _run
+
+        # Each watchdog thread gets its own stop event, so a quick disable/enable can't
+        # clear the event before the previous thread has seen it
+        self._watchdog_stop = threading.Event()
+        self._watchdog = threading.Thread(target=self._watch, args=(self._watchdog_stop,), daemon=True)
+        self._watchdog.start()
+
+    def disable_slow_callback_detection(self):
+        """Stop recording slow callbacks (keeps the collected offenders)"""
+        self.slow_callback_threshold = 0.0
+        if self._original_handle_run is not None:
+            asyncio.events.Handle._run = self._original_handle_run
+            self._original_handle_run = None
+        self._watchdog_stop.set()
+        self._watchdog = None
+        self._current = None
+
+    def _begin_callback(self, handle) -> int:
+        self._token += 1
+        self._current = (self._token, handle, time.perf_counter())
+        return self._token
+
+    def _end_callback(self, token: int, handle):
+        current = self._current
+        self._current = None
+        if current is None or current[0] != token:
+            return
+
+        duration = time.perf_counter() - current[2]
+        with self._lock:
+            stack = self._captured_stacks.pop(token, None)
+
+        if self.slow_callback_threshold and duration >= self.slow_callback_threshold:
+            self._record_offender(handle, duration, stack)
+
+    def _watch(self, stop: threading.Event):
+        """Watchdog thread - snapshot the loop thread's stack while a callback overruns"""
+        while not stop.is_set():
+            threshold = self.slow_callback_threshold
+            if not threshold:
+                break
+            if stop.wait(max(0.005, threshold / 2)):
+                break
+
+            current = self._current
+            if current is None or self.loop_thread_id is None:
+                continue
+            token, _, started = current
+            if time.perf_counter() - started < threshold:
+                continue
+
+            with self._lock:
+                if token in self._captured_stacks:
+                    continue
+                frame = sys._current_frames().get(self.loop_thread_id)
+                if frame is None:
+                    continue
+                self._captured_stacks[token] = traceback.format_stack(frame, limit=15)
+
+    @staticmethod
+    def describe_callback(handle) -> str:
+        """Readable name for a loop callback (coroutine name for task steps)"""
+        callback = handle._callback
+        owner = getattr(callback, '__self__', None)
+        if isinstance(owner, asyncio.Task):
+            coro = owner.get_coro()
+            return getattr(coro, '__qualname__', repr(coro))
+        return getattr(callback, '__qualname__', repr(callback))
+
+    def _record_offender(self, handle, duration: float, stack: Optional[List[str]]):
+        name = self.describe_callback(handle)
+        # Group by callback and the line it was stuck on (innermost frame)
+        location = stack[-1].strip().split('\n')[0] if stack else None
+        key = (name, location)
+
+        self.slow_callback_count += 1
+        entry = self.offenders.get(key)
+        if entry is None:
+            if len(self.offenders) >= self.MAX_OFFENDERS:
+                weakest = min(self.offenders, key=lambda k: self.offenders[k]['max_ms'])
+                del self.offenders[weakest]
+            entry = {
+                'callback': name,
+                'location': location,
+                'count': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'last_seen': None,
+                'stack': None
+            }
+            self.offenders[key] = entry
+
+        duration_ms = duration * 1000
+        entry['count'] += 1
+        entry['total_ms'] += duration_ms
+        entry['last_seen'] = time.time()
+        if duration_ms >= entry['max_ms']:
+            entry['max_ms'] = duration_ms
+            if stack:
+                entry['stack'] = [line.rstrip() for line in stack]
+
+    def get_offenders(self, limit: int = 20) -> List[Dict]:
+        """Worst slow callbacks, sorted by total time spent blocking the loop"""
+        entries = sorted(self.offenders.values(), key=lambda e: e['total_ms'], reverse=True)
+        return [
+            dict(entry, total_ms=round(entry['total_ms'], 2), max_ms=round(entry['max_ms'], 2))
+            for entry in entries[:limit]
+        ]
+
+    def reset(self):
+        """Clear collected offenders and lag history"""
+        self.offenders.clear()
+        self.slow_callback_count = 0
+        self.lag_samples.clear()
+        self.max_lag = 0.0
+        self.stall_count = 0
+
+    def get_report(self, limit: int = 20) -> Dict:
+        """Full health report for the API"""
+        return {
+            'lag': self.get_lag_stats(),
+            'slow_callbacks': {
+                'enabled': self.slow_callback_threshold > 0,
+                'threshold_ms': int(self.slow_callback_threshold * 1000),
+                'count': self.slow_callback_count,
+                'offenders': self.get_offenders(limit)
+            }
+        }
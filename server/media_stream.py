@@ -0,0 +1,625 @@
+import asyncio
+import json
+import math
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+from curl_cffi import CurlECode, CurlOpt
+from curl_cffi.requests import AsyncSession, RequestsError
+
+from download_manager import build_browser_headers
+from file_writer import FileWriter, choose_write_mode
+
+
+# A stream download fetches an HLS (.m3u8) or DASH (.mpd) manifest, picks the
+# highest-bandwidth variant and saves its segments, in order, as one file
+# (MPEG-TS for classic HLS, fragmented MP4 for DASH and fMP4 HLS). Segments are
+# fetched several at a time but written strictly in order, so the file on disk
+# is always a valid prefix of the stream; the number of segments written is
+# saved next to it ({id}.ndownload.segments) so a resume continues from there.
+#
+# The stall watchdog's thresholds are libcurl's low-speed abort on each segment
+# request; a segment whose connection stalls is requested again from the bytes
+# already received.
+#
+# Only the chosen variant's own segments are saved: streams with separate audio
+# renditions (common in DASH) are not muxed. Live and encrypted streams are
+# rejected.
+
+
+class StreamSegment:
+    """One media segment (or the initialization segment) of a stream"""
+
+    __slots__ = ('url', 'byte_range')
+
+    def __init__(self, url: str, byte_range: Optional[Tuple[int, int]] = None):
+        self.url = url
+        self.byte_range = byte_range  # (first byte, last byte) within url
+
+    def key(self) -> str:
+        return f"{self.url}#{self.byte_range}" if self.byte_range else self.url
+
+
+class StreamVariant:
+    """The rendition picked from a manifest and its segments"""
+
+    def __init__(self, url: str, bandwidth: int = 0, resolution: Optional[str] = None,
+                 segments: Optional[List[StreamSegment]] = None, container: str = 'ts'):
+        self.url = url
+        self.bandwidth = bandwidth
+        self.resolution = resolution
+        self.segments = segments or []
+        self.container = container  # 'ts' or 'mp4'
+
+    def get_status(self) -> Dict:
+        return {
+            'url': self.url,
+            'bandwidth': self.bandwidth,
+            'resolution': self.resolution,
+            'container': self.container
+        }
+
+
+# ---------------------------------------------------------------------------
+# HLS
+# ---------------------------------------------------------------------------
+
+HLS_ATTRIBUTE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def parse_hls_attributes(text: str) -> Dict[str, str]:
+    return {key: value.strip('"') for key, value in HLS_ATTRIBUTE.findall(text)}
+
+
+def parse_hls_byte_range(text: str, next_offset: int) -> Tuple[int, int]:
+    """'length[@offset]' -> (first byte, last byte)"""
+    length, _, offset = text.partition('@')
+    start = int(offset) if offset else next_offset
+    return start, start + int(length) - 1
+
+
+def parse_hls_master(text: str, base_url: str) -> Optional[StreamVariant]:
+    """Highest-bandwidth variant of a master playlist (None for a media playlist)"""
+    best = None
+    attributes = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            attributes = parse_hls_attributes(line.split(':', 1)[1])
+        elif line and not line.startswith('#') and attributes is not None:
+            bandwidth = int(attributes.get('BANDWIDTH', 0) or 0)
+            if best is None or bandwidth > best.bandwidth:
+                best = StreamVariant(urljoin(base_url, line), bandwidth, attributes.get('RESOLUTION'))
+            attributes = None
+    return best
+
+
+def parse_hls_media(text: str, base_url: str, variant: StreamVariant):
+    """Fill variant.segments from a media playlist"""
+    segments = []
+    byte_range = None
+    next_offset = 0
+    ended = False
+
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-KEY:'):
+            method = parse_hls_attributes(line.split(':', 1)[1]).get('METHOD', 'NONE')
+            if method != 'NONE':
+                raise ValueError(f"Encrypted HLS streams are not supported (METHOD={method})")
+        elif line.startswith('#EXT-X-MAP:'):
+            attributes = parse_hls_attributes(line.split(':', 1)[1])
+            init_range = None
+            if 'BYTERANGE' in attributes:
+                init_range = parse_hls_byte_range(attributes['BYTERANGE'], 0)
+            init = StreamSegment(urljoin(base_url, attributes['URI']), init_range)
+            # A repeated map (same URI) is already at the start of the file
+            if not any(s.key() == init.key() for s in segments):
+                segments.append(init)
+            variant.container = 'mp4'
+        elif line.startswith('#EXT-X-BYTERANGE:'):
+            byte_range = parse_hls_byte_range(line.split(':', 1)[1], next_offset)
+        elif line.startswith('#EXT-X-ENDLIST'):
+            ended = True
+        elif line and not line.startswith('#'):
+            segments.append(StreamSegment(urljoin(base_url, line), byte_range))
+            if byte_range:
+                next_offset = byte_range[1] + 1
+            byte_range = None
+
+    if not ended:
+        raise ValueError("Live HLS streams are not supported (playlist has no #EXT-X-ENDLIST)")
+    if not segments:
+        raise ValueError("HLS playlist has no segments")
+    variant.segments = segments
+
+
+# ---------------------------------------------------------------------------
+# DASH
+# ---------------------------------------------------------------------------
+
+DASH_DURATION = re.compile(r'P(?:(\d+(?:\.\d+)?)D)?(?:T(?:(\d+(?:\.\d+)?)H)?(?:(\d+(?:\.\d+)?)M)?(?:(\d+(?:\.\d+)?)S)?)?')
+DASH_TEMPLATE_FIELD = re.compile(r'\$(RepresentationID|Number|Time|Bandwidth)(%0(\d+)d)?\$')
+
+
+def parse_dash_duration(text: Optional[str]) -> float:
+    """ISO 8601 duration (PT1H2M3.5S) in seconds"""
+    match = DASH_DURATION.fullmatch(text or '')
+    if not text or not match:
+        return 0.0
+    days, hours, minutes, seconds = (float(v) if v else 0.0 for v in match.groups())
+    return days * 86400 + hours * 3600 + minutes * 60 + seconds
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def _child(element, name: str):
+    for child in element:
+        if _local(child.tag) == name:
+            return child
+    return None
+
+
+def _children(element, name: str) -> List:
+    return [child for child in element if _local(child.tag) == name]
+
+
+def _base_url(url: str, element) -> str:
+    base = _child(element, 'BaseURL')
+    if base is not None and base.text:
+        return urljoin(url, base.text.strip())
+    return url
+
+
+def _fill_template(template: str, representation_id: str, bandwidth: int,
+                   number: Optional[int] = None, start_time: Optional[int] = None) -> str:
+    def replace(match):
+        name, width = match.group(1), match.group(3)
+        value = {'RepresentationID': representation_id, 'Bandwidth': bandwidth,
+                 'Number': number, 'Time': start_time}[name]
+        if width and isinstance(value, int):
+            return str(value).zfill(int(width))
+        return str(value)
+    return DASH_TEMPLATE_FIELD.sub(replace, template).replace('$$', '$')
+
+
+def _parse_range(text: Optional[str]) -> Optional[Tuple[int, int]]:
+    if not text:
+        return None
+    first, _, last = text.partition('-')
+    return int(first), int(last)
+
+
+def parse_dash(text: str, manifest_url: str) -> StreamVariant:
+    """Highest-bandwidth video representation of the first period and its segments"""
+    root = ET.fromstring(text)
+    if root.get('type') == 'dynamic':
+        raise ValueError("Live DASH streams are not supported (MPD type is dynamic)")
+
+    period = _child(root, 'Period')
+    if period is None:
+        raise ValueError("MPD has no Period")
+    period_duration = (parse_dash_duration(period.get('duration')) or
+                       parse_dash_duration(root.get('mediaPresentationDuration')))
+
+    mpd_base = _base_url(manifest_url, root)
+    period_base = _base_url(mpd_base, period)
+
+    # (representation, its adaptation set) - video sets preferred
+    candidates = []
+    for adaptation in _children(period, 'AdaptationSet'):
+        for representation in _children(adaptation, 'Representation'):
+            mime = representation.get('mimeType') or adaptation.get('mimeType') or ''
+            content_type = adaptation.get('contentType') or mime.split('/')[0]
+            candidates.append((content_type == 'video', int(representation.get('bandwidth', 0) or 0),
+                               representation, adaptation))
+    if not candidates:
+        raise ValueError("MPD has no representations")
+    _, bandwidth, representation, adaptation = max(candidates, key=lambda c: (c[0], c[1]))
+
+    base = _base_url(_base_url(period_base, adaptation), representation)
+    representation_id = representation.get('id', '')
+    width, height = representation.get('width'), representation.get('height')
+    variant = StreamVariant(manifest_url, bandwidth, f"{width}x{height}" if width and height else None,
+                            container='mp4')
+
+    # Segment information is inherited: Representation overrides AdaptationSet overrides Period
+    template = segment_list = None
+    for element in (representation, adaptation, period):
+        template = template if template is not None else _child(element, 'SegmentTemplate')
+        segment_list = segment_list if segment_list is not None else _child(element, 'SegmentList')
+
+    segments = []
+    if template is not None:
+        fill = lambda t, **kw: urljoin(base, _fill_template(t, representation_id, bandwidth, **kw))
+        if template.get('initialization'):
+            segments.append(StreamSegment(fill(template.get('initialization'))))
+
+        media = template.get('media')
+        if not media:
+            raise ValueError("SegmentTemplate has no media attribute")
+        number = int(template.get('startNumber', 1))
+        timescale = int(template.get('timescale', 1))
+        timeline = _child(template, 'SegmentTimeline')
+
+        if timeline is not None:
+            current = 0
+            for s in _children(timeline, 'S'):
+                current = int(s.get('t', current))
+                duration = int(s.get('d'))
+                repeat = int(s.get('r', 0))
+                if repeat < 0:
+                    # Repeat until the end of the period
+                    end = period_duration * timescale
+                    repeat = max(0, math.ceil((end - current) / duration) - 1)
+                for _ in range(repeat + 1):
+                    segments.append(StreamSegment(fill(media, number=number, start_time=current)))
+                    number += 1
+                    current += duration
+        else:
+            duration = int(template.get('duration', 0))
+            if not duration or not period_duration:
+                raise ValueError("SegmentTemplate without SegmentTimeline needs a duration and period length")
+            count = math.ceil(period_duration * timescale / duration)
+            for index in range(count):
+                segments.append(StreamSegment(fill(media, number=number + index,
+                                                   start_time=index * duration)))
+
+    elif segment_list is not None:
+        init = _child(segment_list, 'Initialization')
+        if init is not None:
+            segments.append(StreamSegment(urljoin(base, init.get('sourceURL', '')),
+                                          _parse_range(init.get('range'))))
+        for segment_url in _children(segment_list, 'SegmentURL'):
+            segments.append(StreamSegment(urljoin(base, segment_url.get('media', '')),
+                                          _parse_range(segment_url.get('mediaRange'))))
+
+    else:
+        # SegmentBase or a plain BaseURL: the representation is one file
+        segments.append(StreamSegment(base))
+
+    if not segments:
+        raise ValueError("MPD representation has no segments")
+    variant.segments = segments
+    return variant
+
+
+# ---------------------------------------------------------------------------
+# Transfer
+# ---------------------------------------------------------------------------
+
+class MediaStreamTransfer:
+    """Download an HLS/DASH stream's segments into one file"""
+
+    # Segments fetched at the same time
+    CONCURRENCY = 4
+
+    # How far ahead of the next segment to write fetching may run
+    WINDOW = 8
+
+    # Attempts per segment (waits 1, 2, 4... seconds between them)
+    SEGMENT_ATTEMPTS = 4
+
+    # Seconds allowed per manifest request, and per segment request without receiving
+    # anything while the watchdog is off
+    REQUEST_TIMEOUT = 120
+
+    def __init__(self, download, temp_file_path: str):
+        self.download = download
+        self.temp_file_path = temp_file_path
+        self.state_path = download.get_segments_file_path()
+        self.session = None
+        self.variant: Optional[StreamVariant] = None
+
+        self.written_segments = 0
+        self.written_bytes = 0
+        # (segments, bytes) after each written segment not yet known to be on disk
+        self.boundaries: Deque[Tuple[int, int]] = deque()
+        self.saved = (0, 0)
+        self.buffered: Dict[int, bytes] = {}
+        self.in_flight_bytes = 0
+        self.window_moved = None
+
+    # ------------------------------------------------------------------
+    # Manifest
+    # ------------------------------------------------------------------
+
+    async def _get(self, url: str, byte_range: Optional[Tuple[int, Optional[int]]] = None,
+                   stream: bool = False):
+        cookies = self.download.cookies if url == self.download.url else None
+        headers = build_browser_headers(url, cookies)
+        if stream:
+            # Segments are media (nothing to gain from compression), and a byte
+            # range has to refer to the uncompressed bytes
+            headers['Accept-Encoding'] = 'identity'
+        if byte_range:
+            end = byte_range[1] if byte_range[1] is not None else ''
+            headers['Range'] = f'bytes={byte_range[0]}-{end}'
+        response = await self.session.get(url, headers=headers, timeout=self.REQUEST_TIMEOUT, stream=stream)
+        if response.status_code >= 400:
+            if stream:
+                self._abort(response)
+            raise RuntimeError(f"HTTP {response.status_code} for {url}")
+        return response
+
+    async def _load_variant(self) -> StreamVariant:
+        response = await self._get(self.download.url)
+        text = response.text
+        url = str(response.url or self.download.url)
+
+        if text.lstrip().startswith('#EXTM3U'):
+            variant = parse_hls_master(text, url)
+            if variant is None:
+                variant = StreamVariant(url)
+            else:
+                response = await self._get(variant.url)
+                text = response.text
+            parse_hls_media(text, str(response.url or variant.url), variant)
+            return variant
+        if '<MPD' in text[:4096]:
+            return parse_dash(text, url)
+        raise ValueError("Not an HLS playlist or DASH manifest")
+
+    # ------------------------------------------------------------------
+    # Segment tracking
+    # ------------------------------------------------------------------
+
+    def _manifest_key(self) -> List[str]:
+        return [s.key() for s in self.variant.segments[:1]] + [str(len(self.variant.segments))]
+
+    def _load_state(self):
+        """Continue after the last segment written, if the file is from the same variant"""
+        if not os.path.exists(self.temp_file_path):
+            return
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+
+        if (state and state.get('variant') == self.variant.url and state.get('key') == self._manifest_key()
+                and state.get('bytes', 0) <= os.path.getsize(self.temp_file_path)):
+            self.written_segments = state['segments']
+            self.written_bytes = state['bytes']
+            self.saved = (self.written_segments, self.written_bytes)
+            # Drop anything written after the last save
+            os.truncate(self.temp_file_path, self.written_bytes)
+        else:
+            os.truncate(self.temp_file_path, 0)
+
+    def _save_state(self, on_disk: int):
+        """Record the last segment boundary within the first on_disk bytes of the file
+        (the odirect write mode keeps up to a block in memory)"""
+        while self.boundaries and self.boundaries[0][1] <= on_disk:
+            self.saved = self.boundaries.popleft()
+        segments, written_bytes = self.saved
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'variant': self.variant.url, 'key': self._manifest_key(),
+                       'segments': segments, 'bytes': written_bytes}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _update_progress(self):
+        """Bytes so far and a total estimated from the average segment size"""
+        done = self.written_bytes + sum(len(d) for d in self.buffered.values()) + self.in_flight_bytes
+        self.download.downloaded_bytes = done
+        fetched = self.written_segments + len(self.buffered)
+        remaining = len(self.variant.segments) - fetched
+        if fetched:
+            self.download.total_bytes = max(done, int(done + done / fetched * remaining))
+
+    # ------------------------------------------------------------------
+    # Fetching
+    # ------------------------------------------------------------------
+
+    def _stopped(self) -> bool:
+        return self.download.cancelled or self.download.paused
+
+    @staticmethod
+    def _resume_range(segment: StreamSegment, received: int) -> Optional[Tuple[int, Optional[int]]]:
+        """Byte range of the part of segment after its first received bytes"""
+        if not received:
+            return segment.byte_range
+        if segment.byte_range:
+            return segment.byte_range[0] + received, segment.byte_range[1]
+        return received, None
+
+    @staticmethod
+    def _abort(response):
+        """Drop a streaming response's connection (aclose() would wait for the transfer to
+        end, which a stalled one never does)"""
+        if response.astream_task is not None and not response.astream_task.done():
+            response.astream_task.cancel()
+
+    def _stall_options(self) -> Tuple[int, int]:
+        """libcurl's low speed limit and time for the next segment request
+
+        The watchdog's window and minimum speed (not enforced while the rate
+        limit holds the segment connections below it), or REQUEST_TIMEOUT with
+        it off.
+        """
+        manager = self.download.manager
+        watchdog = manager.watchdog
+        if watchdog.window <= 0:
+            return 1, self.REQUEST_TIMEOUT
+        share = manager.get_rate_limit_share()
+        low_speed_limit = 1
+        if watchdog.min_speed_bps and (share == 0 or share // self.CONCURRENCY > watchdog.min_speed_bps):
+            low_speed_limit = watchdog.min_speed_bps
+        return low_speed_limit, max(1, math.ceil(watchdog.window))
+
+    async def _fetch_segment(self, segment: StreamSegment) -> Optional[bytes]:
+        """Fetch one segment; None if the download was paused/cancelled
+
+        Failed requests are retried SEGMENT_ATTEMPTS times. A connection the
+        stall watchdog gives up on is replaced by a request for the rest of the
+        segment; the download fails once max_reconnects reconnects in a row
+        brought no new bytes.
+        """
+        manager = self.download.manager
+        chunks = []
+        received = 0
+        failures = 0
+        unproductive = 0
+        try:
+            while not self._stopped():
+                connected_at = received
+                low_speed_limit, low_speed_time = self._stall_options()
+                # Applied to each request the session makes, after its own timeout options
+                self.session.curl_options[CurlOpt.LOW_SPEED_LIMIT] = low_speed_limit
+                self.session.curl_options[CurlOpt.LOW_SPEED_TIME] = low_speed_time
+                last_chunk_at = time.monotonic()
+                try:
+                    response = await self._get(segment.url, self._resume_range(segment, received), stream=True)
+                    if received and response.status_code != 206:
+                        # Range ignored: the segment comes again from its start
+                        self.in_flight_bytes -= received
+                        chunks.clear()
+                        received = connected_at = 0
+                    async for chunk in response.aiter_content():
+                        last_chunk_at = time.monotonic()
+                        if self._stopped():
+                            self._abort(response)
+                            return None
+                        await manager.rate_limit(len(chunk))
+                        chunks.append(chunk)
+                        received += len(chunk)
+                        self.in_flight_bytes += len(chunk)
+                    return b''.join(chunks)
+                except Exception as e:
+                    if (not isinstance(e, RequestsError) or e.code != CurlECode.OPERATION_TIMEDOUT
+                            or manager.watchdog.window <= 0):
+                        failures += 1
+                        if failures == self.SEGMENT_ATTEMPTS:
+                            raise RuntimeError(f"Segment {segment.url} failed: {e}")
+                        print(f"Segment {segment.url} failed ({e}), retrying")
+                        await asyncio.sleep(2 ** (failures - 1))
+                        continue
+                    if self._stopped():
+                        return None  # Paused on a stalled connection; resuming reconnects anyway
+                    reason = 'stalled' if time.monotonic() - last_chunk_at >= low_speed_time else 'slow'
+
+                unproductive = 0 if received > connected_at else unproductive + 1
+                max_reconnects = manager.watchdog.max_reconnects
+                if unproductive > max_reconnects:
+                    manager.record_stall(self.download, reason, gave_up=True)
+                    raise RuntimeError(f"Segment {segment.url}: connection {reason}, "
+                                       f"no progress after {max_reconnects} reconnects")
+
+                manager.record_stall(self.download, reason)
+                print(f"Connection for segment {segment.url} {reason} at {received} bytes, reconnecting")
+                # Back off while reconnecting doesn't help
+                await asyncio.sleep(min(unproductive, 10))
+            return None
+        finally:
+            self.in_flight_bytes -= received
+
+    async def _worker(self, queue: Deque[int], f: FileWriter):
+        try:
+            while queue and not self._stopped():
+                index = queue.popleft()
+                while index >= self.written_segments + self.WINDOW and not self._stopped():
+                    self.window_moved.clear()
+                    await self.window_moved.wait()
+                if self._stopped():
+                    return
+
+                data = await self._fetch_segment(self.variant.segments[index])
+                if data is None:
+                    return
+                self.buffered[index] = data
+
+                # Write every segment that is now next in line
+                while self.written_segments in self.buffered:
+                    block = self.buffered.pop(self.written_segments)
+                    write_started = time.perf_counter()
+                    f.write(block)
+                    self.download.manager.record_write(time.perf_counter() - write_started, len(block))
+                    self.written_segments += 1
+                    self.written_bytes += len(block)
+                    self.boundaries.append((self.written_segments, self.written_bytes))
+                self.window_moved.set()
+                self._update_progress()
+                self._choose_write_mode(f)
+        finally:
+            # A worker that stops (paused, cancelled, failed) may hold the segment the
+            # others wait for; wake them so they see it too
+            self.window_moved.set()
+
+    def _choose_write_mode(self, f: FileWriter):
+        """Leave the page cache once the estimated stream size reaches the large file threshold"""
+        if f.mode == 'cached':
+            manager = self.download.manager
+            f.set_mode(choose_write_mode(manager.write_mode, manager.large_file_threshold,
+                                         self.download.total_bytes))
+
+    async def _report_progress(self, f):
+        last_save = time.time()
+        self.download.update_db()
+        while True:
+            await asyncio.sleep(1.0)
+            self._update_progress()
+            self.download.calculate_speed(self.download.downloaded_bytes)
+            if time.time() - last_save >= 5.0:
+                self._save_state(f.flush())
+                self.download.update_db()
+                last_save = time.time()
+
+    async def run(self) -> bool:
+        """Download the stream. Returns False if paused/cancelled."""
+        self.session = AsyncSession(impersonate="chrome120", max_clients=self.CONCURRENCY)
+        self.window_moved = asyncio.Event()
+        reporter = None
+        f = None
+        closed = False
+        try:
+            self.variant = await self._load_variant()
+            self.download.stream = self
+            self._load_state()
+
+            f = FileWriter(self.temp_file_path, self.written_bytes)
+            queue = deque(range(self.written_segments, len(self.variant.segments)))
+            self._update_progress()
+            self._choose_write_mode(f)
+            reporter = asyncio.create_task(self._report_progress(f))
+
+            workers = [asyncio.create_task(self._worker(queue, f)) for _ in range(self.CONCURRENCY)]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                # A segment that ran out of retries fails the download; stop the others
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+            if self._stopped() or self.written_segments < len(self.variant.segments):
+                return False
+
+            closed = True
+            f.close()
+            self.download.total_bytes = self.download.downloaded_bytes = self.written_bytes
+            if os.path.exists(self.state_path):
+                os.remove(self.state_path)
+            return True
+
+        finally:
+            if reporter:
+                reporter.cancel()
+            if f is not None and not closed:
+                f.close()
+                self._save_state(self.written_bytes)
+            await self.session.close()
+
+    def get_status(self) -> Dict:
+        return {
+            'variant': self.variant.get_status() if self.variant else None,
+            'segments': len(self.variant.segments) if self.variant else 0,
+            'segments_done': self.written_segments
+        }
@@ -0,0 +1,144 @@
+import asyncio
+import errno
+import os
+import time
+from typing import Optional, Tuple
+
+
+# Bytes copied per step; between steps the mover reports progress and paces itself
+COPY_CHUNK = 16 * 1024 * 1024
+
+# Errors meaning copy_file_range can't do this pair of files (fall back to sendfile)
+_KERNEL_COPY_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL}
+
+
+def same_filesystem(path: str, directory: str) -> bool:
+    return os.stat(path).st_dev == os.stat(directory).st_dev
+
+
+class FileMover:
+    """Moves finished downloads from the staging area into DOWNLOAD_PATH
+
+    With STAGING_PATH on fast scratch storage, transfers write their temp file
+    there and only the finished file reaches the bulk array, as one sequential
+    copy. On the same filesystem a move is a plain rename. Across filesystems
+    the file is copied in COPY_CHUNK steps with copy_file_range (sendfile where
+    the kernel can't copy between the two filesystems), so the data never
+    passes through Python; each copied chunk is flushed and dropped from the
+    page cache. The copy goes to {id}.nmove next to the final file and is
+    renamed into place after an fsync, then the staged file is removed.
+
+    At most `concurrency` copies run at once and all of them together stay
+    under rate_limit_bps (0 = unlimited), so migration doesn't take the array's
+    bandwidth from running downloads.
+    """
+
+    def __init__(self, concurrency: int = 1, rate_limit_bps: int = 0):
+        self.concurrency = max(1, concurrency)
+        self.rate_limit_bps = max(0, rate_limit_bps)
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.next_slot = 0.0  # When the rate limit lets the next chunk start
+
+    async def move(self, download, source: str, destination: str):
+        """Move source to destination, updating download.moved_bytes as it goes"""
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        if same_filesystem(source, os.path.dirname(destination)):
+            os.rename(source, destination)
+            download.moved_bytes = download.total_bytes
+            return
+
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        async with self.semaphore:
+            partial = os.path.join(os.path.dirname(destination), f"{download.id}.nmove")
+            try:
+                await self._copy(download, source, partial)
+                os.rename(partial, destination)
+            except BaseException:
+                try:
+                    os.remove(partial)
+                except OSError:
+                    pass
+                raise
+        # Unlinking a file of many GB can take seconds on slow storage: not on the loop
+        download.manager.deleter.delete(source)
+
+    async def _copy(self, download, source: str, partial: str):
+        loop = asyncio.get_running_loop()
+        chunk = COPY_CHUNK
+        if self.rate_limit_bps:
+            # Smaller steps keep a low limit smooth
+            chunk = max(1024 * 1024, min(COPY_CHUNK, self.rate_limit_bps // 4))
+
+        src_fd = os.open(source, os.O_RDONLY)
+        try:
+            dst_fd = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                total = os.fstat(src_fd).st_size
+                offset = 0
+                # Decided per move: copy_file_range may work between other pairs of volumes
+                kernel_copy = hasattr(os, 'copy_file_range')
+                download.moved_bytes = 0
+                while offset < total:
+                    length = min(chunk, total - offset)
+                    await self._pace(length)
+                    job = loop.run_in_executor(None, self._copy_chunk, src_fd, dst_fd, offset, length,
+                                               kernel_copy)
+                    try:
+                        copied, kernel_copy = await asyncio.shield(job)
+                    except asyncio.CancelledError:
+                        # The thread still uses both descriptors
+                        await asyncio.wait([job])
+                        raise
+                    if copied == 0:
+                        raise OSError(f"{source} shrank while it was being moved")
+                    offset += copied
+                    download.moved_bytes = offset
+                await loop.run_in_executor(None, os.fsync, dst_fd)
+            finally:
+                os.close(dst_fd)
+        finally:
+            os.close(src_fd)
+
+    @staticmethod
+    def _copy_chunk(src_fd: int, dst_fd: int, offset: int, length: int,
+                    kernel_copy: bool) -> Tuple[int, bool]:
+        """Copy up to length bytes at offset (runs in a thread)
+
+        Returns the bytes copied and whether copy_file_range still works for
+        this pair of files.
+        """
+        copied = 0
+        while copied < length:
+            position = offset + copied
+            n = 0
+            if kernel_copy:
+                try:
+                    n = os.copy_file_range(src_fd, dst_fd, length - copied, position, position)
+                except OSError as e:
+                    if e.errno not in _KERNEL_COPY_UNSUPPORTED:
+                        raise
+                    kernel_copy = False
+            if not kernel_copy:
+                os.lseek(dst_fd, position, os.SEEK_SET)
+                n = os.sendfile(dst_fd, src_fd, position, length - copied)
+            if n == 0:
+                break
+            copied += n
+
+        if copied and hasattr(os, 'posix_fadvise'):
+            # Moved data is cold: keep it from pushing everything else out of the page cache
+            os.fdatasync(dst_fd)
+            os.posix_fadvise(dst_fd, offset, copied, os.POSIX_FADV_DONTNEED)
+            os.posix_fadvise(src_fd, offset, copied, os.POSIX_FADV_DONTNEED)
+        return copied, kernel_copy
+
+    async def _pace(self, nbytes: int):
+        """Wait until the shared rate limit allows nbytes more"""
+        if not self.rate_limit_bps:
+            return
+        now = time.monotonic()
+        start = max(self.next_slot, now)
+        self.next_slot = start + nbytes / self.rate_limit_bps
+        if start > now:
+            await asyncio.sleep(start - now)
@@ -0,0 +1,501 @@
+import asyncio
+import json
+import math
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from curl_cffi import CurlECode, CurlInfo, CurlOpt
+from curl_cffi.curl import CURL_WRITEFUNC_ERROR
+from curl_cffi.requests import RequestsError
+
+from download_manager import DirectSession, build_browser_headers
+from file_writer import choose_write_mode, release_range
+from stall_watchdog import TransferStalled
+
+
+# A multi-source download splits the file into byte ranges and fetches them
+# from all of its mirrors at once, writing each range at its offset in the temp
+# file. Mirrors pull the next range when they finish one, so faster mirrors
+# naturally take more of the file; once nothing is left unassigned, an idle
+# mirror takes over the end of the range that is expected to finish last.
+#
+# The ranges still missing are saved next to the temp file
+# ({id}.ndownload.segments) so a paused or restarted download only fetches
+# what is missing, from whichever mirrors are usable at that point.
+#
+# The stall watchdog's thresholds are libcurl's low-speed abort on each range
+# request; a range whose connection stalls is requested again from where it
+# stopped, and a mirror whose reconnects keep bringing nothing is dropped.
+
+
+class NoRangeSupport(RuntimeError):
+    """The mirror answered, but can't serve byte ranges"""
+
+
+class MirrorStopped(Exception):
+    """The download was paused or cancelled while a range was being fetched"""
+
+
+class Mirror:
+    """One source URL of a multi-source download"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.session = None
+        self.status = 'probing'  # probing, active, dropped
+        self.error = None
+        self.downloaded_bytes = 0
+        self.speed_bps = 0
+        self.last_sample_bytes = 0
+
+    def drop(self, reason: str):
+        self.status = 'dropped'
+        self.error = reason
+        print(f"Dropping mirror {self.url}: {reason}")
+
+    def get_status(self) -> Dict:
+        return {
+            'url': self.url,
+            'status': self.status,
+            'error': self.error,
+            'downloaded_bytes': self.downloaded_bytes,
+            'speed_bps': int(self.speed_bps)
+        }
+
+
+class Segment:
+    """Bytes [start, end) of the file being fetched by one mirror
+
+    start advances as data is written; end is lowered when another mirror
+    takes over the rest of the range.
+    """
+
+    __slots__ = ('start', 'end', 'mirror')
+
+    def __init__(self, start: int, end: int, mirror: Mirror):
+        self.start = start
+        self.end = end
+        self.mirror = mirror
+
+
+class MultiSourceTransfer:
+    """Fetch one download's content from several mirrors in parallel"""
+
+    # Bytes handed to a mirror at a time
+    SEGMENT_SIZE = 4 * 1024 * 1024
+
+    # Smallest piece worth moving from a slow mirror to an idle one
+    MIN_STEAL_SIZE = 1024 * 1024
+
+    # Seconds allowed for the probe request to each mirror
+    PROBE_TIMEOUT = 30
+
+    # Abort a range request that receives nothing for this long (seconds, with the watchdog off)
+    STALL_TIMEOUT = 300
+
+    def __init__(self, download, temp_file_path: str):
+        self.download = download
+        self.temp_file_path = temp_file_path
+        self.state_path = download.get_segments_file_path()
+
+        urls = []
+        for url in [download.url] + list(download.mirrors):
+            if url not in urls:
+                urls.append(url)
+        self.mirrors = [Mirror(url) for url in urls]
+        download.sources = self.mirrors
+
+        self.total_bytes = 0
+        self.etag = None
+        self.pending: List[List[int]] = []  # Missing ranges no mirror is fetching
+        self.active: List[Segment] = []
+        self.fd = None
+        # Drop fetched ranges from the page cache (write modes other than 'cached';
+        # segments land at scattered offsets, so O_DIRECT is not used here)
+        self.drop_cache = False
+
+    # ------------------------------------------------------------------
+    # Probing
+    # ------------------------------------------------------------------
+
+    def _headers(self, mirror: Mirror) -> Dict[str, str]:
+        # Browser cookies belong to the primary URL's site only
+        cookies = self.download.cookies if mirror.url == self.download.url else None
+        headers = build_browser_headers(mirror.url, cookies)
+        # Byte offsets must refer to the file itself, not a compressed encoding of it
+        headers['Accept-Encoding'] = 'identity'
+        return headers
+
+    async def _probe(self, mirror: Mirror) -> Tuple[int, Optional[str]]:
+        """Size and ETag of the file on a mirror (via a one-byte range request)"""
+        mirror.session = DirectSession(impersonate="chrome120", curl_options={
+            CurlOpt.CONNECTTIMEOUT: self.PROBE_TIMEOUT,
+            CurlOpt.LOW_SPEED_LIMIT: 1,
+            CurlOpt.LOW_SPEED_TIME: self.STALL_TIMEOUT,
+        })
+        headers = self._headers(mirror)
+        headers['Range'] = 'bytes=0-0'
+        status_code = None
+
+        def write(block: bytes):
+            nonlocal status_code
+            status_code = mirror.session.curl.getinfo(CurlInfo.RESPONSE_CODE)
+            if status_code != 206:
+                # Whole file coming - don't download it just to find out
+                return CURL_WRITEFUNC_ERROR
+            return len(block)
+
+        try:
+            response = await mirror.session.get(mirror.url, headers=headers,
+                                                timeout=self.PROBE_TIMEOUT, content_callback=write)
+        except RequestsError:
+            if status_code is not None and status_code != 206:
+                response = None
+            else:
+                raise
+
+        status_code = response.status_code if response is not None else status_code
+        if status_code == 200:
+            raise NoRangeSupport("no range support")
+        if status_code != 206:
+            raise RuntimeError(f"HTTP {status_code}")
+        try:
+            total = int(response.headers.get('Content-Range', '').rsplit('/', 1)[1])
+        except (IndexError, ValueError):
+            raise RuntimeError("unknown file size")
+        return total, response.headers.get('ETag')
+
+    async def _probe_mirrors(self) -> bool:
+        """Probe all mirrors and keep the ones serving the same file
+
+        Returns False if every mirror answered without range support; raises if
+        none could be reached.
+        """
+        results = await asyncio.gather(*(self._probe(m) for m in self.mirrors),
+                                       return_exceptions=True)
+
+        reference = None
+        for mirror, result in zip(self.mirrors, results):
+            if isinstance(result, BaseException):
+                mirror.drop(str(result) or type(result).__name__)
+            elif reference is None:
+                # The primary URL defines the file when it answers, else the first mirror that does
+                reference = result
+                mirror.status = 'active'
+            else:
+                total, etag = result
+                if total != reference[0]:
+                    mirror.drop(f"size mismatch ({total} != {reference[0]} bytes)")
+                elif etag and reference[1] and etag != reference[1]:
+                    mirror.drop(f"ETag mismatch ({etag} != {reference[1]})")
+                else:
+                    mirror.status = 'active'
+
+        if reference is None:
+            if all(isinstance(r, NoRangeSupport) for r in results):
+                return False
+            errors = '; '.join(f"{m.url}: {m.error}" for m in self.mirrors)
+            raise RuntimeError(f"No mirror reachable ({errors})")
+        self.total_bytes, self.etag = reference
+        manager = self.download.manager
+        self.drop_cache = choose_write_mode(manager.write_mode, manager.large_file_threshold,
+                                            self.total_bytes) != 'cached'
+        return True
+
+    # ------------------------------------------------------------------
+    # Segment bookkeeping
+    # ------------------------------------------------------------------
+
+    def _load_state(self, temp_exists: bool):
+        self.pending = [[0, self.total_bytes]]
+        state = None
+        if temp_exists and os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, 'r') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = None
+
+        if state is not None:
+            if state.get('total_bytes') == self.total_bytes and state.get('etag') == self.etag:
+                self.pending = [list(r) for r in state.get('pending', [])]
+            else:
+                # File changed upstream since the previous attempt
+                os.ftruncate(self.fd, 0)
+        elif temp_exists:
+            # Partial file from a single-source attempt: everything up to its size is there
+            size = os.fstat(self.fd).st_size
+            if 0 < size <= self.total_bytes:
+                self.pending = [[size, self.total_bytes]] if size < self.total_bytes else []
+            else:
+                os.ftruncate(self.fd, 0)
+
+        os.ftruncate(self.fd, self.total_bytes)
+
+    def _save_state(self):
+        # Ranges in flight are saved from their current position
+        missing = self.pending + [[s.start, s.end] for s in self.active if s.start < s.end]
+        missing.sort()
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'total_bytes': self.total_bytes, 'etag': self.etag, 'pending': missing}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _missing_bytes(self) -> int:
+        return (sum(end - start for start, end in self.pending) +
+                sum(s.end - s.start for s in self.active))
+
+    def _next_segment(self, mirror: Mirror) -> Optional[Segment]:
+        """Hand mirror its next range, or None when there is nothing worth taking"""
+        if self.pending:
+            start, end = self.pending[0]
+            if end - start > self.SEGMENT_SIZE:
+                end = start + self.SEGMENT_SIZE
+                self.pending[0][0] = end
+            else:
+                self.pending.pop(0)
+            segment = Segment(start, end, mirror)
+            self.active.append(segment)
+            return segment
+
+        # Take over the end of the range expected to finish last, split so that
+        # both mirrors finish at about the same time
+        slowest = None
+        slowest_eta = 0.0
+        for segment in self.active:
+            remaining = segment.end - segment.start
+            if remaining < 2 * self.MIN_STEAL_SIZE:
+                continue
+            eta = remaining / max(segment.mirror.speed_bps, 1)
+            if eta > slowest_eta:
+                slowest, slowest_eta = segment, eta
+        if slowest is None:
+            return None
+
+        theirs = max(slowest.mirror.speed_bps, 1)
+        mine = mirror.speed_bps or theirs
+        remaining = slowest.end - slowest.start
+        share = int(remaining * mine / (mine + theirs))
+        share = min(max(share, self.MIN_STEAL_SIZE), remaining - self.MIN_STEAL_SIZE)
+        if share / mine >= slowest_eta:
+            # This mirror wouldn't finish its piece sooner than the owner finishes it all
+            return None
+
+        segment = Segment(slowest.end - share, slowest.end, mirror)
+        slowest.end = segment.start
+        self.active.append(segment)
+        return segment
+
+    def _release(self, segment: Segment):
+        """Return the unfetched part of a segment to the pending list"""
+        if segment in self.active:
+            self.active.remove(segment)
+        if segment.start < segment.end:
+            self.pending.append([segment.start, segment.end])
+            self.pending.sort()
+
+    # ------------------------------------------------------------------
+    # Transfer
+    # ------------------------------------------------------------------
+
+    def _speed_share(self) -> int:
+        """Per-mirror bytes/sec so the mirrors together stay within this download's share"""
+        share = self.download.manager.get_rate_limit_share()
+        if share <= 0:
+            return 0
+        live = sum(1 for m in self.mirrors if m.status == 'active')
+        return max(1024, share // max(live, 1))
+
+    def _stall_options(self) -> Tuple[int, int]:
+        """libcurl's low speed limit and time for the next range request
+
+        The watchdog's window and minimum speed (not enforced while the rate
+        limit holds each mirror below it), or STALL_TIMEOUT with it off.
+        """
+        watchdog = self.download.manager.watchdog
+        if watchdog.window <= 0:
+            return 1, self.STALL_TIMEOUT
+        share = self._speed_share()
+        low_speed_limit = 1
+        if watchdog.min_speed_bps and (share == 0 or share > watchdog.min_speed_bps):
+            low_speed_limit = watchdog.min_speed_bps
+        return low_speed_limit, max(1, math.ceil(watchdog.window))
+
+    async def _fetch(self, mirror: Mirror, segment: Segment):
+        """Fetch one range into the temp file; TransferStalled if the watchdog gave up on it"""
+        requested_end = segment.end
+        range_start = segment.start
+        headers = self._headers(mirror)
+        headers['Range'] = f'bytes={segment.start}-{requested_end - 1}'
+        status_code = None
+        stopped = False
+
+        low_speed_limit, low_speed_time = self._stall_options()
+        # Applied to each request the session makes, after its own timeout options
+        mirror.session.curl_options[CurlOpt.LOW_SPEED_LIMIT] = low_speed_limit
+        mirror.session.curl_options[CurlOpt.LOW_SPEED_TIME] = low_speed_time
+        last_block_at = time.monotonic()
+
+        def write(block: bytes):
+            nonlocal status_code, stopped, last_block_at
+            last_block_at = time.monotonic()
+            if self.download.cancelled or self.download.paused:
+                stopped = True
+                return CURL_WRITEFUNC_ERROR
+
+            if status_code is None:
+                status_code = mirror.session.curl.getinfo(CurlInfo.RESPONSE_CODE)
+            if status_code != 206:
+                return CURL_WRITEFUNC_ERROR
+
+            size = min(len(block), segment.end - segment.start)
+            if size > 0:
+                write_started = time.perf_counter()
+                os.pwrite(self.fd, block if size == len(block) else memoryview(block)[:size],
+                          segment.start)
+                self.download.manager.record_write(time.perf_counter() - write_started, size)
+                segment.start += size
+                mirror.downloaded_bytes += size
+                self.download.downloaded_bytes += size
+            if segment.start >= segment.end and segment.end < requested_end:
+                # The rest of this range was handed to another mirror
+                return CURL_WRITEFUNC_ERROR
+            return len(block)
+
+        try:
+            await mirror.session.get(mirror.url, headers=headers, timeout=None,
+                                     content_callback=write, max_recv_speed=self._speed_share())
+        except RequestsError as e:
+            if stopped:
+                raise MirrorStopped()
+            if status_code is not None and status_code != 206:
+                raise RuntimeError(f"HTTP {status_code} for range request")
+            if segment.start < segment.end:
+                if e.code == CurlECode.OPERATION_TIMEDOUT and self.download.manager.watchdog.window > 0:
+                    stalled = time.monotonic() - last_block_at >= low_speed_time
+                    raise TransferStalled('stalled' if stalled else 'slow')
+                raise
+        finally:
+            if self.drop_cache:
+                release_range(self.fd, range_start, segment.start - range_start)
+
+        if stopped:
+            raise MirrorStopped()
+        if status_code is not None and status_code != 206:
+            raise RuntimeError(f"HTTP {status_code} for range request")
+        if segment.start < segment.end:
+            raise RuntimeError(f"range ended {segment.end - segment.start} bytes early")
+
+    async def _fetch_watched(self, mirror: Mirror, segment: Segment):
+        """Fetch one range, reconnecting from where it stopped whenever the stall watchdog
+        gives up on the connection; raises once max_reconnects reconnects in a row brought
+        no new bytes (the mirror is then dropped and the others take the range)"""
+        manager = self.download.manager
+        unproductive = 0
+        while True:
+            connected_at = segment.start
+            try:
+                return await self._fetch(mirror, segment)
+            except TransferStalled as e:
+                reason = e.reason
+            if self.download.cancelled or self.download.paused:
+                raise MirrorStopped()
+
+            unproductive = 0 if segment.start > connected_at else unproductive + 1
+            max_reconnects = manager.watchdog.max_reconnects
+            if unproductive > max_reconnects:
+                manager.record_stall(self.download, reason, gave_up=True)
+                raise RuntimeError(f"Connection {reason}, no progress after {max_reconnects} reconnects")
+
+            manager.record_stall(self.download, reason)
+            print(f"Connection to mirror {mirror.url} {reason} at byte {segment.start}, reconnecting")
+            # Back off while reconnecting doesn't help
+            await asyncio.sleep(min(unproductive, 10))
+            if self.download.cancelled or self.download.paused:
+                raise MirrorStopped()
+            if segment.start >= segment.end:
+                return  # Another mirror took over the rest meanwhile
+
+    async def _run_mirror(self, mirror: Mirror):
+        """Fetch ranges from one mirror until nothing is left for it"""
+        while mirror.status == 'active':
+            segment = self._next_segment(mirror)
+            if segment is None:
+                return
+            try:
+                await self._fetch_watched(mirror, segment)
+            except MirrorStopped:
+                self._release(segment)
+                return
+            except Exception as e:
+                self._release(segment)
+                mirror.drop(str(e) or type(e).__name__)
+                return
+            self._release(segment)
+
+    async def _report_progress(self):
+        """Mirror and overall speed every second, DB and segment state every 5 seconds"""
+        last_save = time.time()
+        self.download.update_db()
+        while True:
+            await asyncio.sleep(1.0)
+            for mirror in self.mirrors:
+                delta = mirror.downloaded_bytes - mirror.last_sample_bytes
+                mirror.last_sample_bytes = mirror.downloaded_bytes
+                mirror.speed_bps = delta if not mirror.speed_bps else 0.5 * mirror.speed_bps + 0.5 * delta
+                if mirror.status != 'active':
+                    mirror.speed_bps = 0
+            self.download.calculate_speed(self.download.downloaded_bytes)
+            if time.time() - last_save >= 5.0:
+                self._save_state()
+                self.download.update_db()
+                last_save = time.time()
+
+    async def run(self) -> Optional[bool]:
+        """Download from all usable mirrors
+
+        Returns True when complete, False if paused/cancelled, or None when no
+        mirror supports range requests (the caller falls back to a
+        single-source transfer of the primary URL).
+        """
+        reporter = None
+        try:
+            if not await self._probe_mirrors():
+                return None
+
+            temp_exists = os.path.exists(self.temp_file_path)
+            self.fd = os.open(self.temp_file_path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._load_state(temp_exists)
+            self._save_state()
+
+            self.download.total_bytes = self.total_bytes
+            self.download.downloaded_bytes = self.total_bytes - self._missing_bytes()
+            reporter = asyncio.create_task(self._report_progress())
+
+            while self.pending:
+                live = [m for m in self.mirrors if m.status == 'active']
+                if not live:
+                    errors = '; '.join(f"{m.url}: {m.error}" for m in self.mirrors)
+                    raise RuntimeError(f"All mirrors failed ({errors})")
+
+                # Ranges of a mirror dropped after the others ran out of work
+                # are left pending; run the survivors again for them
+                await asyncio.gather(*(self._run_mirror(m) for m in live))
+                if self.download.cancelled or self.download.paused:
+                    return False
+
+            os.remove(self.state_path)
+            return True
+
+        finally:
+            if reporter:
+                reporter.cancel()
+            if self.fd is not None:
+                if os.path.exists(self.state_path):
+                    self._save_state()
+                os.close(self.fd)
+            for mirror in self.mirrors:
+                mirror.speed_bps = 0
+                if mirror.session:
+                    await mirror.session.close()
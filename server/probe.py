@@ -0,0 +1,144 @@
+import asyncio
+import os
+import re
+from datetime import datetime
+from typing import Dict, Optional
+from urllib.parse import unquote
+
+from curl_cffi.requests import AsyncSession
+
+from download_manager import build_browser_headers
+
+
+# filename*=UTF-8''name%20here (RFC 5987) and filename="name" / filename=name
+_FILENAME_EXT = re.compile(r"filename\*\s*=\s*([\w!#$%&+^`{}~-]+)'[^']*'([^;]+)", re.IGNORECASE)
+_FILENAME = re.compile(r'filename\s*=\s*(?:"((?:[^"\\]|\\.)*)"|([^;]+))', re.IGNORECASE)
+
+
+def parse_content_disposition(value: Optional[str]) -> Optional[str]:
+    """Filename from a Content-Disposition header, reduced to a safe basename"""
+    if not value:
+        return None
+    filename = None
+    match = _FILENAME_EXT.search(value)
+    if match:
+        try:
+            filename = unquote(match.group(2).strip(), encoding=match.group(1), errors='strict')
+        except (LookupError, UnicodeDecodeError):
+            filename = None
+    if filename is None:
+        match = _FILENAME.search(value)
+        if match:
+            filename = match.group(1) if match.group(1) is not None else match.group(2).strip()
+            filename = re.sub(r'\\(.)', r'\1', filename)
+    if not filename:
+        return None
+    filename = os.path.basename(filename.replace('\\', '/')).replace('\0', '').strip()
+    return filename if filename not in ('', '.', '..') else None
+
+
+def parse_probe_response(status_code: int, headers, ranged: bool) -> Dict:
+    """Probe result from a HEAD or 'Range: bytes=0-0' response"""
+    result = {'status_code': status_code}
+    if status_code >= 400:
+        result['error'] = f"HTTP {status_code}"
+        return result
+
+    total_bytes = None
+    accept_ranges = None
+    if status_code == 206:
+        accept_ranges = True
+        try:
+            total_bytes = int(headers.get('Content-Range', '').rsplit('/', 1)[1])
+        except (IndexError, ValueError):
+            pass  # 'bytes 0-0/*': size unknown
+    else:
+        encoding = headers.get('Content-Encoding', 'identity').lower()
+        if 'Content-Length' in headers and encoding == 'identity':
+            try:
+                total_bytes = int(headers['Content-Length'])
+            except ValueError:
+                pass
+        advertised = headers.get('Accept-Ranges', '').lower()
+        if ranged:
+            accept_ranges = False  # Asked for one byte, got the whole file
+        elif advertised:
+            accept_ranges = advertised == 'bytes'
+
+    etag = headers.get('ETag')
+    result.update({
+        'total_bytes': total_bytes,
+        'accept_ranges': accept_ranges,
+        'etag': etag,
+        'filename': parse_content_disposition(headers.get('Content-Disposition'))
+    })
+    return result
+
+
+class MetadataProber:
+    """Fetches size, range support, ETag and filename of queued downloads ahead of their transfer
+
+    process_queue calls schedule() with the queue every tick; up to
+    `concurrency` probes run at once in the background. A probe sends a HEAD
+    request, and a 'Range: bytes=0-0' GET (headers only, the body is never
+    read) if the server refuses HEAD or doesn't give a length. The manager
+    applies the result (apply_probe), which gives the queue policies sizes to
+    sort by before anything is transferred. A failed probe is recorded and
+    not retried - the transfer itself still runs and reports the real error.
+    """
+
+    # Seconds a probe request may take
+    TIMEOUT = 20
+
+    def __init__(self, manager, concurrency: int = 4):
+        self.manager = manager
+        self.concurrency = max(0, concurrency)
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    def schedule(self, queued):
+        """Start probes for queued file downloads that haven't been probed"""
+        for download in queued:
+            if len(self.tasks) >= self.concurrency:
+                return
+            if download.probe is not None or download.job_type != 'file' or download.id in self.tasks:
+                continue
+            task = asyncio.create_task(self._probe(download))
+            self.tasks[download.id] = task
+            task.add_done_callback(lambda _, download_id=download.id: self.tasks.pop(download_id, None))
+
+    def cancel(self, download_id: str):
+        task = self.tasks.get(download_id)
+        if task is not None:
+            task.cancel()
+
+    async def _probe(self, download):
+        headers = build_browser_headers(download.url, download.cookies)
+        # Content-Length must be the size of the file, not of an encoding of it
+        headers['Accept-Encoding'] = 'identity'
+
+        session = AsyncSession(impersonate="chrome120")
+        try:
+            try:
+                response = await session.head(download.url, headers=headers, timeout=self.TIMEOUT)
+                result = parse_probe_response(response.status_code, response.headers, ranged=False)
+            except Exception as e:
+                result = {'status_code': None, 'error': str(e) or type(e).__name__}
+
+            if result.get('error') or result.get('total_bytes') is None or result.get('accept_ranges') is None:
+                try:
+                    headers['Range'] = 'bytes=0-0'
+                    response = await session.get(download.url, headers=headers, timeout=self.TIMEOUT, stream=True)
+                    try:
+                        ranged = parse_probe_response(response.status_code, response.headers, ranged=True)
+                    finally:
+                        await response.aclose()
+                    if not ranged.get('error') or result.get('error'):
+                        result = ranged
+                except Exception as e:
+                    if result.get('error'):
+                        result['error'] = str(e) or type(e).__name__
+        finally:
+            await session.close()
+
+        result['probed_at'] = datetime.utcnow().isoformat()
+        self.manager.apply_probe(download, result)
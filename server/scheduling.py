@@ -0,0 +1,58 @@
+from collections import deque
+from typing import Deque, Dict, List
+from urllib.parse import urlparse
+
+
+# Order in which queued downloads get free slots (the queue_policy setting)
+QUEUE_POLICIES = ('fifo', 'smallest_first', 'largest_first', 'round_robin')
+
+# Policies that order by size; queued downloads are only probed for their size under these
+SIZE_POLICIES = ('smallest_first', 'largest_first')
+
+
+def _remaining(download) -> int:
+    return max(0, download.total_bytes - download.downloaded_bytes)
+
+
+def _host(download) -> str:
+    return urlparse(download.url).netloc.lower()
+
+
+def order_queue(policy: str, queued: List, running: List) -> List:
+    """queued downloads in the order they should start under policy
+
+    'fifo':           order of adding
+    'smallest_first': fewest bytes left first (shortest job first), so small
+                      files don't wait behind huge ones
+    'largest_first':  most bytes left first
+    'round_robin':    one download per host in turn, hosts with the fewest
+                      running downloads first, so one site's long list doesn't
+                      hold up the others
+
+    Sizes come from the metadata probe or an earlier partial transfer;
+    downloads whose size is still unknown go after the known ones under the
+    size policies. Ties keep queue order.
+    """
+    if policy == 'smallest_first':
+        return sorted(queued, key=lambda d: (d.total_bytes <= 0, _remaining(d)))
+    if policy == 'largest_first':
+        return sorted(queued, key=lambda d: (d.total_bytes <= 0, -_remaining(d)))
+    if policy != 'round_robin':
+        return list(queued)
+
+    by_host: Dict[str, Deque] = {}
+    for download in queued:
+        by_host.setdefault(_host(download), deque()).append(download)
+    load: Dict[str, int] = {}
+    for download in running:
+        load[_host(download)] = load.get(_host(download), 0) + 1
+
+    ordered = []
+    first_seen = {host: index for index, host in enumerate(by_host)}
+    while by_host:
+        host = min(by_host, key=lambda h: (load.get(h, 0), first_seen[h]))
+        ordered.append(by_host[host].popleft())
+        load[host] = load.get(host, 0) + 1
+        if not by_host[host]:
+            del by_host[host]
+    return ordered
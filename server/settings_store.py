@@ -0,0 +1,119 @@
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List
+
+from change_signal import ChangeSignal
+
+
+class SettingsStore:
+    """Typed in-memory settings, written through to the settings table
+
+    This is the single source of truth for configuration at runtime: values are
+    loaded once at startup, reads never touch the database, and update() writes
+    the DB in one transaction before notifying subscribers (rate limiter,
+    scheduler, WebSocket broadcast) of the keys that actually changed.
+    """
+
+    # key -> (type, default)
+    DEFINITIONS = {
+        'global_rate_limit_bps': (int, 0),
+        'max_concurrent_downloads': (int, 3),
+        'default_download_folder': (str, ''),
+        'concurrency_mode': (str, 'fixed'),
+        'auto_concurrency_min': (int, 1),
+        'auto_concurrency_max': (int, 8),
+        'queue_policy': (str, 'fifo'),
+        'duplicate_policy': (str, 'attach'),
+    }
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.values: Dict[str, Any] = {key: default for key, (_, default) in self.DEFINITIONS.items()}
+        self.subscribers: List[Callable[[Dict[str, Any], Dict[str, Any]], None]] = []
+        self.lock = threading.Lock()
+        self.changes = ChangeSignal()  # Bumped on every change (ETag of GET /api/settings)
+        self.load()
+
+    @classmethod
+    def coerce(cls, key: str, value) -> Any:
+        """Convert a stored/submitted value to the setting's type"""
+        value_type, default = cls.DEFINITIONS[key]
+        if value_type is int:
+            try:
+                return int(value) if value not in (None, '') else default
+            except (TypeError, ValueError):
+                return default
+        return value_type(value) if value is not None else default
+
+    def load(self):
+        """(Re)load all settings from the database"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("SELECT key, value FROM settings")
+        rows = cursor.fetchall()
+        conn.close()
+
+        with self.lock:
+            for row in rows:
+                if row['key'] in self.DEFINITIONS:
+                    self.values[row['key']] = self.coerce(row['key'], row['value'])
+                else:
+                    # Unknown keys are kept as plain strings so nothing is lost
+                    self.values[row['key']] = row['value']
+            self.changes.set(self.changes.value + 1)
+
+    def get(self, key: str):
+        """Current value of a setting (typed)"""
+        return self.values.get(key, self.DEFINITIONS.get(key, (None, None))[1])
+
+    def as_dict(self) -> Dict[str, Any]:
+        """All settings with their typed values"""
+        return dict(self.values)
+
+    def as_api_dict(self) -> Dict[str, str]:
+        """All settings as strings (the format GET /api/settings has always returned)"""
+        return {key: str(value) for key, value in self.values.items()}
+
+    def subscribe(self, callback: Callable[[Dict[str, Any], Dict[str, Any]], None]):
+        """Call callback(changed, previous) after settings change
+
+        changed maps each changed key to its new value, previous to its old value.
+        Callbacks run on the thread that called update().
+        """
+        self.subscribers.append(callback)
+
+    def update(self, changes: Dict[str, Any]) -> Dict[str, Any]:
+        """Write changes through to the database and notify subscribers
+
+        Args:
+            changes: Setting key -> new value (validated by the caller)
+
+        Returns:
+            Dict of the keys whose value actually changed
+        """
+        with self.lock:
+            typed = {key: self.coerce(key, value) for key, value in changes.items()}
+            changed = {key: value for key, value in typed.items() if self.values.get(key) != value}
+            if not changed:
+                return {}
+
+            conn = sqlite3.connect(self.db_path)
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                    [(key, str(value)) for key, value in changed.items()]
+                )
+            conn.close()
+
+            previous = {key: self.values.get(key) for key in changed}
+            self.values.update(changed)
+            self.changes.set(self.changes.value + 1)
+
+        for callback in list(self.subscribers):
+            try:
+                callback(changed, previous)
+            except Exception as e:
+                print(f"Settings subscriber failed: {e}")
+
+        return changed
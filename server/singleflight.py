@@ -0,0 +1,63 @@
+from typing import Dict, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+
+# Download statuses that still hold or will start a transfer
+IN_FLIGHT_STATUSES = ('queued', 'downloading', 'paused', 'moving')
+
+# What adding a URL that is already in flight into the same folder does (the duplicate_policy
+# setting): 'attach' returns the existing download, 'link' adds a download that hardlinks (or
+# copies) the file once the existing one completes, 'off' starts a second transfer
+DUPLICATE_POLICIES = ('attach', 'link', 'off')
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url: str) -> str:
+    """url with case-insensitive parts lowercased, the default port and the fragment dropped"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if ':' in host:
+        host = f"[{host}]"  # IPv6 literal
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port in (None, _DEFAULT_PORTS.get(scheme)) else f"{host}:{port}"
+    if parts.username is not None:
+        userinfo = parts.username + (f":{parts.password}" if parts.password is not None else '')
+        netloc = f"{userinfo}@{netloc}"
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+def _key(url: str, folder: str) -> Tuple[str, str]:
+    return normalize_url(url), (folder or '').replace('\\', '/').strip('/')
+
+
+class InFlightIndex:
+    """In-flight downloads by normalized URL and target folder
+
+    Entries aren't removed when a download ends; get() checks that the
+    download it finds is still in flight (and drops it otherwise), so status
+    changes anywhere in the manager need no bookkeeping here.
+    """
+
+    def __init__(self, downloads: Dict):
+        self.downloads = downloads  # The manager's id -> Download map
+        self.entries: Dict[Tuple[str, str], str] = {}
+
+    def add(self, download):
+        self.entries[_key(download.url, download.folder)] = download.id
+
+    def get(self, url: str, folder: str):
+        """The in-flight download of url into folder, or None"""
+        key = _key(url, folder)
+        download_id = self.entries.get(key)
+        if download_id is None:
+            return None
+        download = self.downloads.get(download_id)
+        if download is None or download.status not in IN_FLIGHT_STATUSES:
+            del self.entries[key]
+            return None
+        return download
@@ -0,0 +1,69 @@
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+
+class TransferStalled(Exception):
+    """A transfer's connection was given up by the watchdog (the transfer reconnects it)"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason  # 'stalled' (no bytes) or 'slow' (below the minimum speed)
+
+
+class WatchdogConfig:
+    """Stall watchdog thresholds (sent to worker processes and cluster nodes with each job)"""
+
+    def __init__(self, window: float = 30, min_speed_bps: int = 0, max_reconnects: int = 5):
+        # Seconds progress is measured over (0 = watchdog off)
+        self.window = max(0, window)
+        # Average speed over the window below which the connection is replaced (0 = only
+        # replace connections that received nothing at all)
+        self.min_speed_bps = max(0, min_speed_bps)
+        # Reconnects in a row that bring no new bytes before the download fails
+        self.max_reconnects = max(0, max_reconnects)
+
+    def to_dict(self) -> Dict:
+        return {'window': self.window, 'min_speed_bps': self.min_speed_bps,
+                'max_reconnects': self.max_reconnects}
+
+
+class StallWatchdog:
+    """Decides when the connection of one transfer should be torn down and re-established
+
+    check() is called about once a second with the transfer's byte count. Once
+    a full window of samples exists, a window without a single new byte is a
+    stall and an average below min_speed_bps is a slow connection (half-dead
+    TCP connections often trickle a few bytes instead of stopping). reset()
+    starts a new window, e.g. while the download is paused or after a reconnect.
+    """
+
+    def __init__(self, config: WatchdogConfig):
+        self.config = config
+        self.samples: Deque[Tuple[float, int]] = deque()
+
+    def reset(self):
+        self.samples.clear()
+
+    def check(self, downloaded_bytes: int, check_speed: bool = True) -> Optional[str]:
+        """'stalled', 'slow' or None; check_speed=False only looks for stalls"""
+        window = self.config.window
+        if window <= 0:
+            return None
+
+        now = time.monotonic()
+        self.samples.append((now, downloaded_bytes))
+        # Keep the newest sample that is at least a window old as the baseline
+        while len(self.samples) > 1 and now - self.samples[1][0] >= window:
+            self.samples.popleft()
+
+        started_at, start_bytes = self.samples[0]
+        elapsed = now - started_at
+        if elapsed < window:
+            return None
+        received = downloaded_bytes - start_bytes
+        if received <= 0:
+            return 'stalled'
+        if check_speed and self.config.min_speed_bps and received / elapsed < self.config.min_speed_bps:
+            return 'slow'
+        return None
@@ -516,7 +516,7 @@ function toggleMobileMenu() {
 function updateCategoryCounts() {
     const counts = {
         all: downloads.length,
-        active: downloads.filter(d => d.status === 'downloading' || d.status === 'queued').length,
+        active: downloads.filter(d => ['downloading', 'queued', 'moving'].includes(d.status)).length,
         completed: downloads.filter(d => d.status === 'completed').length,
         paused: downloads.filter(d => d.status === 'paused').length,
         failed: downloads.filter(d => d.status === 'failed').length
@@ -539,7 +539,7 @@ function getFilteredDownloads() {
 
     // Apply category filter
     if (currentFilter === 'active') {
-        filtered = filtered.filter(d => d.status === 'downloading' || d.status === 'queued');
+        filtered = filtered.filter(d => ['downloading', 'queued', 'moving'].includes(d.status));
     } else if (currentFilter !== 'all') {
         filtered = filtered.filter(d => d.status === currentFilter);
     }
@@ -775,6 +775,7 @@ function getStatusLabel(status) {
         'downloading': 'Downloading',
         'queued': 'Queued',
         'paused': 'Paused',
+        'moving': 'Moving',
         'completed': 'Completed',
         'failed': 'Failed'
     };
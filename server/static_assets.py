@@ -0,0 +1,114 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are built
+    brotli = None
+
+
+# Worth compressing (images like PNG are already compressed)
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml',
+                      'application/xml', 'application/manifest+json')
+
+# Variants smaller than this fraction of the original are not worth a separate copy
+MIN_SAVING = 0.9
+
+
+class StaticAsset:
+    """One file from the static folder with its precompressed variants"""
+
+    __slots__ = ('path', 'hashed_path', 'content_type', 'digest', 'variants')
+
+    def __init__(self, path: str, data: bytes, content_type: str):
+        self.path = path
+        self.content_type = content_type
+        self.digest = hashlib.sha256(data).hexdigest()[:12]
+        base, ext = os.path.splitext(path)
+        self.hashed_path = f"{base}.{self.digest}{ext}"
+        # Content-Encoding ('' = identity) -> body
+        self.variants: Dict[str, bytes] = {'': data}
+
+        if content_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data) * MIN_SAVING:
+                self.variants['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(data, quality=11)
+                if len(compressed) < len(data) * MIN_SAVING:
+                    self.variants['br'] = compressed
+
+    def etag(self, encoding: str) -> str:
+        return f"{self.digest}-{encoding}" if encoding else self.digest
+
+
+class StaticAssets:
+    """In-memory index of the dashboard's static files
+
+    Built once at startup: every file is read, hashed and compressed (gzip,
+    plus brotli when installed) ahead of time, so requests never touch the
+    filesystem or compress anything. Each file is reachable under its plain
+    path and under a content-hashed one (app.<hash>.js); HTML pages are
+    rewritten to reference the hashed paths, which can be cached forever
+    because a new build gets a new name. Plain paths (pages, icons app.js
+    loads by name) are revalidated with ETags instead.
+    """
+
+    # Browser preference when several encodings are accepted
+    ENCODING_PREFERENCE = ('br', 'gzip')
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.by_path: Dict[str, StaticAsset] = {}
+        self.by_hashed_path: Dict[str, StaticAsset] = {}
+        self.encodings = [e for e in self.ENCODING_PREFERENCE if e != 'br' or brotli is not None]
+        self.load()
+
+    def load(self):
+        by_path = {}
+        pages = []
+        for directory, _, filenames in os.walk(self.root):
+            for filename in sorted(filenames):
+                full_path = os.path.join(directory, filename)
+                path = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                if content_type.startswith('text/') or content_type == 'application/javascript':
+                    content_type += '; charset=utf-8'
+                with open(full_path, 'rb') as f:
+                    data = f.read()
+                if content_type.startswith('text/html'):
+                    pages.append((path, data, content_type))
+                else:
+                    by_path[path] = StaticAsset(path, data, content_type)
+
+        # Pages reference the other assets, so they are rewritten once those are hashed
+        def hashed_reference(match):
+            asset = by_path.get(match.group(2))
+            if asset is None:
+                return match.group(0)
+            return f"{match.group(1)}/static/{asset.hashed_path}{match.group(1)}"
+
+        for path, data, content_type in pages:
+            text = re.sub(r'(["\'])/static/([^"\'?#]+)\1', hashed_reference, data.decode('utf-8'))
+            by_path[path] = StaticAsset(path, text.encode('utf-8'), content_type)
+
+        self.by_path = by_path
+        self.by_hashed_path = {asset.hashed_path: asset for asset in by_path.values()}
+
+    def find(self, path: str) -> Tuple[Optional[StaticAsset], bool]:
+        """Asset for a request path and whether the path was the content-hashed one"""
+        asset = self.by_hashed_path.get(path)
+        if asset is not None:
+            return asset, True
+        return self.by_path.get(path), False
+
+    def choose_encoding(self, asset: StaticAsset, accept_encodings) -> str:
+        """Best precompressed variant the client accepts ('' = identity)"""
+        for encoding in self.ENCODING_PREFERENCE:
+            if encoding in asset.variants and accept_encodings[encoding]:
+                return encoding
+        return ''
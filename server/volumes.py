@@ -0,0 +1,126 @@
+import os
+import shutil
+from typing import Dict, List, Optional
+
+
+class VolumeSet:
+    """The download roots and the policy that places new files on them
+
+    DOWNLOAD_PATH is the primary root; DOWNLOAD_VOLUMES adds more. All roots
+    share one logical folder tree: a folder exists if it exists on any root,
+    listings merge them, and a filename is taken if any root has it. A
+    download is placed on a root when its transfer first starts (a partial
+    file keeps it where it is):
+
+    'most_free':    the root with the most free space, minus what running
+                    transfers on it still have to write
+    'least_writes': the root with the fewest transfers writing to it right
+                    now (ties go to the most free space)
+    'pinned':       the first root that already holds the folder, so each
+                    folder stays on one volume; new folders as 'most_free'
+
+    Pins (VOLUME_PINS, folder=root) put a folder and everything below it on a
+    fixed root under every policy.
+    """
+
+    POLICIES = ('most_free', 'least_writes', 'pinned')
+
+    def __init__(self, roots: List[str], policy: str = 'most_free',
+                 pins: Optional[Dict[str, str]] = None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown volume policy '{policy}'")
+        self.roots: List[str] = []
+        for root in roots:
+            root = os.path.abspath(root)
+            if root not in self.roots:
+                self.roots.append(root)
+        if not self.roots:
+            raise ValueError("At least one download root is required")
+        self.primary = self.roots[0]
+        self.policy = policy
+
+        self.pins: Dict[str, str] = {}
+        for folder, root in (pins or {}).items():
+            root = os.path.abspath(root)
+            if root not in self.roots:
+                raise ValueError(f"Pinned volume {root} is not one of the download roots")
+            self.pins[self.normalize(folder)] = root
+
+    @staticmethod
+    def normalize(folder: str) -> str:
+        return folder.replace('\\', '/').strip('/')
+
+    @staticmethod
+    def parse_pins(text: str) -> Dict[str, str]:
+        """'movies=/mnt/disk2,tv/shows=/mnt/disk3' -> {folder: root}"""
+        pins = {}
+        for entry in filter(None, (part.strip() for part in text.split(','))):
+            folder, sep, root = entry.partition('=')
+            if not sep or not root.strip():
+                raise ValueError(f"Invalid volume pin '{entry}' (expected folder=path)")
+            pins[folder.strip()] = root.strip()
+        return pins
+
+    def pinned_root(self, folder: str) -> Optional[str]:
+        """Root of the most specific pin covering folder"""
+        folder = self.normalize(folder)
+        best = None
+        for pinned, root in self.pins.items():
+            if not pinned or folder == pinned or folder.startswith(pinned + '/'):
+                if best is None or len(pinned) > len(best[0]):
+                    best = (pinned, root)
+        return best[1] if best else None
+
+    def roots_with(self, folder: str) -> List[str]:
+        """Roots on which folder exists as a directory"""
+        return [root for root in self.roots if os.path.isdir(os.path.join(root, folder))]
+
+    def find_file(self, folder: str, filename: str) -> Optional[str]:
+        """Root holding folder/filename, if any"""
+        for root in self.roots:
+            if os.path.exists(os.path.join(root, folder, filename)):
+                return root
+        return None
+
+    def free_bytes(self, root: str) -> int:
+        try:
+            return shutil.disk_usage(root).free
+        except OSError:
+            return 0
+
+    def choose(self, folder: str, active_writes: Dict[str, int],
+               pending_bytes: Dict[str, int]) -> str:
+        """Root for a new file in folder, given the current write load per root"""
+        pinned = self.pinned_root(folder)
+        if pinned is not None:
+            return pinned
+        if len(self.roots) == 1:
+            return self.primary
+
+        if self.policy == 'pinned' and self.normalize(folder):
+            existing = self.roots_with(folder)
+            if existing:
+                return existing[0]
+
+        free = {root: self.free_bytes(root) - pending_bytes.get(root, 0) for root in self.roots}
+        if self.policy == 'least_writes':
+            return min(self.roots, key=lambda root: (active_writes.get(root, 0), -free[root]))
+        return max(self.roots, key=lambda root: (free[root], -active_writes.get(root, 0)))
+
+    def get_status(self, active_writes: Dict[str, int]) -> List[Dict]:
+        status = []
+        for root in self.roots:
+            try:
+                usage = shutil.disk_usage(root)
+                total, free = usage.total, usage.free
+            except OSError:
+                total = free = None
+            status.append({
+                'path': root,
+                'primary': root == self.primary,
+                'total_bytes': total,
+                'free_bytes': free,
+                'active_writes': active_writes.get(root, 0),
+                'pinned_folders': sorted(folder for folder, r in self.pins.items() if r == root)
+            })
+        return status
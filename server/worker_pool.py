@@ -0,0 +1,442 @@
+import asyncio
+import itertools
+import multiprocessing
+import time
+from typing import Dict, List, Optional, Tuple
+
+from deleter import FileDeleter
+from download_manager import Download, RateLimiter
+from stall_watchdog import WatchdogConfig
+
+
+# Messages are small tuples sent over a multiprocessing Pipe (pickled):
+#
+#   coordinator -> worker
+#     ('start', job)                 job = dict of Download constructor fields + resume state
+#     ('stop', download_id, delete)  pause/cancel: abort the transfer, delete the temp file if delete
+#     ('rate', bps)                  this worker's share of the global rate limit
+#     ('shutdown',)
+#
+#   worker -> coordinator
+#     ('progress', [(id, downloaded, total, speed, eta), ...])   once per second
+#     ('state', id, status, downloaded, total, error)            whenever the worker would write the DB
+#     ('finished', id, status, downloaded, total, error)         transfer ended
+#     ('folder', folder)                                         files in folder changed
+#     ('stall', id, reason, gave_up)                             stall watchdog replaced a connection
+
+PROGRESS_INTERVAL = 1.0
+
+
+class WorkerDownload(Download):
+    """Download running inside a worker - reports state to the coordinator instead of writing the DB"""
+
+    def update_db(self):
+        self.manager.send(('state', self.id, self.status, self.downloaded_bytes,
+                           self.total_bytes, self.error_message))
+
+
+class Worker:
+    """Download executor running in a worker process with its own event loop and curl sessions"""
+
+    def __init__(self, conn, download_path: str, transfer_mode: str,
+                 write_mode: str = 'cached', large_file_threshold: int = 0,
+                 staging_path: Optional[str] = None):
+        self.conn = conn
+        self.download_path = download_path
+        self.transfer_mode = transfer_mode
+        self.write_mode = write_mode
+        self.large_file_threshold = large_file_threshold
+        # Finished files stay in staging_path; the coordinator's mover takes them from there
+        self.staging_path = staging_path
+        self.mover = None
+        self.deleter = FileDeleter()
+        self.worker_pool = None  # Downloads in here always run on this loop
+        self.downloads: Dict[str, WorkerDownload] = {}
+        self.rate_limiter = RateLimiter()
+        self.rate_limit_bps = 0
+        self.watchdog = WatchdogConfig()  # The coordinator's, sent with each job
+        self.stopped = None
+        self.version = 0  # Bumped by Download attribute changes; only the coordinator uses it
+
+    # Interface used by Download ------------------------------------------
+
+    async def rate_limit(self, bytes_downloaded: int):
+        await self.rate_limiter.throttle(bytes_downloaded)
+
+    def get_rate_limit_share(self) -> int:
+        if self.rate_limit_bps == 0:
+            return 0
+        return max(1024, self.rate_limit_bps // max(1, len(self.downloads)))
+
+    def record_write(self, seconds: float, nbytes: int):
+        # Disk latency only feeds the coordinator's controller for in-process transfers
+        pass
+
+    def record_stall(self, download: Download, reason: str, gave_up: bool = False):
+        self.send(('stall', download.id, reason, gave_up))
+
+    def notify_folder_changed(self, folder: str):
+        self.send(('folder', folder))
+
+    def place(self, download: Download):
+        # The coordinator picked the download root (job['download_path'])
+        pass
+
+    # ---------------------------------------------------------------------
+
+    def send(self, message: Tuple):
+        try:
+            self.conn.send(message)
+        except (BrokenPipeError, EOFError, OSError):
+            # Coordinator is gone
+            self.stopped.set()
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        loop.add_reader(self.conn.fileno(), self._on_readable)
+        reporter = asyncio.create_task(self._report_progress())
+        try:
+            await self.stopped.wait()
+        finally:
+            loop.remove_reader(self.conn.fileno())
+            reporter.cancel()
+            tasks = [d.task for d in self.downloads.values() if d.task]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _on_readable(self):
+        try:
+            while self.conn.poll():
+                self._handle(self.conn.recv())
+        except (EOFError, OSError):
+            self.stopped.set()
+
+    def _handle(self, message: Tuple):
+        kind = message[0]
+        if kind == 'start':
+            self._start(message[1])
+        elif kind == 'stop':
+            download = self.downloads.get(message[1])
+            if download and download.task:
+                download.cancelled = len(message) > 2 and bool(message[2])
+                download.task.cancel()
+        elif kind == 'rate':
+            self.rate_limit_bps = message[1]
+            self.rate_limiter.set_limit(message[1])
+        elif kind == 'shutdown':
+            self.stopped.set()
+
+    def _start(self, job: Dict):
+        download = WorkerDownload(
+            job['id'], job['url'], job['folder'], job['filename'],
+            None, job.get('download_path', self.download_path), self,
+            user_agent=job['user_agent'], cookies=job['cookies'], mirrors=job.get('mirrors'),
+            job_type=job.get('job_type')
+        )
+        # downloaded_bytes comes from the temp file on this machine (start() reads it)
+        download.total_bytes = job['total_bytes']
+        download.probe = job.get('probe')  # Its ETag guards resumed ranges (If-Range)
+        if job.get('watchdog'):
+            self.watchdog = WatchdogConfig(**job['watchdog'])
+        self.downloads[download.id] = download
+        download.task = asyncio.create_task(download.start())
+        download.task.add_done_callback(lambda _: self._finished(download))
+
+    def _finished(self, download: WorkerDownload):
+        self.downloads.pop(download.id, None)
+        if download.cancelled and download.status != 'completed':
+            # Cancelled on the coordinator, which can't reach this node's files
+            for path in (download.get_temp_file_path(), download.get_segments_file_path()):
+                try:
+                    self.deleter.delete(path)
+                except OSError:
+                    pass
+            self.notify_folder_changed(download.folder)
+        self.send(('finished', download.id, download.status, download.downloaded_bytes,
+                   download.total_bytes, download.error_message))
+
+    async def _report_progress(self):
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            updates = []
+            for download in self.downloads.values():
+                if download.status == 'downloading':
+                    updates.append((download.id, download.downloaded_bytes, download.total_bytes,
+                                    int(download.speed_bps), int(download.eta_seconds)))
+            if updates:
+                self.send(('progress', updates))
+
+
+def worker_main(conn, download_path: str, transfer_mode: str, write_mode: str, large_file_threshold: int,
+                staging_path: Optional[str]):
+    """Worker process entry point"""
+    asyncio.run(Worker(conn, download_path, transfer_mode, write_mode, large_file_threshold,
+                       staging_path).serve())
+
+
+class WorkerHandle:
+    """Coordinator-side view of one worker process"""
+
+    def __init__(self, index: int, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.started_at = time.monotonic()
+        self.jobs: Dict[str, asyncio.Future] = {}
+
+
+class WorkerPool:
+    """Shards download execution across worker processes
+
+    The DownloadManager stays the coordinator: it owns the queue, the database
+    and the Download objects the API and WebSocket read. Download.start()
+    hands the transfer to the least busy worker and awaits its result, while
+    progress and state messages from the worker are applied to the Download
+    object (and written to the DB) on the coordinator loop. The global rate
+    limit is split between workers in proportion to their running transfers.
+    """
+
+    # Seconds to wait for a worker to confirm a stop before giving up on it
+    STOP_TIMEOUT = 10
+
+    # Workers that die sooner than this after starting are not restarted (startup crash loop)
+    MIN_UPTIME = 10
+
+    # Whether workers write to storage the coordinator can't see (they delete cancelled temp files)
+    remote_storage = False
+
+    def __init__(self, manager, count: int):
+        self.manager = manager
+        self.count = count
+        self.workers: List[WorkerHandle] = []
+        self.rate_limit_bps = 0
+        self.loop = None
+        self.closing = False
+        self._indexes = itertools.count()
+        self._context = multiprocessing.get_context('spawn')
+
+    def start(self):
+        """Spawn the worker processes (call on the coordinator loop)"""
+        self.loop = asyncio.get_running_loop()
+        for _ in range(self.count):
+            self.workers.append(self._spawn())
+
+    def _spawn(self) -> WorkerHandle:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=worker_main,
+            args=(child_conn, self.manager.download_path, self.manager.transfer_mode,
+                  self.manager.write_mode, self.manager.large_file_threshold, self.manager.staging_path),
+            name='download-worker',
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+
+        worker = WorkerHandle(next(self._indexes), process, parent_conn)
+        self.loop.add_reader(parent_conn.fileno(), self._on_readable, worker)
+        return worker
+
+    def _send(self, worker: WorkerHandle, message: Tuple) -> bool:
+        try:
+            worker.conn.send(message)
+            return True
+        except (BrokenPipeError, EOFError, OSError):
+            self._on_worker_exit(worker)
+            return False
+
+    # ------------------------------------------------------------------
+    # Jobs
+    # ------------------------------------------------------------------
+
+    def _worker_for(self, download_id: str) -> Optional[WorkerHandle]:
+        for worker in self.workers:
+            if download_id in worker.jobs:
+                return worker
+        return None
+
+    async def run(self, download: Download) -> Tuple[str, Optional[str]]:
+        """Run download in a worker and wait for it to end. Returns (status, error_message)."""
+        if self.closing or not self.workers:
+            raise RuntimeError("Worker pool is not running")
+
+        # A stop for a previous run of this download may still be in flight
+        previous = self._worker_for(download.id)
+        if previous is not None:
+            await asyncio.wait([previous.jobs[download.id]], timeout=self.STOP_TIMEOUT)
+
+        worker = self._choose_worker()
+        future = self.loop.create_future()
+        worker.jobs[download.id] = future
+        self._assigned(worker, download)
+
+        job = {
+            'id': download.id,
+            'url': download.url,
+            'folder': download.folder,
+            'filename': download.filename,
+            'user_agent': download.user_agent,
+            'cookies': download.cookies,
+            'mirrors': download.mirrors,
+            'job_type': download.job_type,
+            'downloaded_bytes': download.downloaded_bytes,
+            'total_bytes': download.total_bytes,
+            'probe': download.probe,
+            'watchdog': self.manager.watchdog.to_dict(),
+        }
+        if not self.remote_storage:
+            job['download_path'] = download.download_path
+        if self._send(worker, ('start', job)):
+            self._rebalance()
+
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Cancelled or paused on the coordinator: make sure the worker has
+            # stopped writing the file before the caller touches it
+            delete = self.remote_storage and download.cancelled
+            if not future.done() and self._send(worker, ('stop', download.id, delete)):
+                await asyncio.wait([future], timeout=self.STOP_TIMEOUT)
+            raise
+
+    def _choose_worker(self):
+        """Least busy worker"""
+        return min(self.workers, key=lambda w: len(w.jobs))
+
+    def _assigned(self, worker, download: Download):
+        """Called when download has been given to worker"""
+
+    def capacity(self) -> Optional[int]:
+        """Transfers the pool can run at once (None = use max_concurrent_downloads)"""
+        return None
+
+    def stop(self, download_id: str):
+        """Ask the worker running download_id to stop it (the temp file is kept)"""
+        worker = self._worker_for(download_id)
+        if worker is not None:
+            self._send(worker, ('stop', download_id, False))
+
+    async def set_rate_limit(self, bps: int):
+        self.rate_limit_bps = max(0, bps)
+        self._rebalance()
+
+    def _rebalance(self):
+        """Give each worker its share of the global limit by number of running transfers"""
+        running = sum(len(w.jobs) for w in self.workers)
+        for worker in list(self.workers):
+            if self.rate_limit_bps == 0:
+                share = 0
+            elif running == 0:
+                share = self.rate_limit_bps // len(self.workers)
+            else:
+                # Idle workers get a small budget so a new transfer isn't unlimited
+                share = max(1024, self.rate_limit_bps * len(worker.jobs) // running)
+            self._send(worker, ('rate', share))
+
+    # ------------------------------------------------------------------
+    # Messages from workers
+    # ------------------------------------------------------------------
+
+    def _on_readable(self, worker: WorkerHandle):
+        try:
+            while worker.conn.poll():
+                self._handle(worker, worker.conn.recv())
+        except (EOFError, OSError):
+            self._on_worker_exit(worker)
+
+    def _handle(self, worker: WorkerHandle, message: Tuple):
+        kind = message[0]
+        downloads = self.manager.downloads
+
+        if kind == 'progress':
+            for download_id, downloaded, total, speed, eta in message[1]:
+                download = downloads.get(download_id)
+                if download is not None and download.status == 'downloading':
+                    download.downloaded_bytes = downloaded
+                    download.total_bytes = total
+                    download.speed_bps = speed
+                    download.eta_seconds = eta
+
+        elif kind == 'state':
+            _, download_id, status, downloaded, total, error = message
+            download = downloads.get(download_id)
+            if download is not None and download.status == 'downloading':
+                download.downloaded_bytes = downloaded
+                download.total_bytes = total
+                download.error_message = error
+                download.update_db()
+
+        elif kind == 'finished':
+            _, download_id, status, downloaded, total, error = message
+            download = downloads.get(download_id)
+            if download is not None:
+                download.downloaded_bytes = downloaded
+                download.total_bytes = total
+            future = worker.jobs.pop(download_id, None)
+            if future is not None and not future.done():
+                future.set_result((status, error))
+            self._rebalance()
+
+        elif kind == 'stall':
+            _, download_id, reason, gave_up = message
+            download = downloads.get(download_id)
+            if download is not None:
+                self.manager.record_stall(download, reason, gave_up)
+
+        elif kind == 'folder':
+            self.manager.notify_folder_changed(message[1])
+
+    def _detach(self, worker: WorkerHandle, result: Tuple[str, Optional[str]]) -> bool:
+        """Forget a worker, ending its unfinished jobs with result"""
+        if worker not in self.workers:
+            return False
+        self.workers.remove(worker)
+        self.loop.remove_reader(worker.conn.fileno())
+        worker.conn.close()
+
+        for future in worker.jobs.values():
+            if not future.done():
+                future.set_result(result)
+        worker.jobs.clear()
+        return True
+
+    def _on_worker_exit(self, worker: WorkerHandle):
+        if not self._detach(worker, ('failed', 'Download worker process exited')) or self.closing:
+            return
+        if time.monotonic() - worker.started_at < self.MIN_UPTIME:
+            print(f"Download worker {worker.index} exited right after starting "
+                  f"(code {worker.process.exitcode}), not restarting")
+            return
+        print(f"Download worker {worker.index} exited (code {worker.process.exitcode}), restarting")
+        self.workers.append(self._spawn())
+        self._rebalance()
+
+    async def close(self):
+        """Stop all workers; running transfers end as stopped (paused)"""
+        self.closing = True
+        workers = list(self.workers)
+        pending = [f for w in workers for f in w.jobs.values()]
+        for worker in workers:
+            self._send(worker, ('shutdown',))
+        if pending:
+            await asyncio.wait(pending, timeout=self.STOP_TIMEOUT)
+
+        for worker in workers:
+            await self.loop.run_in_executor(None, worker.process.join, self.STOP_TIMEOUT)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            self._detach(worker, ('paused', None))
+
+    def get_status(self) -> List[Dict]:
+        """Worker processes and the downloads each is running"""
+        return [
+            {
+                'index': worker.index,
+                'pid': worker.process.pid,
+                'alive': worker.process.is_alive(),
+                'downloads': list(worker.jobs)
+            }
+            for worker in self.workers
+        ]
@@ -0,0 +1,107 @@
+import json
+from typing import Dict, List, Optional, Union
+
+try:
+    import msgpack
+except ImportError:  # optional: without it clients fall back to the JSON encodings
+    msgpack = None
+
+
+# Sec-WebSocket-Protocol values a client can offer, mapped to encodings
+SUBPROTOCOLS = {
+    'nasdl.json': 'json',
+    'nasdl.columnar': 'columnar',
+    'nasdl.msgpack': 'msgpack',
+}
+
+DEFAULT_ENCODING = 'json'
+
+
+def available_encodings() -> List[str]:
+    encodings = ['json', 'columnar']
+    if msgpack is not None:
+        encodings.append('msgpack')
+    return encodings
+
+
+def available_subprotocols() -> List[str]:
+    return [name for name, encoding in SUBPROTOCOLS.items() if encoding in available_encodings()]
+
+
+def negotiate(subprotocol: Optional[str], requested: Optional[str]) -> str:
+    """Encoding for a new connection (raises ValueError for an unsupported ?encoding=)
+
+    A subprotocol picked during the handshake wins; otherwise the encoding query
+    parameter is used; clients that ask for neither get plain JSON.
+    """
+    if subprotocol in SUBPROTOCOLS:
+        return SUBPROTOCOLS[subprotocol]
+    if not requested:
+        return DEFAULT_ENCODING
+    if requested not in available_encodings():
+        raise ValueError(f"Unsupported encoding '{requested}' "
+                         f"(available: {', '.join(available_encodings())})")
+    return requested
+
+
+def to_columnar(message: Dict) -> Dict:
+    """Status message with the download list as one column list plus value rows
+
+    Every download carries the same keys, so sending them once per message
+    instead of once per download removes most of the payload. Keys only some
+    downloads have (mirrors, stream) get a null in the other rows.
+    """
+    downloads = message.get('downloads')
+    if message.get('type') != 'status' or not isinstance(downloads, list):
+        return message
+
+    columns = []
+    seen = set()
+    for download in downloads:
+        for key in download:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+
+    result = {key: value for key, value in message.items() if key != 'downloads'}
+    result['columns'] = columns
+    result['rows'] = [[download.get(key) for key in columns] for download in downloads]
+    return result
+
+
+def encode(message: Dict, encoding: str) -> Union[str, bytes]:
+    """Serialize a message for a client; msgpack gives a binary frame"""
+    if encoding == 'json':
+        return json.dumps(message)
+    if encoding == 'columnar':
+        return json.dumps(to_columnar(message), separators=(',', ':'))
+    if encoding == 'msgpack':
+        return msgpack.packb(to_columnar(message))
+    raise ValueError(f"Unknown encoding '{encoding}'")
+
+
+def decode(data: Union[str, bytes], encoding: str):
+    """Parse a client message (msgpack clients may send binary frames; raises ValueError)"""
+    if isinstance(data, bytes):
+        if encoding != 'msgpack':
+            data = data.decode('utf-8')
+        else:
+            try:
+                return msgpack.unpackb(data)
+            except Exception as e:
+                raise ValueError(f"Invalid MessagePack: {e}")
+    return json.loads(data)
+
+
+class MessageCache:
+    """Encodes each message once per encoding, however many clients receive it"""
+
+    def __init__(self, message: Dict):
+        self.message = message
+        self.encoded: Dict[str, Union[str, bytes]] = {}
+
+    def get(self, encoding: str) -> Union[str, bytes]:
+        data = self.encoded.get(encoding)
+        if data is None:
+            data = self.encoded[encoding] = encode(self.message, encoding)
+        return data
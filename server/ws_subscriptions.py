@@ -0,0 +1,173 @@
+import json
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class DownloadFilter:
+    """Which downloads a WebSocket subscription receives (all criteria must match)"""
+
+    STATUSES = ('queued', 'downloading', 'paused', 'moving', 'completed', 'failed', 'cancelled')
+
+    def __init__(self, statuses: Optional[Iterable[str]] = None, folder: Optional[str] = None,
+                 ids: Optional[Iterable[str]] = None):
+        self.statuses = frozenset(statuses) if statuses else None
+        self.folder = folder.replace('\\', '/').strip('/') if folder is not None else None
+        self.ids = frozenset(ids) if ids else None
+
+    @classmethod
+    def parse(cls, data: Optional[Dict]) -> 'DownloadFilter':
+        """Build a filter from a subscribe message's 'filter' object (raises ValueError)"""
+        data = data or {}
+        if not isinstance(data, dict):
+            raise ValueError('filter must be an object')
+        unknown = set(data) - {'status', 'folder', 'ids'}
+        if unknown:
+            raise ValueError(f"Unknown filter keys: {', '.join(sorted(unknown))}")
+
+        statuses = data.get('status')
+        if isinstance(statuses, str):
+            statuses = [statuses]
+        if statuses is not None:
+            if not isinstance(statuses, list) or any(s not in cls.STATUSES for s in statuses):
+                raise ValueError(f"status must be one or more of: {', '.join(cls.STATUSES)}")
+
+        folder = data.get('folder')
+        if folder is not None and not isinstance(folder, str):
+            raise ValueError('folder must be a string')
+
+        ids = data.get('ids')
+        if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, str) for i in ids)):
+            raise ValueError('ids must be a list of download IDs')
+
+        return cls(statuses, folder, ids)
+
+    def key(self) -> str:
+        """Identical filters share one key (and one filtered result per tick)"""
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    def to_dict(self) -> Dict:
+        result = {}
+        if self.statuses is not None:
+            result['status'] = sorted(self.statuses)
+        if self.folder is not None:
+            result['folder'] = self.folder
+        if self.ids is not None:
+            result['ids'] = sorted(self.ids)
+        return result
+
+    def matches(self, download) -> bool:
+        if self.ids is not None and download.id not in self.ids:
+            return False
+        if self.statuses is not None and download.status not in self.statuses:
+            return False
+        if self.folder is not None and self.folder:
+            folder = download.folder.replace('\\', '/').strip('/')
+            if folder != self.folder and not folder.startswith(self.folder + '/'):
+                return False
+        return True
+
+
+class Subscription:
+    """One client's filtered view, sent every interval seconds"""
+
+    def __init__(self, subscription_id: str, download_filter: DownloadFilter, interval: float):
+        self.id = subscription_id
+        self.filter = download_filter
+        self.interval = interval
+        self.next_due = 0.0
+
+    def to_dict(self) -> Dict:
+        return {'id': self.id, 'filter': self.filter.to_dict(), 'interval': self.interval}
+
+
+class SubscriptionRegistry:
+    """Subscriptions of all connected WebSocket clients
+
+    Clients without subscriptions keep getting the full status message every
+    second. The broadcaster ticks every MIN_INTERVAL; on each tick it takes the
+    subscriptions that are due, evaluates each distinct filter once and
+    encodes its result once per subscription id and wire encoding, and every
+    client with that filter gets the same payload.
+    """
+
+    MIN_INTERVAL = 0.25
+    MAX_INTERVAL = 60.0
+    DEFAULT_INTERVAL = 1.0
+
+    # Per client, to bound the work one connection can ask for
+    MAX_SUBSCRIPTIONS = 16
+
+    def __init__(self):
+        self.clients: Dict[object, Dict[str, Subscription]] = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, client, subscription_id: str, download_filter: DownloadFilter,
+                  interval: Optional[float] = None) -> Subscription:
+        if interval is None:
+            interval = self.DEFAULT_INTERVAL
+        interval = min(self.MAX_INTERVAL, max(self.MIN_INTERVAL, float(interval)))
+        subscription = Subscription(subscription_id, download_filter, interval)
+
+        with self.lock:
+            subscriptions = self.clients.setdefault(client, {})
+            if subscription_id not in subscriptions and len(subscriptions) >= self.MAX_SUBSCRIPTIONS:
+                raise ValueError(f"At most {self.MAX_SUBSCRIPTIONS} subscriptions per connection")
+            # Replacing an id keeps the schedule: the first update comes from the subscribe reply
+            subscription.next_due = time.monotonic() + interval
+            subscriptions[subscription_id] = subscription
+        return subscription
+
+    def unsubscribe(self, client, subscription_id: str) -> bool:
+        with self.lock:
+            subscriptions = self.clients.get(client)
+            if not subscriptions or subscriptions.pop(subscription_id, None) is None:
+                return False
+            if not subscriptions:
+                del self.clients[client]
+            return True
+
+    def remove_client(self, client):
+        with self.lock:
+            self.clients.pop(client, None)
+
+    def has_subscriptions(self, client) -> bool:
+        return client in self.clients
+
+    def take_due(self, now: float) -> List[Tuple[object, Subscription]]:
+        """Subscriptions to send this tick (their next send is scheduled)"""
+        due = []
+        with self.lock:
+            for client, subscriptions in self.clients.items():
+                for subscription in subscriptions.values():
+                    if now >= subscription.next_due:
+                        # Keep the cadence, but never queue up missed ticks
+                        subscription.next_due = max(subscription.next_due + subscription.interval,
+                                                    now + subscription.interval / 2)
+                        due.append((client, subscription))
+        return due
+
+
+def status_counts(downloads) -> Dict[str, int]:
+    counts = {}
+    for download in downloads:
+        counts[download.status] = counts.get(download.status, 0) + 1
+    return counts
+
+
+def filtered_status(downloads, download_filter: DownloadFilter, counts: Dict[str, int],
+                    global_paused: bool, progress_cache: Dict[str, Dict]) -> Dict:
+    """Filtered status message (without subscription id)"""
+    items = []
+    for download in downloads:
+        if download_filter.matches(download):
+            progress = progress_cache.get(download.id)
+            if progress is None:
+                progress = progress_cache[download.id] = download.get_progress()
+            items.append(progress)
+    return {
+        'type': 'status',
+        'downloads': items,
+        'counts': counts,
+        'global_paused': global_paused
+    }